@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+
+def load(path: str) -> dict[tuple[str, int, int], dict]:
+    '''
+    Load the benchmarks of a results file, keyed by (name, size, upper bound).
+    '''
+    with open(path) as file:
+        results = json.load(file)
+    return {(b['name'], b['size'], b['upper_bound']): b for b in results['benchmarks']}
+
+if __name__ == '__main__':
+
+    # arguments
+    parser = argparse.ArgumentParser(description='Compare two benchmark results files (see `suite.py`).')
+    parser.add_argument('baseline', help='path to the baseline results')
+    parser.add_argument('candidate', help='path to the new results')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown that counts as a regression')
+    parser.add_argument('--metric', default='min_ms', choices=['min_ms', 'mean_ms'], help='the timing to compare')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+
+    # compare the benchmarks that are in both files
+    regressions = 0
+    print(f'{"benchmark":>40} {"size":>10} {"n":>3} {"baseline (ms)":>14} {"candidate (ms)":>15} {"ratio":>7}')
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key][args.metric], candidate[key][args.metric]
+        ratio = new / old if old > 0 else float('inf')
+        regression = ratio > 1 + args.threshold
+        regressions += regression
+        name, size, upper_bound = key
+        print(f'{name:>40} {f"{size}x{size}x{size}":>10} {upper_bound:>3} {old:>14.3f} {new:>15.3f} {ratio:>6.2f}x' + (' REGRESSION' if regression else ''))
+
+    # report the benchmarks that are only in one file
+    for key in sorted(baseline.keys() - candidate.keys()):
+        print(f'missing in candidate: {key}')
+    for key in sorted(candidate.keys() - baseline.keys()):
+        print(f'new in candidate: {key}')
+
+    # exit with an error if there are regressions (e.g. to fail a CI job)
+    print(f'{regressions} regression(s) with a threshold of {args.threshold:.0%}')
+    sys.exit(1 if regressions > 0 else 0)
@@ -0,0 +1,94 @@
+from src.environment import Container
+from src.environment import ShapeGenerator
+import numpy as np
+import time
+
+def reference_fits(container: Container, polycube, position: tuple[int, int, int]) -> bool:
+    '''
+    The original implementation of `Container.fits` (a masked overlap check, then the constraints are checked by
+    adding the polycube to the matrix and subtracting it again).
+    '''
+
+    # check if the polycube fits in the container
+    shape_width, shape_height, shape_depth = polycube.matrix.shape
+    if position[0] + shape_width > container.width:
+        return False
+    if position[1] + shape_height > container.height:
+        return False
+    if position[2] + shape_depth > container.depth:
+        return False
+    region = (slice(position[0], position[0] + shape_width),
+              slice(position[1], position[1] + shape_height),
+              slice(position[2], position[2] + shape_depth))
+
+    # check for overlap
+    mx = np.ma.masked_array(container.matrix[region], mask=(polycube.matrix == 0))
+    if np.any(mx):
+        return False
+
+    # check the constraints with the polycube added to the container
+    container.matrix[region] += polycube.matrix
+    satisfied = all(constraint.is_satisfied(container.matrix) for constraint in container.constraints)
+    container.matrix[region] -= polycube.matrix
+    return satisfied
+
+def reference_feasible_mask(container: Container, polycube) -> np.ndarray:
+    '''
+    The original implementation of `Container.get_feasible_mask` (one `fits` call per cell).
+    '''
+    mask = np.full(container.get_dimensions(), False, dtype=bool)
+    for x in range(container.width):
+        for y in range(container.height):
+            for z in range(container.depth):
+                if reference_fits(container, polycube, (x, y, z)):
+                    mask[x, y, z] = True
+    return mask
+
+def fill_container(container: Container, generator: ShapeGenerator, rng: np.random.Generator, fill: float, height: int=None):
+    '''
+    Randomly place polycubes in the container until the given fill ratio is reached
+    (below the given height if any, as in a container that is packed bottom-up).
+    '''
+    container.reset()
+    volume = np.prod(container.get_dimensions())
+    bounds = list(container.get_dimensions())
+    if height is not None:
+        bounds[1] = height
+    for _ in range(1000):
+        if np.count_nonzero(container.matrix) >= fill * volume:
+            break
+        polycube = generator.get_random_polycube(rng=rng)
+        position = [rng.integers(0, d) for d in bounds]
+        container.add(polycube, (position[0], position[1], position[2]))
+
+def time_call(f, repeats: int) -> float:
+    '''
+    Get the mean wall time of a call in milliseconds.
+    '''
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start_time) / repeats * 1e3
+
+if __name__ == '__main__':
+
+    # variables
+    sizes = range(3, 11) # container sizes (size x size x size)
+    upper_bound = 5 # upper bound for the size of the polycubes
+    fill = 0.3 # fill ratio of the container before measuring
+    repeats = 3 # number of timed calls per measurement
+    cache_path = 'resources/polycubes'
+
+    generator = ShapeGenerator(upper_bound, cache_path)
+    rng = np.random.default_rng(42)
+
+    print(f'{"size":>8} {"reference (ms)":>16} {"vectorized (ms)":>16} {"speedup":>8}')
+    for size in sizes:
+        container = Container(size, size, size)
+        fill_container(container, generator, rng, fill)
+        rotations = generator.get_random_polycube(rng=rng).get_rotations()
+
+        # time all rotations of the polycube, as in `PackingEnv.find_feasible_positions`
+        reference = time_call(lambda c=container, rs=rotations: [reference_feasible_mask(c, r) for r in rs], repeats)
+        vectorized = time_call(lambda c=container, rs=rotations: [c.get_feasible_mask(r) for r in rs], repeats)
+        print(f'{f"{size}x{size}x{size}":>8} {reference:>16.3f} {vectorized:>16.3f} {reference / vectorized:>7.1f}x')
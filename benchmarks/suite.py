@@ -0,0 +1,142 @@
+from src.environment import Container
+from src.environment import ShapeGenerator
+from src.environment import PackingEnv
+from src.environment.shapes import Polycube
+from src.constraints import Gravity
+from src.heuristics import *
+from benchmarks.feasible_mask import fill_container
+import numpy as np
+import subprocess
+import copy
+import argparse
+import platform
+import json
+import time
+
+def measure(f, repeats: int, setup=None) -> dict[str, float]:
+    '''
+    Get the wall time statistics of a call in milliseconds (`setup` is called before every call, and not timed).
+    '''
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start_time = time.perf_counter()
+        f()
+        times.append((time.perf_counter() - start_time) * 1e3)
+    return {'mean_ms': float(np.mean(times)), 'min_ms': float(np.min(times)), 'repeats': repeats}
+
+def get_commit() -> str:
+    '''
+    Get the current git commit (or `None` outside of a git repository).
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(size: int, generator: ShapeGenerator, rng: np.random.Generator, fill: float, repeats: int) -> dict[str, dict]:
+    '''
+    Time the hot paths of the packing environment for a single container size and polycube upper bound.
+    '''
+    results = {}
+
+    # a partially filled container and a random polycube
+    container = Container(size, size, size)
+    fill_container(container, generator, rng, fill)
+    polycube = generator.get_random_polycube(rng=rng)
+    rotations = polycube.get_rotations()
+    positions = np.argwhere(np.array([container.get_feasible_mask(r) for r in rotations]))
+
+    # container (`fits` is timed for 100 random candidates)
+    candidates = [(r, (x, y, z)) for r, x, y, z in rng.integers(0, [len(rotations), size, size, size], (100, 4))]
+    results['container.fits'] = measure(lambda: [container.fits(rotations[r], p) for r, p in candidates], repeats)
+    results['container.get_feasible_mask'] = measure(lambda: [container.get_feasible_mask(r) for r in rotations], repeats)
+
+    # the feasible mask of a container that is packed bottom-up (a quarter of its height), with the candidate regions
+    # of the coarse occupancy index and with a full scan of all positions (a single region)
+    packed = Container(size, size, size)
+    fill_container(packed, generator, rng, fill / 4, height=max(size // 4, 1))
+    unpruned = copy.copy(packed)
+    unpruned.get_candidate_regions = lambda shape: [([0, 0, 0], [d - s + 1 for d, s in zip(packed.get_dimensions(), shape)])]
+    results['container.compute_feasible_mask[packed]'] = \
+        measure(lambda: [packed.compute_feasible_mask(r) for r in rotations], repeats)
+    results['container.compute_feasible_mask[packed,unpruned]'] = \
+        measure(lambda: [unpruned.compute_feasible_mask(r) for r in rotations], repeats)
+
+    # rotations (computed from the matrix, without the precomputed rotation table)
+    matrix = polycube.matrix.copy()
+    results['polycube.get_rotations'] = measure(lambda: Polycube(matrix).get_rotations(), repeats)
+
+    # heuristics (one placement with `get_score`, all feasible placements with `get_scores`)
+    if len(positions) > 0:
+        r, x, y, z = positions[0]
+        dummy = container.get_dummy_container(rotations[r], (x, y, z))
+        for heuristic in [BLBF(), HAPE(), HeightMapMinimization()]:
+            name = type(heuristic).__name__
+            results[f'{name}.get_score'] = measure(lambda h=heuristic: h.get_score(dummy), repeats)
+            results[f'{name}.get_scores'] = measure(lambda h=heuristic: h.get_scores(container, rotations, positions), repeats)
+
+    # gravity (applied to a copy of the unsettled container)
+    for connected in [True, False]:
+        gravity = Gravity(connected=connected)
+        results[f'gravity.apply[connected={connected}]'] = measure(lambda g=gravity: g.apply(container.matrix.copy()), repeats)
+
+    # environment
+    env = PackingEnv(Container(size, size, size), upper_bound=generator.upper_bound, generator=generator)
+    env.reset(seed=0)
+    def get_mask(f):
+        env.mask_cached = False # time the computation, not the cached mask
+        f()
+    results['env.action_masks'] = measure(lambda: get_mask(env.action_masks), repeats)
+    env.set_heuristics([BLBF(), HAPE()], 50)
+    results['env.get_heuristic_mask'] = measure(lambda: get_mask(env.get_heuristic_mask), repeats)
+    env.set_heuristics(None, None)
+
+    # (the episodes that end are reset outside of the timed steps, and the resets are timed separately)
+    def reset_if_terminal():
+        if env.is_terminal():
+            env.reset()
+    def step():
+        r, x, y, z = env.np_random.choice(env.feasible_positions)
+        env.step(env.encode_action(r, (x, y, z)))
+    results['env.step'] = measure(step, repeats, setup=reset_if_terminal)
+    results['env.reset'] = measure(env.reset, repeats)
+    return results
+
+if __name__ == '__main__':
+
+    # arguments
+    parser = argparse.ArgumentParser(description='Time the hot paths of the packing environment.')
+    parser.add_argument('--output', default='benchmark.json', help='path to the results file')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(range(3, 11)), help='container sizes (size x size x size)')
+    parser.add_argument('--upper-bounds', type=int, nargs='+', default=list(range(3, 11)), help='upper bounds for the size of the polycubes')
+    parser.add_argument('--fill', type=float, default=0.3, help='fill ratio of the container before measuring')
+    parser.add_argument('--repeats', type=int, default=20, help='number of timed calls per measurement')
+    parser.add_argument('--cache-path', default='resources/polycubes', help='path to the cache of polycubes')
+    args = parser.parse_args()
+
+    # run the benchmarks for every combination of size and upper bound (polycubes cannot be larger than the container)
+    benchmarks = []
+    for upper_bound in args.upper_bounds:
+        generator = ShapeGenerator(upper_bound, args.cache_path)
+        for size in args.sizes:
+            if upper_bound > size:
+                continue
+            rng = np.random.default_rng(42)
+            results = run_benchmarks(size, generator, rng, args.fill, args.repeats)
+            for name, result in results.items():
+                benchmarks.append({'name': name, 'size': size, 'upper_bound': upper_bound, **result})
+                print(f'{name:>40} {f"{size}x{size}x{size}":>10} n={upper_bound:<3} {result["min_ms"]:>10.3f} ms')
+
+    # save the results
+    with open(args.output, 'w') as file:
+        json.dump({
+            'commit': get_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'fill': args.fill,
+            'benchmarks': benchmarks
+        }, file, indent=2)
@@ -0,0 +1,34 @@
+from src.environment import PackingEnv
+from src.environment import Container
+from src.agents import GreedyAgent, PPOAgent, RandomAgent
+from src.heuristics import *
+from src.evaluation import evaluate
+from sb3_contrib import MaskablePPO
+import torch
+
+# the environment and agents are created in every worker process, so they are defined as module-level functions
+def create_env() -> PackingEnv:
+    return PackingEnv(Container(3, 3, 3), upper_bound=3, seq_length=10)
+
+def create_greedy() -> GreedyAgent:
+    return GreedyAgent(heuristics=[BLBF(), HeightMapMinimization()])
+
+def create_ppo() -> PPOAgent:
+    torch.set_num_threads(1) # one thread per worker process
+    return PPOAgent(MaskablePPO.load('resources/models/without_heuristics/3x3x3.zip', device='cpu'))
+
+if __name__ == '__main__':
+
+    # variables
+    seeds = list(range(10000)) # seeds of the episodes to evaluate
+    path = '3x3x3-results.csv' # results file (running again with the same file resumes the evaluation)
+    workers = None # number of worker processes (None to use all CPUs)
+
+    # evaluate the agents
+    evaluate(
+        create_env,
+        {'greedy': create_greedy, 'random': RandomAgent, 'ppo-o': create_ppo},
+        seeds,
+        path,
+        workers=workers
+    )
@@ -5,3 +5,5 @@ from src.agents.agent import Agent
 from src.agents.greedy_agent import GreedyAgent
 from src.agents.ppo_agent import PPOAgent
 from src.agents.random_agent import RandomAgent
+from src.agents.mcts_agent import MCTSAgent
+from src.agents.beam_search_agent import BeamSearchAgent
@@ -0,0 +1,131 @@
+from src.agents import Agent
+from overrides import override
+from src.heuristics import Heuristic
+from src.heuristics.heuristic import get_weighted_scores
+from src.environment.container import get_stacked_feasible_positions
+import numpy as np
+import time
+
+class BeamSearchAgent(Agent):
+
+    def __init__(
+            self,
+            heuristics: list[Heuristic],
+            weights: list[float]=None,
+            beam_width: int=8,
+            lookahead: int=3,
+            time_limit: float=1000
+        ):
+        '''
+        Create an agent that packs using a beam search over the known upcoming polycubes.
+        The search keeps the `beam_width` best partial packings (the sum of the heuristic scores of their placements)
+        for every polycube in the lookahead window, and chooses the first placement of the best packing.
+
+        Parameters
+        ----------
+            `heuristics` : `list[Heuristic]`
+                the heuristics to score the placements with.
+            `weights` : `list[float]`, optional
+                the weights to use for the heuristics (if not provided, the weights will be equal).
+            `beam_width` : int, optional
+                the number of partial packings that are kept.
+            `lookahead` : int, optional
+                the number of polycubes (including the current one) that are searched.
+            `time_limit` : float, optional
+                the time limit per polycube in milliseconds (`None` for no limit). The deadline is checked for every
+                polycube in the lookahead window and while the placements are scored, as scoring can take long (e.g. with
+                constraints that move cubes). A polycube that is not finished at the deadline is dropped from the search,
+                except for the current polycube, of which only the placements that were scored are considered.
+        '''
+        self.heuristics = heuristics
+        self.weights = weights
+        self.beam_width = beam_width
+        self.lookahead = lookahead
+        self.time_limit = time_limit
+
+    def get_scores(self, containers: list, rotations: list, positions: np.ndarray, deadline: float=None) -> np.ndarray:
+        '''
+        Get the (weighted) average heuristic score of many placements in the packings of the beam at once.
+        If a deadline is given, the placements are only scored until the deadline (see `get_weighted_scores`),
+        and the placements that were not scored get NaN (a first part is always scored).
+
+        Parameters
+        ----------
+            `containers` : `list[Container]`
+                the containers of the packings to place the polycube in.
+            `rotations` : `list[Polycube]`
+                all rotations of the polycube.
+            `positions` : `np.ndarray`
+                the feasible placements (format: c, r, x, y, z, with c the index of the container).
+            `deadline` : float, optional
+                the time (see `time.perf_counter`) at which the scoring stops.
+
+        Returns
+        -------
+            `np.ndarray` : the score of every placement.
+        '''
+        return get_weighted_scores(self.heuristics, self.weights, containers, rotations, positions, deadline)
+
+    @override
+    def get_action(self, env) -> int:
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit / 1e3
+
+        # get current polycube id
+        id = env.get_current_polycube().id
+
+        # get the rotations of the current and upcoming polycubes
+        polycubes = [p.get_rotations() for p in env.get_upcoming_polycubes(self.lookahead)]
+
+        # get the allowed placements of the current polycube from the action mask (format: c, r, x, y, z)
+        positions = np.column_stack(np.unravel_index(np.flatnonzero(env.action_masks()), env.action_space_nvec))
+        print(f'found {len(positions)} feasible positions for polycube {id}')
+        positions = np.column_stack((np.zeros(len(positions), dtype=np.int64), positions))
+
+        # the beam holds the containers of the partial packings, the first placement and the total score of every packing
+        containers = [env.container]
+        first = np.zeros((1, 4), dtype=np.int64)
+        totals = np.zeros(1)
+        searched = 0
+
+        for depth, rotations in enumerate(polycubes):
+            # find the placements in all packings at once (the current polycube is restricted to the action mask)
+            if depth > 0:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                positions = get_stacked_feasible_positions(containers, [rotations] * len(containers))
+
+            # the search ends when none of the packings can place the polycube
+            if len(positions) == 0:
+                break
+
+            # score the placements in all packings at once (only the current polycube can be scored in part,
+            # an upcoming polycube that is not scored before the deadline is dropped and the previous beam is kept)
+            scores = self.get_scores(containers, rotations, positions, deadline)
+            scored = ~np.isnan(scores)
+            if depth > 0 and not np.all(scored):
+                break
+            positions = positions[scored]
+            scores = totals[positions[:, 0]] + scores[scored]
+
+            # keep the best placements over all packings, and add them to (copy-on-write) snapshots of their packing
+            best = np.argsort(-scores, kind='stable')[:self.beam_width]
+            children = []
+            for c, r, x, y, z in positions[best]:
+                container = containers[c].snapshot()
+                container.add(rotations[r], (x, y, z))
+                children.append(container)
+            containers = children
+            first = positions[best, 1:] if depth == 0 else first[positions[best, 0]]
+            totals = scores[best]
+            searched += 1
+
+            # stop searching further polycubes when the time limit is exceeded
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        # get the first placement of the best packing
+        r, x, y, z = first[np.argmax(totals)]
+        print(f'adding polycube {id} at position {x, y, z} with a score of {np.max(totals)} after {searched} polycubes')
+
+        # return the action
+        return env.encode_action(r, (x, y, z))
@@ -36,9 +36,8 @@ class GreedyAgent(Agent):
         scores = np.zeros((len(self.heuristics), len(feasible_positions)))
 
         # get the scores for every feasible position
-        for j, (r, x, y, z) in enumerate(feasible_positions):
-            for i, h in enumerate(self.heuristics):
-                scores[i, j] = h.get_score(env.container.get_dummy_container(rotations[r], (x, y, z)))
+        for i, h in enumerate(self.heuristics):
+            scores[i] = h.get_scores(env.container, rotations, feasible_positions)
         
         # average the scores
         avg_scores = np.average(scores, axis=0, weights=self.weights)
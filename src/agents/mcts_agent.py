@@ -0,0 +1,470 @@
+from src.agents import Agent
+from overrides import override
+from concurrent import futures
+from sb3_contrib import MaskablePPO
+from src.heuristics import Heuristic
+from src.heuristics.heuristic import get_weighted_scores
+from src.environment import Container
+import numpy as np
+import threading
+import copy
+import time
+import os
+
+# the container of a worker (one per thread, and kept between searches, see `_search`)
+_worker = threading.local()
+
+# the fraction of the search time that can be spent on the priors of the current polycube (see `MCTSAgent.get_action`)
+PRIOR_TIME_FRACTION = 0.5
+
+class Node:
+
+    __slots__ = ('positions', 'priors', 'visits', 'values', 'children')
+
+    def __init__(self, positions: np.ndarray, priors: np.ndarray):
+        '''
+        Create a node of the search tree, with the statistics of its actions.
+
+        Parameters
+        ----------
+            `positions` : `np.ndarray`
+                the feasible placements of the polycube in this state (format: r, x, y, z).
+            `priors` : `np.ndarray`
+                the prior probability of every placement.
+        '''
+        self.positions = positions
+        self.priors = priors
+        self.visits = np.zeros(len(positions), dtype=np.int64)
+        self.values = np.zeros(len(positions), dtype=float)
+        self.children = {}
+
+    def select(self, exploration: float) -> int:
+        '''
+        Select the placement to explore (PUCT), unvisited placements only get the exploration term.
+
+        Parameters
+        ----------
+            `exploration` : float
+                the weight of the exploration term.
+
+        Returns
+        -------
+            int : the index of the placement.
+        '''
+        q = self.values / np.maximum(self.visits, 1)
+        u = exploration * self.priors * np.sqrt(self.visits.sum() + 1) / (1 + self.visits)
+        return int(np.argmax(q + u))
+
+def get_priors(
+        container,
+        rotations: list,
+        positions: np.ndarray,
+        heuristics: list[Heuristic],
+        weights: list[float],
+        temperature: float,
+        deadline: float=None
+    ) -> np.ndarray:
+    '''
+    Get the prior probability of the placements of a polycube, as the softmax of the average heuristic scores
+    (uniform without heuristics).
+    If a deadline is given, the placements are only scored until the deadline (see `get_weighted_scores`).
+    The placements that were not scored get a prior of 0.
+
+    Parameters
+    ----------
+        `container` : `Container`
+            the container to place the polycube in.
+        `rotations` : `list[Polycube]`
+            all rotations of the polycube.
+        `positions` : `np.ndarray`
+            the feasible placements (format: r, x, y, z).
+        `heuristics` : `list[Heuristic]`
+            the heuristics to score the placements with.
+        `weights` : `list[float]`
+            the weights of the heuristics.
+        `temperature` : float
+            the temperature of the softmax (lower is greedier).
+        `deadline` : float, optional
+            the time (see `time.perf_counter`) at which the scoring stops.
+
+    Returns
+    -------
+        `np.ndarray` : the prior probability of every placement.
+    '''
+    uniform = np.full(len(positions), 1 / max(len(positions), 1))
+    if not heuristics or len(positions) == 0:
+        return uniform
+
+    # the softmax over the scored placements
+    scores = get_weighted_scores(heuristics, weights, container, rotations, positions, deadline)
+    scored = ~np.isnan(scores)
+    priors = np.zeros(len(positions))
+    priors[scored] = np.exp((scores[scored] - np.max(scores[scored])) / temperature)
+    return priors / priors.sum()
+
+def expand(container, rotations: list, deadline: float, settings: dict, timeout: bool=True) -> Node:
+    '''
+    Create the node of a state, with the best placements (according to their priors) of the polycube.
+    The deadline is checked between the rotations and after the priors, as both can be slow (e.g. with constraints).
+
+    Parameters
+    ----------
+        `container` : `Container`
+            the container in this state.
+        `rotations` : `list[Polycube]`
+            all rotations of the polycube to place.
+        `deadline` : float
+            the time (see `time.perf_counter`) at which the search stops.
+        `settings` : dict
+            the settings of the search (see `MCTSAgent`).
+        `timeout` : bool, optional
+            whether to stop at the deadline (otherwise the node is always created, of which the priors are still only
+            scored until the deadline, see `get_priors`).
+
+    Returns
+    -------
+        `Node` : the node of the state.
+
+    Raises
+    ------
+        `TimeoutError` : if the deadline passed before the node was created.
+    '''
+    masks = []
+    for rotation in rotations:
+        if timeout and time.perf_counter() >= deadline:
+            raise TimeoutError('the search passed its deadline.')
+        masks.append(container.get_feasible_mask(rotation))
+    positions = np.argwhere(np.array(masks))
+    priors = get_priors(container, rotations, positions, settings['heuristics'], settings['weights'], settings['temperature'], deadline)
+    if timeout and time.perf_counter() >= deadline:
+        raise TimeoutError('the search passed its deadline.')
+    best = np.argsort(-priors, kind='stable')[:settings['max_actions']]
+    return Node(positions[best], priors[best] / priors[best].sum() if len(best) > 0 else priors[best])
+
+def search(
+        container,
+        polycubes: list[list],
+        positions: np.ndarray,
+        priors: np.ndarray,
+        deadline: float,
+        seed: int,
+        settings: dict
+    ) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Run a Monte Carlo tree search from the current state until the deadline.
+    The deadline is also checked while new states are expanded, in which case the unfinished simulation is discarded.
+    The first simulation always finishes (after the deadline, its expansions only score the first placements),
+    so a search is never left with only the priors.
+    The placements are made in the container with `push` and undone with `pop`, so the container is unchanged afterwards.
+    The value of a simulation is the fraction of the cubes of the (known) upcoming polycubes that could be placed.
+
+    Parameters
+    ----------
+        `container` : `Container`
+            the container in the current state (modified during the search, e.g. a snapshot).
+        `polycubes` : `list[list[Polycube]]`
+            the rotations of the current polycube and the upcoming polycubes.
+        `positions` : `np.ndarray`
+            the placements of the current polycube to choose from (format: r, x, y, z).
+        `priors` : `np.ndarray`
+            the prior probability of every placement of the current polycube.
+        `deadline` : float
+            the time (see `time.perf_counter`) at which the search stops.
+        `seed` : int
+            the seed of the random number generator of the rollouts.
+        `settings` : dict
+            the settings of the search (see `MCTSAgent`).
+
+    Returns
+    -------
+        `tuple[np.ndarray, np.ndarray]` : the number of visits and the sum of the values of every placement.
+    '''
+
+    # the placements can change the ids of the polycubes, so the search uses its own copies
+    polycubes = copy.deepcopy(polycubes)
+    rng = np.random.default_rng(seed)
+    root = Node(positions, priors)
+
+    # the value is the fraction of the cubes that are placed within the horizon
+    horizon = len(polycubes)
+    sizes = np.array([len(rotations[0].get_cubes()) for rotations in polycubes])
+    total = sizes.sum()
+
+    simulations = 0
+    while (simulations == 0 or time.perf_counter() < deadline) and len(root.positions) > 0:
+        # select the placements until a new state is reached
+        path = []
+        node = root
+        placed = 0
+        try:
+            while True:
+                i = node.select(settings['exploration'])
+                r, x, y, z = node.positions[i]
+                container.push(polycubes[len(path)][r], (x, y, z))
+                placed += sizes[len(path)]
+                path.append((node, i))
+                if len(path) == horizon:
+                    break
+
+                # expand the new state and run a rollout from it
+                child = node.children.get(i)
+                if child is None:
+                    child = expand(container, polycubes[len(path)], deadline, settings, simulations > 0)
+                    node.children[i] = child
+                    start = len(path)
+                    for depth in range(start, min(horizon, start + settings['rollout_depth'])):
+                        rollout = child if depth == start else \
+                            expand(container, polycubes[depth], deadline, settings, simulations > 0)
+                        if len(rollout.positions) == 0:
+                            break
+                        r, x, y, z = rollout.positions[rng.choice(len(rollout.positions), p=rollout.priors)]
+                        container.push(polycubes[depth][r], (x, y, z))
+                        placed += sizes[depth]
+                        path.append((None, None))
+                    break
+
+                # a state without feasible placements is terminal
+                node = child
+                if len(node.positions) == 0:
+                    break
+        except TimeoutError:
+            # discard the unfinished simulation
+            for _ in path:
+                container.pop()
+            break
+
+        # update the statistics of the selected placements and undo all placements
+        value = placed / total
+        for node, i in path:
+            if node is not None:
+                node.visits[i] += 1
+                node.values[i] += value
+            container.pop()
+        simulations += 1
+
+    return root.visits, root.values
+
+def get_container_spec(container: Container) -> tuple:
+    '''
+    Get the arguments to create an empty container like the given one in a worker (see `_search`).
+
+    Parameters
+    ----------
+        `container` : `Container`
+            the container.
+
+    Returns
+    -------
+        tuple : the dimensions, the constraints, the data type of the matrix and the size of the mask cache.
+    '''
+    cache_size = container.mask_cache.size if container.mask_cache is not None else 0
+    return container.get_dimensions(), container.constraints, container.matrix.dtype, cache_size
+
+def _search(task: tuple) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Run a search in a worker (see `search`).
+    Only the matrix of the container is sent to the worker, which loads it into its own container.
+    The container (and its mask cache) is kept between searches, the mask cache is cleared when the constraints change.
+    '''
+    (dimensions, constraints, dtype, cache_size), matrix, *args = task
+    container = getattr(_worker, 'container', None)
+    if container is None or container.get_dimensions() != dimensions or container.matrix.dtype != dtype or \
+            (container.mask_cache.size if container.mask_cache is not None else 0) != cache_size:
+        container = _worker.container = Container(*dimensions, dtype=dtype, cache_size=cache_size)
+
+    # the constraints are sent with every task, so they are compared by their settings
+    settings = [(type(constraint), vars(constraint)) for constraint in constraints]
+    if settings != getattr(_worker, 'constraints', None) and container.mask_cache is not None:
+        container.mask_cache.clear()
+    _worker.constraints = settings
+    container.constraints = constraints
+    container.load_matrix(matrix)
+    return search(container, *args)
+
+class MCTSAgent(Agent):
+
+    def __init__(
+            self,
+            heuristics: list[Heuristic]=None,
+            weights: list[float]=None,
+            model: MaskablePPO=None,
+            time_limit: float=100,
+            workers: int=None,
+            processes: bool=True,
+            lookahead: int=5,
+            rollout_depth: int=3,
+            max_actions: int=32,
+            exploration: float=1.0,
+            temperature: float=0.05,
+            margin: float=5,
+            seed: int=None
+        ):
+        '''
+        Create an agent that packs using Monte Carlo tree search over the known upcoming polycubes.
+        The placements are restricted to the feasible ones (`PackingEnv.action_masks` for the current polycube), and
+        guided by priors from the heuristics or from a trained `MaskablePPO` policy (for the current polycube).
+        Every worker runs an independent search from the current state until the deadline (root parallelization),
+        after which the visits of all workers are combined. The workers only receive the matrix of the container,
+        which they load into a container that is kept between polycubes (see `Container.load_matrix`). The time limit
+        includes the priors of the current polycube, which are scored for at most half of the search time (slow
+        heuristics, e.g. with constraints that move cubes, only score part of the placements, see `get_priors`).
+        The searches also check the deadline while they expand new states, so a slow expansion does not overrun it,
+        except in the first simulation of every search: an action is never chosen without a simulation, which can
+        overrun the time limit when a single simulation takes longer (the number of simulations is reported).
+
+        Parameters
+        ----------
+            `heuristics` : `list[Heuristic]`, optional
+                the heuristics to compute the priors with (if not provided, the priors are uniform).
+            `weights` : `list[float]`, optional
+                the weights to use for the heuristics (if not provided, the weights will be equal).
+            `model` : `MaskablePPO`, optional
+                a trained model whose policy gives the priors of the current polycube (instead of the heuristics).
+            `time_limit` : float, optional
+                the time limit per polycube in milliseconds.
+            `workers` : int, optional
+                the number of parallel searches (if not provided, the number of CPUs minus one, which is kept
+                for the current process to collect the results on time). With a single worker the search runs in the current process.
+            `processes` : bool, optional
+                whether the searches run in a pool of processes (otherwise threads, which share the GIL).
+            `lookahead` : int, optional
+                the number of polycubes (including the current one) that are searched.
+            `rollout_depth` : int, optional
+                the number of random placements (sampled from the priors) after a new state is expanded.
+            `max_actions` : int, optional
+                the maximum number of placements (with the highest priors) that are searched in every state.
+            `exploration` : float, optional
+                the weight of the exploration term (PUCT).
+            `temperature` : float, optional
+                the temperature of the softmax over the heuristic scores.
+            `margin` : float, optional
+                the time in milliseconds that is kept at the end of the time limit to return the action, and again before
+                that to combine the results of the workers (the searches stop two margins before the time limit).
+            `seed` : int, optional
+                the seed of the random number generator of the rollouts.
+        '''
+        self.model = model
+        self.time_limit = time_limit
+        self.workers = max(os.cpu_count() - 1, 1) if workers is None else workers
+        self.processes = processes
+        self.lookahead = lookahead
+        self.margin = margin
+        self.settings = {
+            'heuristics': heuristics,
+            'weights': weights,
+            'rollout_depth': rollout_depth,
+            'max_actions': max_actions,
+            'exploration': exploration,
+            'temperature': temperature
+        }
+        self.rng = np.random.default_rng(seed)
+        self.executor = None
+
+    def get_executor(self) -> futures.Executor:
+        '''
+        Get the pool of workers (created the first time it is needed, and kept until `close`).
+
+        Returns
+        -------
+            `futures.Executor` : the pool of workers.
+        '''
+        if self.executor is None:
+            if self.processes:
+                self.executor = futures.ProcessPoolExecutor(self.workers)
+            else:
+                self.executor = futures.ThreadPoolExecutor(self.workers)
+        return self.executor
+
+    def close(self):
+        '''
+        Shut down the pool of workers.
+        '''
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def get_root_priors(self, env, positions: np.ndarray, rotations: list, deadline: float) -> np.ndarray:
+        '''
+        Get the prior probability of the placements of the current polycube.
+        The heuristics only score the placements until the deadline (see `get_priors`).
+
+        Parameters
+        ----------
+            `env` : `PackingEnv`
+                the environment.
+            `positions` : `np.ndarray`
+                the placements of the current polycube (format: r, x, y, z).
+            `rotations` : `list[Polycube]`
+                all rotations of the current polycube.
+            `deadline` : float
+                the time (see `time.perf_counter`) at which the scoring stops.
+
+        Returns
+        -------
+            `np.ndarray` : the prior probability of every placement.
+        '''
+        if self.model is None:
+            return get_priors(env.container, rotations, positions, self.settings['heuristics'],
+                              self.settings['weights'], self.settings['temperature'], deadline)
+
+        # get the probabilities of the (masked) policy
+        policy = self.model.policy
+        obs, _ = policy.obs_to_tensor(env._get_obs_cache())
+        distribution = policy.get_distribution(obs, action_masks=np.array(env.action_masks()))
+        probs = distribution.distribution.probs.detach().cpu().numpy()[0]
+        priors = probs[env.encode_actions(positions)]
+        return priors / priors.sum()
+
+    @override
+    def get_action(self, env) -> int:
+        # the time at which the action is returned (the margin is kept to return it)
+        start = time.perf_counter()
+        deadline = start + (self.time_limit - self.margin) / 1e3
+
+        # get current polycube id
+        id = env.get_current_polycube().id
+
+        # get the allowed placements of the current polycube from the action mask (format: r, x, y, z)
+        rotations = env.get_current_polycube().get_rotations()
+        positions = np.column_stack(np.unravel_index(np.flatnonzero(env.action_masks()), env.action_space_nvec))
+        print(f'found {len(positions)} feasible positions for polycube {id}')
+
+        # keep the placements with the highest priors (scored for part of the search time)
+        end = deadline - self.margin / 1e3
+        priors = self.get_root_priors(env, positions, rotations, start + (end - start) * PRIOR_TIME_FRACTION)
+        best = np.argsort(-priors, kind='stable')[:self.settings['max_actions']]
+        positions, priors = positions[best], priors[best] / priors[best].sum()
+
+        # the rotations of the current and upcoming polycubes
+        polycubes = [rotations] + [p.get_rotations() for p in env.get_upcoming_polycubes(self.lookahead)[1:]]
+
+        # search until the deadline (minus the margin), in the current process or in the workers
+        visits = np.zeros(len(positions), dtype=np.int64)
+        values = np.zeros(len(positions), dtype=float)
+        if self.workers == 1:
+            visits, values = search(env.container.snapshot(), polycubes, positions, priors, end, self.rng.integers(2**32), self.settings)
+        else:
+            # (the workers compare the deadline with their own `time.perf_counter`, a system-wide clock)
+            spec = get_container_spec(env.container)
+            tasks = [(spec, env.container.matrix, polycubes, positions, priors, end, self.rng.integers(2**32), self.settings)
+                     for _ in range(self.workers)]
+            pending = [self.get_executor().submit(_search, task) for task in tasks]
+
+            # combine the results that are available at the deadline, or the first one after it if none are
+            # (late workers are ignored, their searches stop at the end by themselves)
+            done, _ = futures.wait(pending, timeout=max(deadline - time.perf_counter(), 0))
+            if len(done) == 0:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                visits += future.result()[0]
+                values += future.result()[1]
+
+        # choose the most visited placement (the highest prior if there were no simulations)
+        best = np.lexsort((priors, visits))[-1]
+        r, x, y, z = positions[best]
+        elapsed = (time.perf_counter() - start) * 1e3
+        print(f'adding polycube {id} at position {x, y, z} after {visits.sum()} simulations '
+              f'with a value of {values[best] / max(visits[best], 1)} in {elapsed:.1f} ms')
+
+        # return the action
+        return env.encode_action(r, (x, y, z))
@@ -1,8 +1,18 @@
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 import numpy as np
 
+if TYPE_CHECKING:
+    from src.environment import Container
+
 class Constraint(ABC):
 
+    # whether the constraint never rejects a placement (`is_satisfied` always returns True)
+    never_rejects = False
+
+    # whether the constraint never modifies the matrix (`apply` does nothing)
+    never_mutates = False
+
     @abstractmethod
     def apply(self, matrix: np.ndarray):
         '''
@@ -15,6 +25,26 @@ class Constraint(ABC):
         '''
         pass
 
+    def apply_tracked(self, matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Apply the constraint to the matrix, and keep track of the cells that were changed.
+        By default the matrix is compared with a copy, subclasses can override it to only report the cells they touch.
+
+        Parameters
+        ----------
+            `matrix` : `np.ndarray`
+                the matrix to apply the constraint to.
+
+        Returns
+        -------
+            `tuple[np.ndarray, np.ndarray]` : the coordinates of the (possibly) changed cells (format: x, y, z),
+            and their values before the constraint was applied.
+        '''
+        before = matrix.copy()
+        self.apply(matrix)
+        cells = np.argwhere(before != matrix)
+        return cells, before[cells[:, 0], cells[:, 1], cells[:, 2]]
+
     @abstractmethod
     def is_satisfied(self, matrix: np.ndarray) -> bool:
         '''
@@ -30,3 +60,36 @@ class Constraint(ABC):
             bool : whether the constraint is satisfied.
         '''
         pass
+
+    def is_satisfied_by(self, container: 'Container', cubes: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        '''
+        Check if the constraint is satisfied when a polycube is placed in the container, for many positions at once.
+        The container is not modified. By default every placement is checked with `is_satisfied` on a copy of the matrix,
+        subclasses can override it with an implementation that only uses the added cubes (the delta).
+
+        Parameters
+        ----------
+            `container` : `Container`
+                the container to place the polycube in.
+            `cubes` : `np.ndarray`
+                the coordinates of the cubes of the polycube, relative to its position (see `Polycube.get_cubes`).
+            `positions` : `np.ndarray`
+                the positions of the polycube to check (format: x, y, z), which must fit and not overlap.
+
+        Returns
+        -------
+            `np.ndarray` : whether the constraint is satisfied for every position.
+        '''
+        satisfied = np.full(len(positions), True, dtype=bool)
+        matrix = container.matrix.copy()
+
+        # the polycube gets the smallest id that is not in the matrix (the largest id plus one can overflow the data type)
+        ids = np.unique(matrix)
+        candidates = np.arange(1, len(ids) + 1)
+        value = candidates[~np.isin(candidates, ids)][0]
+        for i, position in enumerate(positions):
+            placed = tuple((cubes + position).T)
+            matrix[placed] = value
+            satisfied[i] = self.is_satisfied(matrix)
+            matrix[placed] = 0
+        return satisfied
@@ -4,6 +4,8 @@ import numpy as np
 
 class Gravity(Constraint):
 
+    never_rejects = True
+
     def __init__(self, connected: bool=True):
         '''
         Create a constraint that applies gravity to the matrix.
@@ -23,7 +25,25 @@ class Gravity(Constraint):
         else:
             self.apply_disconnected_gravity(matrix)
 
-    def apply_connected_gravity(self, matrix: np.ndarray):
+    @override
+    def apply_tracked(self, matrix) -> tuple[np.ndarray, np.ndarray]:
+        # the disconnected gravity rewrites every column, so the changes are found by comparing with a copy
+        if not self.connected:
+            return super().apply_tracked(matrix)
+
+        # only the cells of the pieces that moved were changed
+        moves = []
+        self.apply_connected_gravity(matrix, moves)
+        if len(moves) == 0:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=matrix.dtype)
+        cells = np.concatenate([c for c, _ in moves])
+        values = np.concatenate([v for _, v in moves])
+
+        # keep the value of every cell before its first change
+        _, first = np.unique(np.ravel_multi_index(cells.T, matrix.shape), return_index=True)
+        return cells[first], values[first]
+
+    def apply_connected_gravity(self, matrix: np.ndarray, moves: list=None):
         '''
         Apply gravity to connected components in the matrix.
 
@@ -31,35 +51,74 @@ class Gravity(Constraint):
         ----------
             `matrix` : `np.ndarray`
                 the matrix to apply gravity to.
+            `moves` : list, optional
+                a list to which the cells of every move are appended, together with their values before the move.
         '''
         
         # get the dimensions of the matrix
         width, height, depth = matrix.shape
-        
-        # keep track of the ids that have been moved
-        moved_ids = []
-
-        # apply gravity to each connected component
-        for h in range(height):
-            for x in range(width):
-                for y in range(depth):
-                    id = matrix[x, h, y]
-                    if id != 0 and id not in moved_ids:
-                        piece = (matrix == id) * 1 # get the piece matrix
-                        h1 = h # current height
-                        while h1 > 0 and \
-                            all([(matrix[p[0], p[1] - 1, p[2]] == 0 or piece[p[0], p[1] - 1, p[2]]) for p in np.argwhere(piece)]):
-                            # move down one level until we hit something
-                            piece = np.roll(piece, -1, axis=1)
-                            h1 -= 1
-                        
-                        # add piece to matrix
-                        matrix[matrix == id] = 0
-                        matrix[piece == 1] = id
-
-                        # update moved ids
-                        moved_ids.append(id)
-    
+        levels = np.arange(height)[None, :, None]
+
+        # get the distance from every cell to the first occupied cell below it (in one pass over the columns)
+        # note: cells of a piece that are lower in the same column also block it
+        occupied = np.where(matrix != 0, levels, -1)
+        highest = np.full(matrix.shape, -1)
+        highest[:, 1:, :] = np.maximum.accumulate(occupied, axis=1)[:, :-1, :]
+        distances = levels - highest - 1
+
+        # the bottom cubes of a piece are the cubes that are not directly on top of a cube of the same piece
+        bottom = np.full(matrix.shape, True, dtype=bool)
+        bottom[:, 1:, :] = matrix[:, 1:, :] != matrix[:, :-1, :]
+
+        # get the occupied cells in the order in which they are scanned (layer by layer from the bottom)
+        layers = matrix.transpose(1, 0, 2)
+        cells = np.flatnonzero(layers)
+
+        # group the cells by id (= piece), keeping the scan order within every piece
+        ids, first, inverse, counts = np.unique(layers.ravel()[cells], return_index=True, return_inverse=True, return_counts=True)
+        cells = cells[np.argsort(inverse, kind='stable')]
+        starts = np.cumsum(counts) - counts
+        bottom = bottom.transpose(1, 0, 2).ravel()[cells]
+
+        # get the distance every piece can drop (only changes if a piece below it moves first)
+        drops = np.minimum.reduceat(np.where(bottom, distances.transpose(1, 0, 2).ravel()[cells], height), starts)
+
+        # pieces are processed in the order in which they are scanned, keep track of the
+        # pieces that can drop and the pieces with a bottom cube in a column that was changed
+        order = np.argsort(first)
+        rank = np.argsort(order)
+        pending = drops[order] > 0
+        changed = np.full(len(order), False, dtype=bool)
+        bottom_rank = np.repeat(rank, counts)[bottom]
+        bottom_column = (cells % (width * depth))[bottom]
+
+        r = -1
+        while np.any(pending[r + 1:]):
+            r += 1 + np.argmax(pending[r + 1:])
+            p = order[r]
+            piece = cells[starts[p]:starts[p] + counts[p]]
+            h, x, y = np.unravel_index(piece, layers.shape)
+
+            # get the distance the piece can drop in the current matrix
+            drop = drops[p]
+            if changed[r]:
+                b = bottom[starts[p]:starts[p] + counts[p]]
+                below = (matrix[x[b], :, y[b]] != 0) & (np.arange(height) < h[b, None])
+                drop = np.min(h[b] - np.where(np.any(below, axis=1), height - 1 - np.argmax(below[:, ::-1], axis=1), -1) - 1)
+
+            # move the piece down until it hits something
+            if drop > 0:
+                if moves is not None:
+                    moved = np.column_stack((np.concatenate((x, x)), np.concatenate((h, h - drop)), np.concatenate((y, y))))
+                    moves.append((moved, matrix[moved[:, 0], moved[:, 1], moved[:, 2]]))
+                matrix[x, h, y] = 0
+                matrix[x, h - drop, y] = ids[p]
+
+                # the pieces above it have to check their distance again
+                affected = bottom_rank[(bottom_rank > r) & np.isin(bottom_column, piece % (width * depth))]
+                pending[affected] = True
+                changed[affected] = True
+
     def apply_disconnected_gravity(self, matrix: np.ndarray):
         '''
         Apply gravity to disconnected components in the matrix.
@@ -70,20 +129,15 @@ class Gravity(Constraint):
                 the matrix to apply gravity to.
         '''
         
-        # get the dimensions of the matrix
-        width, height, depth = matrix.shape
-        
-        # apply gravity to each disconnected component
-        for h in range(1, height):
-            for x in range(width):
-                for y in range(depth):
-                    if matrix[x, h, y] != 0: # non-empty square
-                        h1 = h # current height
-                        while h1 > 0 and matrix[x, h1 - 1, y] == 0: # move down until the square is on the ground
-                            matrix[x, h1 - 1, y] = matrix[x, h1, y]
-                            matrix[x, h1, y] = 0
-                            h1 -= 1
+        # every cube falls onto the cube below it, so the occupied cells of each (x, y) column
+        # are moved to the bottom while keeping their order
+        order = np.argsort(matrix == 0, axis=1, kind='stable')
+        matrix[:] = np.take_along_axis(matrix, order, axis=1)
 
     @override
     def is_satisfied(self, matrix) -> bool:
         return True # not relevant
+
+    @override
+    def is_satisfied_by(self, container, cubes, positions) -> np.ndarray:
+        return np.full(len(positions), True, dtype=bool) # not relevant
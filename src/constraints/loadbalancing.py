@@ -4,6 +4,8 @@ import numpy as np
 
 class LoadBalancing(Constraint):
 
+    never_mutates = True
+
     def __init__(self, margin: float=1.0):
         '''
         Create a constraint that checks if the load of the matrix is balanced.
@@ -21,18 +23,49 @@ class LoadBalancing(Constraint):
 
     @override
     def is_satisfied(self, matrix) -> bool:
-        # get the dimensions of the matrix
-        width, _, depth = matrix.shape
-
         # get the positions of the shapes in the matrix
         blocks = np.argwhere(matrix)
 
+        # check the center of mass of the blocks
+        return self.is_balanced(len(blocks), np.sum(blocks, axis=0), matrix.shape)
+
+    @override
+    def is_satisfied_by(self, container, cubes, positions) -> np.ndarray:
+        # update the running statistics of the container with the cubes at every position
+        count = container.get_cube_count() + len(cubes)
+        coordinate_sums = container.get_coordinate_sum() + np.sum(cubes, axis=0) + len(cubes) * np.asarray(positions)
+
+        # check the center of mass of every placement (the coordinates are passed per axis)
+        return np.asarray(self.is_balanced(count, coordinate_sums.T, container.matrix.shape), dtype=bool)
+
+    def is_balanced(self, count: int, coordinate_sum: np.ndarray, shape: tuple[int, int, int]) -> bool:
+        '''
+        Check if the load is balanced, given running statistics of the cubes (see `Container.get_cube_count`).
+
+        Parameters
+        ----------
+            `count` : int
+                the number of cubes.
+            `coordinate_sum` : `np.ndarray`
+                the sum of the coordinates of the cubes (format: x, y, z),
+                or a (3, P) array to check P placements at once.
+            `shape` : `tuple[int, int, int]`
+                the dimensions of the matrix.
+
+        Returns
+        -------
+            bool : whether the constraint is satisfied (an array for P placements).
+        '''
+
+        # get the dimensions of the matrix
+        width, _, depth = shape
+
         # if there are no blocks, the constraint is satisfied
-        if len(blocks) == 0:
+        if count == 0:
             return True
 
         # get the center of mass
-        center_of_mass = np.mean(blocks, axis=0)
+        center_of_mass = coordinate_sum / count
 
         # check if the center of mass is within the margin
         return (center_of_mass[0] - width / 2.0)**2 + (center_of_mass[2] - depth / 2.0)**2 <= self.margin**2
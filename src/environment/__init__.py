@@ -1,3 +1,12 @@
+from src.environment.profiler import Profiler
 from src.environment.container import Container
 from src.environment.shape_generator import ShapeGenerator
+from src.environment.arrivals import ArrivalSource, SequenceArrivals, RandomArrivals, ReplayArrivals
 from src.environment.packing_environment import PackingEnv
+
+def __getattr__(name: str):
+    # import VecPackingEnv on first use, as it loads stable-baselines3 (and torch)
+    if name == 'VecPackingEnv':
+        from src.environment.vec_packing_environment import VecPackingEnv
+        return VecPackingEnv
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,14 @@
+import argparse
+from src.environment import ShapeGenerator
+
+if __name__ == '__main__':
+
+    # arguments
+    parser = argparse.ArgumentParser(description='Build the rotation tables of the polycube cache (see `ShapeGenerator.build_rotation_table`).')
+    parser.add_argument('--upper-bound', type=int, default=10, help='the maximum size of the polycubes')
+    parser.add_argument('--cache-path', default='resources/polycubes', help='path to the cache of polycubes')
+    args = parser.parse_args()
+
+    # build the table of every size
+    for n in range(3, args.upper_bound + 1):
+        ShapeGenerator.build_rotation_table(args.cache_path, n)
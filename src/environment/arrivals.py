@@ -0,0 +1,194 @@
+import collections
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+from src.environment.shapes import Polycube
+from src.environment.shape_generator import ShapeGenerator
+
+class ArrivalSource(ABC):
+
+    def __init__(self, lookahead: int=None):
+        '''
+        Create a source of arriving polycubes.
+        The polycubes are generated lazily (see `generate`), and only the next `lookahead` polycubes are kept in a buffer,
+        so the memory does not depend on the length of the stream.
+
+        Parameters
+        ----------
+            `lookahead` : int, optional
+                the number of upcoming polycubes that are known (including the current one).
+                If `None`, the whole (finite) stream is known.
+        '''
+        self.lookahead = lookahead
+        self.buffer = collections.deque()
+        self.stream = iter(())
+
+    @abstractmethod
+    def generate(self, rng: np.random.Generator) -> Iterator[Polycube]:
+        '''
+        Generate the polycubes of an episode, in the order in which they arrive.
+
+        Parameters
+        ----------
+            `rng` : `np.random.Generator`
+                the random number generator of the environment.
+
+        Returns
+        -------
+            `Iterator[Polycube]` : the (possibly infinite) stream of polycubes.
+        '''
+        pass
+
+    def reset(self, rng: np.random.Generator):
+        '''
+        Start a new stream of polycubes, and fill the lookahead buffer.
+
+        Parameters
+        ----------
+            `rng` : `np.random.Generator`
+                the random number generator of the environment.
+        '''
+        self.buffer.clear()
+        self.stream = self.generate(rng)
+        self.fill()
+
+    def fill(self):
+        '''
+        Fill the lookahead buffer from the stream (until the stream ends).
+        '''
+        while self.lookahead is None or len(self.buffer) < self.lookahead:
+            polycube = next(self.stream, None)
+            if polycube is None:
+                break
+            self.buffer.append(polycube)
+
+    def get_current(self) -> Polycube:
+        '''
+        Get the current polycube (the first polycube in the buffer).
+
+        Returns
+        -------
+            `Polycube` : the current polycube.
+        '''
+        return self.buffer[0]
+
+    def peek(self, n: int) -> list[Polycube]:
+        '''
+        Get the next polycubes, without removing them.
+
+        Parameters
+        ----------
+            `n` : int
+                the (maximum) number of polycubes to get (at most the lookahead).
+
+        Returns
+        -------
+            `list[Polycube]` : the current polycube followed by the next polycubes, in the order in which they arrive.
+        '''
+        return [self.buffer[i] for i in range(min(n, len(self.buffer)))]
+
+    def pop(self) -> Polycube:
+        '''
+        Remove the current polycube, after which the next polycube arrives.
+
+        Returns
+        -------
+            `Polycube` : the current polycube.
+        '''
+        polycube = self.buffer.popleft()
+        self.fill()
+        return polycube
+
+    def __len__(self) -> int:
+        '''
+        Get the number of known upcoming polycubes (0 if the stream has ended).
+
+        Returns
+        -------
+            int : the number of polycubes in the buffer.
+        '''
+        return len(self.buffer)
+
+class SequenceArrivals(ArrivalSource):
+
+    def __init__(self, generator: ShapeGenerator, length: int, lookahead: int=None):
+        '''
+        Create a source that draws a fixed-length sequence of random polycubes at once, with the random number generator
+        of the environment (see `ShapeGenerator.create_sequence`). This is the default source of `PackingEnv`.
+
+        Parameters
+        ----------
+            `generator` : `ShapeGenerator`
+                the generator of the polycubes.
+            `length` : int
+                the length of the sequence.
+            `lookahead` : int, optional
+                the number of upcoming polycubes that are known (if not provided, the whole sequence).
+        '''
+        super().__init__(lookahead)
+        self.generator = generator
+        self.length = length
+
+    def generate(self, rng):
+        # the polycubes arrive from the end of the sequence
+        sequence = self.generator.create_sequence(self.length, rng=rng)
+        while len(sequence) > 0:
+            yield sequence.pop()
+
+class RandomArrivals(ArrivalSource):
+
+    def __init__(self, generator: ShapeGenerator, length: int=None, lookahead: int=1):
+        '''
+        Create a source that draws random polycubes one at a time, as they arrive.
+        Every episode uses its own random number generator, seeded from the random number generator of the environment,
+        so the stream is reproducible for a seed without drawing it in advance.
+
+        Parameters
+        ----------
+            `generator` : `ShapeGenerator`
+                the generator of the polycubes.
+            `length` : int, optional
+                the number of polycubes of an episode (if not provided, the stream is infinite).
+            `lookahead` : int, optional
+                the number of upcoming polycubes that are known.
+        '''
+        super().__init__(lookahead)
+        self.generator = generator
+        self.length = length
+
+    def generate(self, rng):
+        rng = np.random.default_rng(rng.integers(2**63))
+        count = 0
+        while self.length is None or count < self.length:
+            yield self.generator.get_random_polycube(rng=rng)
+            count += 1
+
+class ReplayArrivals(ArrivalSource):
+
+    def __init__(self, generator: ShapeGenerator, log: Iterable[int] | str, lookahead: int=1):
+        '''
+        Create a source that replays a log of arrived polycubes.
+
+        Parameters
+        ----------
+            `generator` : `ShapeGenerator`
+                the generator of the polycubes.
+            `log` : `Iterable[int]` or str
+                the indices of the polycubes in the cache (see `ShapeGenerator.get_random_polycube`), in the order in which
+                they arrive, or the path to a file with one index per line (which is read while the polycubes arrive).
+            `lookahead` : int, optional
+                the number of upcoming polycubes that are known.
+        '''
+        super().__init__(lookahead)
+        self.generator = generator
+        self.log = log
+
+    def generate(self, rng):
+        if isinstance(self.log, str):
+            with open(self.log) as file:
+                for line in file:
+                    if line.strip():
+                        yield self.generator.get_random_polycube(int(line))
+        else:
+            for idx in self.log:
+                yield self.generator.get_random_polycube(int(idx))
@@ -0,0 +1,193 @@
+import os
+import uuid
+import numpy as np
+
+def pack(matrices: list[np.ndarray]) -> dict[str, np.ndarray]:
+    '''
+    Pack a list of binary matrices into flat arrays.
+    Format: `dims` (the shape of every matrix), `offsets` (the start of every matrix in `bits`, plus the end),
+    and `bits` (the flattened matrices, packed to 8 cells per byte).
+
+    Parameters
+    ----------
+        `matrices` : `list[np.ndarray]`
+            the matrices to pack (any non-zero value is set).
+
+    Returns
+    -------
+        `dict[str, np.ndarray]` : the packed arrays.
+    '''
+
+    # pack every matrix separately, so that each one starts at a byte boundary
+    packed = [np.packbits(m.ravel() != 0) for m in matrices]
+
+    # create the header arrays
+    dims = np.array([m.shape for m in matrices], dtype=np.uint8).reshape(-1, 3)
+    offsets = np.zeros(len(matrices) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in packed])
+
+    # concatenate the packed matrices
+    bits = np.concatenate(packed) if len(packed) > 0 else np.zeros(0, dtype=np.uint8)
+    return {'dims': dims, 'offsets': offsets, 'bits': bits}
+
+def unpack(packed: dict[str, np.ndarray], i: int) -> np.ndarray:
+    '''
+    Unpack a single matrix from packed arrays.
+
+    Parameters
+    ----------
+        `packed` : `dict[str, np.ndarray]`
+            the packed arrays (see `pack`).
+        `i` : int
+            the index of the matrix to unpack.
+
+    Returns
+    -------
+        `np.ndarray` : the binary matrix (`bool`).
+    '''
+    shape = tuple(packed['dims'][i].tolist())
+    data = packed['bits'][packed['offsets'][i]:packed['offsets'][i + 1]]
+    return np.unpackbits(data, count=shape[0] * shape[1] * shape[2]).reshape(shape).view(bool)
+
+def save(path: str, arrays: dict[str, np.ndarray]):
+    '''
+    Save packed arrays to disk, as one (non-pickled) `.npy` file per array.
+    Format: `{path}.{name}.npy`. Every file is written to a temporary file with a unique name (in the same directory,
+    with the permissions of a new file) first and then renamed, so other processes never load a partially written array,
+    even when they save it at the same time.
+
+    Parameters
+    ----------
+        `path` : str
+            the path prefix of the files.
+        `arrays` : `dict[str, np.ndarray]`
+            the arrays to save.
+    '''
+    for name, array in arrays.items():
+        temporary = f'{path}.{name}.{uuid.uuid4().hex}.tmp.npy'
+        file = open(temporary, 'xb')
+        try:
+            with file:
+                np.save(file, array, allow_pickle=False)
+            os.replace(temporary, f'{path}.{name}.npy')
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+class Writer:
+
+    def __init__(self, path: str, chunk_size: int=1 << 24):
+        '''
+        Create a writer that saves arrays to disk in chunks, without keeping them in memory (e.g. packed arrays that are
+        too large to pack at once). Every chunk is appended to a temporary file per array, and when the writer is closed
+        the temporary files are converted to `.npy` files (in parts of `chunk_size` bytes) and renamed, like `save`.
+        Use it as a context manager: the files are only saved if no exception was raised.
+
+        Parameters
+        ----------
+            `path` : str
+                the path prefix of the files (format: `{path}.{name}.npy`).
+            `chunk_size` : int, optional
+                the number of bytes that are copied at once when the files are converted.
+        '''
+        self.path = path
+        self.chunk_size = chunk_size
+        self.token = uuid.uuid4().hex
+        self.files = {}
+
+    def get_temporary(self, name: str) -> str:
+        '''
+        Get the path of the temporary file of an array (unique for every writer).
+        '''
+        return f'{self.path}.{name}.{self.token}.tmp'
+
+    def append(self, arrays: dict[str, np.ndarray]):
+        '''
+        Append a chunk to every array (along the first axis).
+
+        Parameters
+        ----------
+            `arrays` : `dict[str, np.ndarray]`
+                the chunks of the arrays (the data type and the other dimensions of an array must not change).
+        '''
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if name not in self.files:
+                self.files[name] = {'file': open(self.get_temporary(name), 'xb'), 'dtype': array.dtype,
+                                    'shape': array.shape[1:], 'length': 0}
+            entry = self.files[name]
+            assert array.dtype == entry['dtype'] and array.shape[1:] == entry['shape'], f'the chunk of {name} does not match.'
+            entry['file'].write(array.tobytes())
+            entry['length'] += len(array)
+
+    def close(self):
+        '''
+        Save the arrays (see `Writer`).
+        '''
+        for name, entry in self.files.items():
+            entry['file'].close()
+            temporary = f'{self.get_temporary(name)}.npy'
+            array = np.lib.format.open_memmap(temporary, mode='w+', dtype=entry['dtype'],
+                                              shape=(entry['length'],) + entry['shape'])
+            flat = array.reshape(-1).view(np.uint8) if array.size > 0 else np.zeros(0, dtype=np.uint8)
+            with open(self.get_temporary(name), 'rb') as file:
+                for start in range(0, len(flat), self.chunk_size):
+                    chunk = file.read(self.chunk_size)
+                    flat[start:start + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+            array.flush()
+            del array, flat
+            os.replace(temporary, f'{self.path}.{name}.npy')
+            os.remove(self.get_temporary(name))
+        self.files = {}
+
+    def discard(self):
+        '''
+        Remove the temporary files without saving the arrays.
+        '''
+        for name, entry in self.files.items():
+            entry['file'].close()
+            for temporary in [self.get_temporary(name), f'{self.get_temporary(name)}.npy']:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+        self.files = {}
+
+    def __enter__(self) -> 'Writer':
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            try:
+                self.close()
+            except BaseException:
+                self.discard()
+                raise
+        else:
+            self.discard()
+
+def load(path: str, names: list[str], source: str=None) -> dict[str, np.ndarray]:
+    '''
+    Load packed arrays from disk.
+    The arrays are memory-mapped, so only the parts that are accessed are read
+    (they are returned as plain arrays, which avoids the overhead of `np.memmap` when indexing).
+
+    Parameters
+    ----------
+        `path` : str
+            the path prefix of the files.
+        `names` : `list[str]`
+            the names of the arrays to load.
+        `source` : str, optional
+            the path of the file the arrays were created from. If it was modified after any of the arrays was saved,
+            the arrays are stale and are not loaded.
+
+    Returns
+    -------
+        `dict[str, np.ndarray]` : the arrays, or `None` if any of the files does not exist (or is stale).
+    '''
+    files = [f'{path}.{name}.npy' for name in names]
+    if not all(os.path.exists(file) for file in files):
+        return None
+    if source is not None and os.path.exists(source):
+        if any(os.path.getmtime(file) < os.path.getmtime(source) for file in files):
+            return None
+    return {name: np.asarray(np.load(f'{path}.{name}.npy', mmap_mode='r')) for name in names}
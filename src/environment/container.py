@@ -1,10 +1,45 @@
+import copy
+import weakref
 import numpy as np
 from src.constraints import Constraint
 from src.environment.shapes import Polycube
+from src.environment.mask_cache import MaskCache, get_zobrist_keys
+from src.environment.profiler import DISABLED
+
+# the size of the blocks of the coarse occupancy index (see `Container.get_candidate_regions`)
+BLOCK_SIZE = 4
+
+# the overhead of checking a separate region of positions, in number of positions (see `Container.get_candidate_regions`)
+REGION_COST = 4096
+
+def get_max_id(dtype: np.dtype) -> int:
+    '''
+    Get the largest shape id that a matrix of the given data type can hold exactly.
+
+    Parameters
+    ----------
+        `dtype` : `np.dtype`
+            the data type of the matrix.
+
+    Returns
+    -------
+        int : the largest id.
+    '''
+    if np.issubdtype(dtype, np.integer):
+        return int(np.iinfo(dtype).max)
+    return 2 ** (np.finfo(dtype).nmant + 1)
 
 class Container:
 
-    def __init__(self, width: int, height: int, depth: int, constraints: list[Constraint]=None):
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            depth: int,
+            constraints: list[Constraint]=None,
+            dtype: np.dtype=np.float64,
+            cache_size: int=0
+        ):
         '''
         Create a container object.
         
@@ -18,14 +53,57 @@ class Container:
                 the depth of the container.
             `constraints` : `list[Constraint]`, optional
                 a list of constraints that the container must satisfy.
+            `dtype` : `np.dtype`, optional
+                the data type of the matrix, e.g. `np.int32` for a compact id grid. The ids of the shapes must fit in it,
+                otherwise `add` raises a `ValueError`: the ids of `ShapeGenerator` are the index of the polycube in the
+                cache plus one, so `np.int16` (at most 32767) is too small from an upper bound of 9 (and `np.float32`
+                is exact up to 2^24).
+            `cache_size` : int, optional
+                the maximum number of feasible masks that are cached (see `MaskCache`), 0 to disable the cache.
+                The masks are keyed by the occupancy, so the constraints must only depend on the occupied cells.
         '''
         
         # set the container
         self.width = width
         self.height = height
         self.depth = depth
-        self.matrix = np.zeros((width, height, depth))
+        self.matrix = np.zeros((width, height, depth), dtype=dtype)
+        self.max_id = get_max_id(self.matrix.dtype)
         self.constraints = [] if constraints is None else constraints
+        self.profiler = DISABLED # set by the environment to profile `add`
+
+        # the cache of feasible masks (shared with snapshots), keyed by the Zobrist hash of the occupancy
+        self.mask_cache = MaskCache(cache_size) if cache_size > 0 else None
+        self.zobrist_keys = get_zobrist_keys(self.matrix.shape) if cache_size > 0 else None
+        self.occupancy_hash = np.uint64(0)
+
+        # running statistics of the cubes in the container
+        self.cube_count = 0
+        self.coordinate_sum = np.zeros(3, dtype=np.int64)
+        self.height_map = np.zeros((width, depth), dtype=np.int64)
+        self.column_counts = np.zeros((width, depth), dtype=np.int64)
+
+        # coarse occupancy index: the number of occupied cells in every block of `BLOCK_SIZE` cells along each axis
+        self.block_counts = np.zeros(self.get_block_dimensions(), dtype=np.int64)
+        self.candidate_regions = {} # computed from the index when needed (see `get_candidate_regions`)
+        self.packed_occupancy = None # computed when needed (see `get_packed_occupancy`)
+
+        # registry of the shapes in the container (id: number of cubes, sum of the coordinates and bounding box)
+        self.shapes = {}
+
+        # the changes of the placements made with `push` (see `pop`)
+        self.undo_log = []
+
+        # copy-on-write snapshots (see `snapshot`): the snapshots of this container, or the container this snapshot shares its matrix with
+        self.snapshots = []
+        self.owner = None
+
+    def __getstate__(self) -> dict:
+        # copies (e.g. pickled for a worker process) have their own matrix, so they are not linked to other containers
+        state = self.__dict__.copy()
+        state['snapshots'] = []
+        state['owner'] = None
+        return state
 
     def get_dimensions(self) -> tuple[int, int, int]:
         '''
@@ -38,23 +116,234 @@ class Container:
         '''
         return (self.width, self.height, self.depth)
     
+    def get_block_dimensions(self) -> tuple[int, int, int]:
+        '''
+        Get the dimensions of the coarse occupancy index (the number of blocks along each axis).
+
+        Returns
+        -------
+            `tuple[int, int, int]` : the number of blocks along the width, height and depth of the container.
+        '''
+        return tuple(-(-n // BLOCK_SIZE) for n in self.get_dimensions())
+
     def get_ids(self) -> np.ndarray:
         '''
-        Get the unique ids of the shapes in the container.
+        Get the unique ids of the shapes in the container (from the shape registry).
         
         Returns
         -------
-            `np.ndarray` : the unique ids of the shapes in the container.
+            `np.ndarray` : the (sorted) unique ids of the shapes in the container.
+        '''
+        return np.array(sorted(self.shapes), dtype=self.matrix.dtype)
+
+    def get_shape_count(self) -> int:
+        '''
+        Get the number of shapes in the container.
+
+        Returns
+        -------
+            int : the number of shapes.
         '''
+        return len(self.shapes)
 
-        unique = np.unique(self.matrix)
-        return unique[np.where(unique != 0)]
+    def get_shape(self, id: int) -> dict:
+        '''
+        Get the registry entry of a shape in the container.
+
+        Parameters
+        ----------
+            `id` : int
+                the id of the shape.
+
+        Returns
+        -------
+            `dict[count, coordinate_sum, bounding_box]` : the number of cubes of the shape, the sum of their coordinates
+            (format: x, y, z) and the bounding box (format: (min, max), inclusive), or `None` if the id is not in the container.
+        '''
+        return self.shapes.get(id)
+
+    def get_shape_cubes(self, id: int) -> np.ndarray:
+        '''
+        Get the coordinates of the cubes of a shape in the container.
+        Only the bounding box of the shape is searched.
+
+        Parameters
+        ----------
+            `id` : int
+                the id of the shape.
+
+        Returns
+        -------
+            `np.ndarray` : an (N, 3) array with the coordinates of the cubes (format: x, y, z).
+        '''
+        low, high = self.shapes[id]['bounding_box']
+        box = self.matrix[low[0]:high[0] + 1, low[1]:high[1] + 1, low[2]:high[2] + 1]
+        return np.argwhere(box == id) + low
+
+    def get_cube_count(self) -> int:
+        '''
+        Get the number of cubes in the container.
+
+        Returns
+        -------
+            int : the number of occupied cells.
+        '''
+        return self.cube_count
+
+    def get_coordinate_sum(self) -> np.ndarray:
+        '''
+        Get the sum of the coordinates of the cubes in the container.
+        Together with `get_cube_count`, this gives the center of mass of the container.
+
+        Returns
+        -------
+            `np.ndarray` : the sum of the coordinates of all occupied cells (format: x, y, z).
+        '''
+        return self.coordinate_sum
+
+    def get_height_map(self) -> np.ndarray:
+        '''
+        Get the height map of the container.
+        The height of a (x, z) column is the height of its highest cube plus one, or 0 if the column is empty.
+
+        Returns
+        -------
+            `np.ndarray` : a 2D array with the height of every column.
+        '''
+        return self.height_map
+
+    def get_column_counts(self) -> np.ndarray:
+        '''
+        Get the number of cubes in every (x, z) column of the container.
+
+        Returns
+        -------
+            `np.ndarray` : a 2D array with the number of occupied cells of every column.
+        '''
+        return self.column_counts
+
+    def get_block_counts(self) -> np.ndarray:
+        '''
+        Get the number of cubes in every block of the coarse occupancy index (blocks of `BLOCK_SIZE` cells along each axis).
+
+        Returns
+        -------
+            `np.ndarray` : a 3D array with the number of occupied cells of every block.
+        '''
+        return self.block_counts
+
+    def get_block_groups(self, gaps: tuple[int, int, int]) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Split the occupied blocks of the coarse occupancy index into groups, wherever there are at least `gaps`
+        empty blocks between them along an axis (e.g. a cube near every corner of the container gives a group per corner).
+
+        Parameters
+        ----------
+            `gaps` : `tuple[int, int, int]`
+                the minimum number of empty blocks between two groups along each axis (format: x, y, z).
+
+        Returns
+        -------
+            `tuple[np.ndarray, np.ndarray]` : two (G, 3) arrays with the lowest and the highest (inclusive) block of
+            the bounding box of every group (format: x, y, z).
+        '''
+        # split the bounding box of the occupied blocks along the axes, until no box can be split
+        groups = []
+        boxes = [(np.zeros(3, dtype=np.int64), np.array(self.block_counts.shape) - 1)] if self.cube_count > 0 else []
+        while len(boxes) > 0:
+            low, high = boxes.pop()
+            occupied = self.block_counts[low[0]:high[0] + 1, low[1]:high[1] + 1, low[2]:high[2] + 1] > 0
+            runs = None
+            for axis in range(3):
+                # the runs of occupied blocks along the axis (separated by enough empty blocks)
+                indices = np.flatnonzero(np.any(occupied, axis=tuple(a for a in range(3) if a != axis)))
+                splits = np.flatnonzero(np.diff(indices) > gaps[axis]) + 1
+                if len(splits) > 0 or indices[0] > 0 or indices[-1] < high[axis] - low[axis]:
+                    runs = axis, np.split(indices, splits)
+                    break
+            if runs is None:
+                groups.append((low, high))
+                continue
+
+            # trim the box to every run along the axis
+            axis, runs = runs
+            for run in runs:
+                run_low, run_high = low.copy(), high.copy()
+                run_low[axis], run_high[axis] = low[axis] + run[0], low[axis] + run[-1]
+                boxes.append((run_low, run_high))
+        return (np.array([low for low, _ in groups], dtype=np.int64).reshape(-1, 3),
+                np.array([high for _, high in groups], dtype=np.int64).reshape(-1, 3))
+
+    def get_packed_occupancy(self) -> np.ndarray:
+        '''
+        Get the occupancy of the container, packed to 8 cells per byte (computed once per state of the container).
+        The mask cache stores it with every mask, to tell apart occupancies with the same hash (see `MaskCache`).
+
+        Returns
+        -------
+            `np.ndarray` : the packed occupancy (which should not be modified).
+        '''
+        if self.packed_occupancy is None:
+            self.packed_occupancy = np.packbits(self.matrix != 0)
+        return self.packed_occupancy
+
+    def get_candidate_regions(self, shape: tuple[int, int, int]) -> list[tuple[list[int], list[int]]]:
+        '''
+        Get the regions of positions where a polycube with the given dimensions can overlap with a cube, from the
+        coarse occupancy index. A group of occupied blocks (see `get_block_groups`) is reached from a box of positions,
+        and the groups are split such that these boxes are disjoint. At all other positions the bounding box of the
+        polycube only covers empty blocks, so these positions are free without scanning the matrix. When the regions
+        skip less than `REGION_COST` positions each, their bounding box is returned as a single region instead.
+        The cost only depends on the number of occupied blocks, and the regions are computed once per state of the
+        container and dimensions of the polycube.
+
+        Parameters
+        ----------
+            `shape` : `tuple[int, int, int]`
+                the dimensions of the polycube (which must fit in the container).
+
+        Returns
+        -------
+            `list[tuple[list[int], list[int]]]` : the lowest corner and the (exclusive) highest corner of every region
+            (format: x, y, z).
+        '''
+
+        if self.cube_count == 0:
+            return []
+        regions = self.candidate_regions.get(shape)
+        if regions is not None:
+            return regions
+
+        # the polycube reaches two blocks from the same position if there are less than (size - 1) / BLOCK_SIZE empty blocks between them
+        gaps = ((shape[0] + BLOCK_SIZE - 2) // BLOCK_SIZE, (shape[1] + BLOCK_SIZE - 2) // BLOCK_SIZE, (shape[2] + BLOCK_SIZE - 2) // BLOCK_SIZE)
+        low, high = self.get_block_groups(gaps)
+        size = np.array(shape)
+        low = np.maximum(low * BLOCK_SIZE - size + 1, 0)
+        high = np.minimum(high * BLOCK_SIZE + BLOCK_SIZE, np.array(self.get_dimensions()) - size + 1)
+
+        # a separate region only pays off if it skips enough positions, otherwise the bounding box of the regions is checked
+        bounding_low, bounding_high = np.min(low, axis=0), np.max(high, axis=0)
+        if np.sum(np.prod(high - low, axis=1)) + len(low) * REGION_COST >= np.prod(bounding_high - bounding_low) + REGION_COST:
+            low, high = bounding_low[None], bounding_high[None]
+        regions = self.candidate_regions[shape] = list(zip(low.tolist(), high.tolist()))
+        return regions
 
     def reset(self):
         '''
         Reset the container to a blank state.
         '''
-        self.matrix = np.zeros(self.get_dimensions())
+        self.copy_on_write()
+        self.matrix[:] = 0 # in place, the matrix can be a view of a larger (batched) array
+        self.cube_count = 0
+        self.coordinate_sum = np.zeros(3, dtype=np.int64)
+        self.height_map = np.zeros((self.width, self.depth), dtype=np.int64)
+        self.column_counts = np.zeros((self.width, self.depth), dtype=np.int64)
+        self.block_counts = np.zeros(self.get_block_dimensions(), dtype=np.int64)
+        self.candidate_regions = {}
+        self.packed_occupancy = None
+        self.shapes = {}
+        self.undo_log = []
+        self.occupancy_hash = np.uint64(0)
     
     def fits(self, polycube: Polycube, position: tuple[int, int, int]) -> bool:
         '''
@@ -73,7 +362,7 @@ class Container:
         '''
 
         # get the dimensions of the polycube
-        shape_width, shape_height, shape_depth = polycube.matrix.shape
+        shape_width, shape_height, shape_depth = polycube.shape
 
         # check if the polycube fits in the container
         if position[0] + shape_width > self.width:
@@ -83,33 +372,68 @@ class Container:
         if position[2] + shape_depth > self.depth:
             return False
         
-        # check for overlap      
-        mx = np.ma.masked_array(self.matrix[position[0]:position[0] + shape_width,
-                                            position[1]:position[1] + shape_height,
-                                            position[2]:position[2] + shape_depth],
-                                            mask=(polycube.matrix == 0))
-        if np.any(mx):
+        # check for overlap
+        cells = polycube.get_cubes() + np.array(position)
+        if np.any(self.matrix[cells[:, 0], cells[:, 1], cells[:, 2]]):
             return False
         
-        # add the polycube to the container
-        self.matrix[position[0]:position[0] + shape_width,
-                    position[1]:position[1] + shape_height,
-                    position[2]:position[2] + shape_depth] += polycube.matrix
-        
         # check if the constraints are satisfied
+        return self.satisfies_constraints(polycube, position)
+
+    def satisfies_constraints(self, polycube: Polycube, position: tuple[int, int, int]) -> bool:
+        '''
+        Check if the constraints are satisfied when a polycube is placed in the container.
+        This method assumes that the polycube fits in the container and does not overlap.
+
+        Parameters
+        ----------
+            `polycube` : `Polycube`
+                the polycube to be checked.
+            `position` : `tuple[int, int, int]`
+                the position of the polycube.
+        
+        Returns
+        -------
+            bool : True if all constraints are satisfied, otherwise False.
+        '''
+        return bool(self.get_constraint_mask(polycube, np.array([position]))[0])
+
+    def get_constraint_mask(self, polycube: Polycube, positions: np.ndarray) -> np.ndarray:
+        '''
+        Check if the constraints are satisfied when a polycube is placed in the container, for many positions at once.
+        The constraints are checked with the cubes of the polycube (see `Constraint.is_satisfied_by`), so the container
+        is not modified. Constraints that never reject a placement are skipped.
+
+        Parameters
+        ----------
+            `polycube` : `Polycube`
+                the polycube to be checked.
+            `positions` : `np.ndarray`
+                the positions of the polycube (format: x, y, z), which must fit and not overlap.
+
+        Returns
+        -------
+            `np.ndarray` : True for the positions where all constraints are satisfied.
+        '''
+        satisfied = np.full(len(positions), True, dtype=bool)
         for constraint in self.constraints:
-            if not constraint.is_satisfied(self.matrix):
-                # remove the polycube from the container
-                self.matrix[position[0]:position[0] + shape_width,
-                            position[1]:position[1] + shape_height,
-                            position[2]:position[2] + shape_depth] -= polycube.matrix
-                return False
-        
-        # remove the polycube from the container
-        self.matrix[position[0]:position[0] + shape_width,
-                    position[1]:position[1] + shape_height,
-                    position[2]:position[2] + shape_depth] -= polycube.matrix
-        return True
+            if constraint.never_rejects:
+                continue
+
+            # only check the positions that satisfy the previous constraints
+            remaining = np.flatnonzero(satisfied)
+            satisfied[remaining] = constraint.is_satisfied_by(self, polycube.get_cubes(), positions[remaining])
+        return satisfied
+
+    def has_mutating_constraints(self) -> bool:
+        '''
+        Check if any of the constraints can modify the container (e.g. move cubes).
+
+        Returns
+        -------
+            bool : True if a constraint can modify the container, otherwise False.
+        '''
+        return any(not constraint.never_mutates for constraint in self.constraints)
 
     def add(self, polycube: Polycube, position: tuple[int, int, int]) -> bool:
         '''
@@ -127,30 +451,286 @@ class Container:
             bool : True if the shape was successfully added, otherwise False 
             (in this case the container will not be modified).
         '''
+        return self._add(polycube, position) is not None
 
-        # check if the polycube fits in the container
-        if not self.fits(polycube, position):
+    def push(self, polycube: Polycube, position: tuple[int, int, int]) -> bool:
+        '''
+        Add a polycube to the container, and keep the changes in the undo log so the placement can be undone with `pop`.
+        Only the cells that were changed are logged (the cubes of the polycube and the cells moved by the constraints).
+
+        Parameters
+        ----------
+            `polycube` : `Polycube`
+                the polycube to be added.
+            `position` : `tuple[int, int, int]`
+                the position of the polycube.
+
+        Returns
+        -------
+            bool : True if the shape was successfully added, otherwise False
+            (in this case the container and the undo log will not be modified).
+        '''
+        change = self._add(polycube, position)
+        if change is None:
             return False
+        self.undo_log.append(change)
+        return True
+
+    def pop(self):
+        '''
+        Undo the last placement made with `push`.
+        The matrix, the statistics and the shape registry are restored from the changed cells only.
+        '''
+        cells, values = self.undo_log.pop()
+        self.copy_on_write()
+
+        # restore the cells, and update the state with the values they had before
+        index = (cells[:, 0], cells[:, 1], cells[:, 2])
+        current = self.matrix[index]
+        self.matrix[index] = values
+        self.update_state(cells, current)
+
+    def _add(self, polycube: Polycube, position: tuple[int, int, int]) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Add a polycube to the container, see `add`.
+
+        Returns
+        -------
+            `tuple[np.ndarray, np.ndarray]` : the coordinates of the changed cells (format: x, y, z) and their values
+            before the polycube was added, or `None` if the polycube does not fit.
+        '''
+
+        # check if the polycube fits in the container
+        with self.profiler.section('container.fits'):
+            if not self.fits(polycube, position):
+                return None
         
-        # check if the id is already taken
-        while np.isin(polycube.id, self.matrix):
-            polycube.increment_id()
+        # check if the id is already taken (and take the next free id)
+        with self.profiler.section('container.id_check'):
+            id = polycube.id
+            while id in self.shapes:
+                id += 1
+            if id > self.max_id:
+                raise ValueError(f'the id {id} does not fit in a container of dtype {self.matrix.dtype} (at most {self.max_id}).')
+            if id != polycube.id:
+                polycube.increment_id(id - polycube.id)
 
-        # add the polycube to the container
-        shape_width, shape_height, shape_depth = polycube.matrix.shape
-        self.matrix[position[0]:position[0] + shape_width,
-                    position[1]:position[1] + shape_height,
-                    position[2]:position[2] + shape_depth] += polycube.matrix
+        # add the polycube to the container (the cells were empty)
+        self.copy_on_write()
+        cells = polycube.get_cubes() + np.array(position)
+        self.matrix[cells[:, 0], cells[:, 1], cells[:, 2]] = polycube.id
+        values = np.zeros(len(cells), dtype=self.matrix.dtype)
         
-        # apply constraints
-        for constraint in self.constraints:
-            constraint.apply(self.matrix)
+        # apply constraints (and collect the cells they changed)
+        with self.profiler.section('container.constraints'):
+            changes = [(cells, values)]
+            for constraint in self.constraints:
+                if not constraint.never_mutates:
+                    changes.append(constraint.apply_tracked(self.matrix))
+
+        # update the statistics
+        with self.profiler.section('container.statistics'):
+            if all(len(c) == 0 for c, _ in changes[1:]):
+                # only the (empty) cells of the polycube were changed
+                if self.zobrist_keys is not None:
+                    self.occupancy_hash ^= np.bitwise_xor.reduce(self.zobrist_keys[cells[:, 0], cells[:, 1], cells[:, 2]])
+                self.cube_count += len(cells)
+                self.coordinate_sum = self.coordinate_sum + np.sum(cells, axis=0)
+                np.add.at(self.column_counts, (cells[:, 0], cells[:, 2]), 1)
+                np.maximum.at(self.height_map, (cells[:, 0], cells[:, 2]), cells[:, 1] + 1)
+                np.add.at(self.block_counts, tuple((cells // BLOCK_SIZE).T), 1)
+                self.candidate_regions = {}
+                self.packed_occupancy = None
+                self.shapes[int(polycube.id)] = {'count': len(cells),
+                                                 'coordinate_sum': np.sum(cells, axis=0),
+                                                 'bounding_box': (np.min(cells, axis=0), np.max(cells, axis=0))}
+            else:
+                # keep the value of every changed cell before the polycube was added
+                cells = np.concatenate([c for c, _ in changes])
+                values = np.concatenate([v for _, v in changes])
+                _, first = np.unique(np.ravel_multi_index(cells.T, self.matrix.shape), return_index=True)
+                cells, values = cells[first], values[first]
+                changed = self.matrix[cells[:, 0], cells[:, 1], cells[:, 2]] != values
+                cells, values = cells[changed], values[changed]
+                self.update_state(cells, values)
         
-        return True
+        return cells, values
+
+    def update_state(self, cells: np.ndarray, values: np.ndarray):
+        '''
+        Update the statistics and the shape registry after some cells of the matrix were changed.
+        The cost only depends on the number of changed cells (and the height of their columns).
+
+        Parameters
+        ----------
+            `cells` : `np.ndarray`
+                the unique coordinates of the changed cells (format: x, y, z).
+            `values` : `np.ndarray`
+                the values of the cells before they were changed.
+        '''
+        if len(cells) == 0:
+            return
+        current = self.matrix[cells[:, 0], cells[:, 1], cells[:, 2]]
+        removed, added = values != 0, current != 0
+
+        # update the totals
+        self.cube_count += int(np.count_nonzero(added)) - int(np.count_nonzero(removed))
+        self.coordinate_sum = self.coordinate_sum + np.sum(cells[added], axis=0) - np.sum(cells[removed], axis=0)
+        np.add.at(self.block_counts, tuple((cells[added] // BLOCK_SIZE).T), 1)
+        np.add.at(self.block_counts, tuple((cells[removed] // BLOCK_SIZE).T), -1)
+        self.candidate_regions = {}
+        self.packed_occupancy = None
+
+        # recompute the changed columns
+        columns = np.unique(cells[:, 0] * self.depth + cells[:, 2])
+        xs, zs = columns // self.depth, columns % self.depth
+        occupied = self.matrix[xs, :, zs] != 0
+        self.column_counts[xs, zs] = np.count_nonzero(occupied, axis=1)
+        self.height_map[xs, zs] = np.where(self.column_counts[xs, zs] > 0, self.height - np.argmax(occupied[:, ::-1], axis=1), 0)
+
+        # update the occupancy hash with the cells that were emptied or filled
+        if self.zobrist_keys is not None:
+            flipped = cells[removed != added]
+            self.occupancy_hash ^= np.bitwise_xor.reduce(self.zobrist_keys[flipped[:, 0], flipped[:, 1], flipped[:, 2]])
+
+        # update the shape registry (the entries are replaced, as they can be shared with snapshots)
+        shrunk = set()
+        for id in np.unique(values[removed]):
+            id, lost = int(id), cells[removed & (values == id)]
+            entry = self.shapes[id]
+            if entry['count'] == len(lost):
+                del self.shapes[id]
+                continue
+            self.shapes[id] = {'count': entry['count'] - len(lost),
+                               'coordinate_sum': entry['coordinate_sum'] - np.sum(lost, axis=0),
+                               'bounding_box': entry['bounding_box']}
+            shrunk.add(id)
+        for id in np.unique(current[added]):
+            id, gained = int(id), cells[added & (current == id)]
+            low, high = np.min(gained, axis=0), np.max(gained, axis=0)
+            entry = self.shapes.get(id)
+            if entry is None:
+                self.shapes[id] = {'count': len(gained), 'coordinate_sum': np.sum(gained, axis=0), 'bounding_box': (low, high)}
+                continue
+            self.shapes[id] = {'count': entry['count'] + len(gained),
+                               'coordinate_sum': entry['coordinate_sum'] + np.sum(gained, axis=0),
+                               'bounding_box': (np.minimum(entry['bounding_box'][0], low), np.maximum(entry['bounding_box'][1], high))}
+
+        # the bounding box of a shape that lost cubes is searched again (within its previous bounding box)
+        for id in shrunk:
+            cubes = self.get_shape_cubes(id)
+            self.shapes[id] = {**self.shapes[id], 'bounding_box': (np.min(cubes, axis=0), np.max(cubes, axis=0))}
+
+    def snapshot(self) -> 'Container':
+        '''
+        Get a lightweight copy-on-write snapshot of the container, e.g. to explore placements or to send to a worker.
+        The snapshot shares the matrix with this container until one of them is modified, only the (small)
+        statistics are copied. The snapshot has its own (empty) undo log, and can be pickled as a regular container.
+
+        Returns
+        -------
+            `Container` : the snapshot.
+        '''
+        snapshot = copy.copy(self)
+        snapshot.height_map = self.height_map.copy()
+        snapshot.column_counts = self.column_counts.copy()
+        snapshot.block_counts = self.block_counts.copy()
+        snapshot.candidate_regions = dict(self.candidate_regions)
+        snapshot.shapes = dict(self.shapes)
+        snapshot.profiler = DISABLED
+        snapshot.undo_log = []
+        snapshot.snapshots = []
+
+        # link the snapshot to the container that owns the matrix
+        owner = self if self.owner is None else self.owner()
+        if owner is not None:
+            snapshot.owner = weakref.ref(owner)
+            owner.snapshots.append(weakref.ref(snapshot))
+        return snapshot
+
+    def copy_on_write(self):
+        '''
+        Make sure that the matrix can be modified without changing any snapshot (see `snapshot`).
+        A snapshot copies the shared matrix, the owner of the matrix gives a copy to its snapshots (it keeps its own
+        matrix, as it can be a view of a larger array).
+        '''
+        if self.owner is not None:
+            self.matrix = self.matrix.copy()
+            self.owner = None
+        if len(self.snapshots) > 0:
+            for reference in self.snapshots:
+                snapshot = reference()
+                if snapshot is not None and snapshot.matrix is self.matrix:
+                    snapshot.matrix = self.matrix.copy()
+                    snapshot.owner = None
+            self.snapshots = []
+
+    def load_matrix(self, matrix: np.ndarray):
+        '''
+        Set the container to the state of a matrix (e.g. the matrix of another container of the same size),
+        and compute the statistics and the shape registry from it in one pass.
+
+        Parameters
+        ----------
+            `matrix` : `np.ndarray`
+                the matrix with the id of the shape in every occupied cell.
+        '''
+        self.reset()
+        self.matrix[:] = matrix
+        occupied = self.matrix != 0
+        cells = np.argwhere(occupied)
+        ids = self.matrix[cells[:, 0], cells[:, 1], cells[:, 2]]
+
+        # compute the statistics
+        self.cube_count = len(cells)
+        self.coordinate_sum = np.sum(cells, axis=0)
+        self.column_counts = np.count_nonzero(occupied, axis=1)
+        self.height_map = np.where(self.column_counts > 0, self.height - np.argmax(occupied[:, ::-1], axis=1), 0)
+        np.add.at(self.block_counts, tuple((cells // BLOCK_SIZE).T), 1)
+        if self.zobrist_keys is not None:
+            self.occupancy_hash = np.bitwise_xor.reduce(self.zobrist_keys[occupied])
+
+        # compute the shape registry
+        unique, inverse, counts = np.unique(ids, return_inverse=True, return_counts=True)
+        sums = np.zeros((len(unique), 3), dtype=np.int64)
+        low = np.full((len(unique), 3), max(self.get_dimensions()), dtype=np.int64)
+        high = np.zeros((len(unique), 3), dtype=np.int64)
+        np.add.at(sums, inverse, cells)
+        np.minimum.at(low, inverse, cells)
+        np.maximum.at(high, inverse, cells)
+        self.shapes = {int(id): {'count': int(count), 'coordinate_sum': sums[i], 'bounding_box': (low[i], high[i])}
+                       for i, (id, count) in enumerate(zip(unique, counts))}
 
     def get_feasible_mask(self, polycube: Polycube) -> np.ndarray:
         '''
         Get a mask of the container where the polycube can fit.
+        With a mask cache (see `cache_size`), the mask is looked up by the occupancy hash and the rotation shape first
+        (and only used if it was computed for the same occupancy).
+
+        Parameters
+        ----------
+            `polycube` : `Polycube`
+                the polycube to be checked (locked rotation).
+        
+        Returns
+        -------
+            `np.ndarray` : a 3D mask of the container where the shape can fit.
+        '''
+
+        # look up the mask if the rotation shape was checked against the same occupancy before
+        if self.mask_cache is not None:
+            key = (int(self.occupancy_hash), polycube.shape, polycube.get_cubes().tobytes())
+            occupancy = self.get_packed_occupancy()
+            mask = self.mask_cache.get(key, occupancy)
+            if mask is None:
+                mask = self.compute_feasible_mask(polycube)
+                self.mask_cache.put(key, occupancy, mask)
+            return mask
+        return self.compute_feasible_mask(polycube)
+
+    def compute_feasible_mask(self, polycube: Polycube) -> np.ndarray:
+        '''
+        Compute a mask of the container where the polycube can fit (without the cache, see `get_feasible_mask`).
 
         Parameters
         ----------
@@ -164,11 +744,33 @@ class Container:
 
         # create an empty copy of the container
         mask = np.full(self.get_dimensions(), False, dtype=bool)
-        for x in range(self.width):
-            for y in range(self.height):
-                for z in range(self.depth):
-                    if self.fits(polycube, (x, y, z)):
-                        mask[x, y, z] = True
+
+        # get the number of positions along each axis where the polycube stays inside the container
+        shape_width, shape_height, shape_depth = polycube.shape
+        nx, ny, nz = self.width - shape_width + 1, self.height - shape_height + 1, self.depth - shape_depth + 1
+        if nx <= 0 or ny <= 0 or nz <= 0:
+            return mask
+
+        # the polycube can only overlap at the positions where its bounding box reaches an occupied block
+        # (see `get_candidate_regions`), so only these regions are checked and all other positions are free
+        mask[:nx, :ny, :nz] = True
+        cubes = polycube.get_cubes().tolist()
+        for (x0, y0, z0), (x1, y1, z1) in self.get_candidate_regions(polycube.shape):
+            # correlate the occupancy of the container with the polycube:
+            # every cube of the polycube shifts the occupancy grid, and a position overlaps
+            # if any of the shifted grids is occupied at that position
+            mx, my, mz = x1 - x0, y1 - y0, z1 - z0
+            occupied = self.matrix[x0:x1 + shape_width - 1, y0:y1 + shape_height - 1, z0:z1 + shape_depth - 1] != 0
+            overlap = np.full((mx, my, mz), False, dtype=bool)
+            for i, j, k in cubes:
+                overlap |= occupied[i:i + mx, j:j + my, k:k + mz]
+            mask[x0:x1, y0:y1, z0:z1] = ~overlap
+
+        # check the constraints for the remaining positions
+        if len(self.constraints) > 0:
+            positions = np.argwhere(mask)
+            rejected = positions[~self.get_constraint_mask(polycube, positions)]
+            mask[rejected[:, 0], rejected[:, 1], rejected[:, 2]] = False
         return mask
 
     def get_dummy_container(self, polycube: Polycube, position: tuple[int, int, int]) -> np.ndarray:
@@ -192,13 +794,73 @@ class Container:
         dummy_container = self.matrix.copy()
 
         # add the polycube to the container
-        shape_width, shape_height, shape_depth = polycube.matrix.shape
-        dummy_container[position[0]:position[0] + shape_width,
-                        position[1]:position[1] + shape_height,
-                        position[2]:position[2] + shape_depth] += polycube.matrix
+        cells = polycube.get_cubes() + np.array(position)
+        dummy_container[cells[:, 0], cells[:, 1], cells[:, 2]] += polycube.id
         
         # apply constraints
         for constraint in self.constraints:
-            constraint.apply(dummy_container)
+            if not constraint.never_mutates:
+                constraint.apply(dummy_container)
         
         return dummy_container
+
+def get_stacked_feasible_positions(containers: list[Container], rotations: list[list[Polycube]]) -> np.ndarray:
+    '''
+    Find the feasible positions of polycubes in many containers (of the same dimensions) at once.
+    The occupancy of the containers is stacked and padded with occupied cells, and all rotations of all polycubes are
+    correlated with it together: every distinct cube offset (over all rotations) shifts the stacked occupancy once, and
+    marks the overlapping positions of all rotations with a cube at that offset. The constraints are then checked per
+    container for the remaining positions. Mask caches are not used.
+
+    Parameters
+    ----------
+        `containers` : `list[Container]`
+            the containers to place the polycubes in.
+        `rotations` : `list[list[Polycube]]`
+            the rotations of the polycube to place in every container.
+
+    Returns
+    -------
+        `np.ndarray` : the feasible positions (format: c, r, x, y, z, with c the index of the container and
+        r the index of the rotation), sorted by container and rotation.
+    '''
+    counts = [len(r) for r in rotations]
+    owners = np.repeat(np.arange(len(containers)), counts)
+    cubes = [rotation.get_cubes() for r in rotations for rotation in r]
+    if len(cubes) == 0:
+        return np.zeros((0, 5), dtype=np.int64)
+
+    # stack the occupancy of the containers, padded with occupied cells (a polycube that sticks out overlaps the padding)
+    width, height, depth = containers[0].get_dimensions()
+    padding = max(int(np.max(c)) for c in cubes)
+    occupancy = np.full((len(containers), width + padding, height + padding, depth + padding), True, dtype=bool)
+    for c, container in enumerate(containers):
+        np.not_equal(container.matrix, 0, out=occupancy[c, :width, :height, :depth])
+
+    # group the cubes of all rotations by their offset (format: rotation, x, y, z)
+    offsets = np.concatenate([np.column_stack((np.full(len(c), r), c)) for r, c in enumerate(cubes)])
+    offsets = offsets[np.lexsort((offsets[:, 0], offsets[:, 3], offsets[:, 2], offsets[:, 1]))]
+    starts = np.flatnonzero(np.any(np.diff(offsets[:, 1:], axis=0, prepend=-1), axis=1))
+
+    # a position overlaps if the occupancy is set at any of the cubes of the rotation
+    overlap = np.full((len(cubes), width, height, depth), False, dtype=bool)
+    for start, end in zip(starts, np.append(starts[1:], len(offsets))):
+        members = offsets[start:end, 0]
+        x, y, z = offsets[start, 1:]
+        overlap[members] |= occupancy[owners[members], x:x + width, y:y + height, z:z + depth]
+
+    # check the constraints for the remaining positions (the positions are sorted by rotation)
+    positions = np.argwhere(~overlap)
+    first = np.cumsum([0] + counts)
+    bounds = np.searchsorted(positions[:, 0], np.arange(len(cubes) + 1))
+    satisfied = np.full(len(positions), True, dtype=bool)
+    for c, container in enumerate(containers):
+        if len(container.constraints) == 0:
+            continue
+        for r, rotation in enumerate(rotations[c]):
+            start, end = bounds[first[c] + r], bounds[first[c] + r + 1]
+            satisfied[start:end] = container.get_constraint_mask(rotation, positions[start:end, 1:])
+
+    # make the rotation index local to its container (format: c, r, x, y, z)
+    c = owners[positions[:, 0]]
+    return np.column_stack((c, positions[:, 0] - first[c], positions[:, 1:]))[satisfied]
@@ -0,0 +1,104 @@
+import numpy as np
+from collections import OrderedDict
+
+class MaskCache:
+
+    def __init__(self, size: int):
+        '''
+        Create a bounded least-recently-used cache of feasible masks.
+        The masks are keyed by the occupancy hash of the container and the rotation shape, so a mask is reused
+        whenever the same shape is checked against the same occupancy (e.g. in repeated episodes or during a search).
+        The (packed) occupancy is stored with every mask, so a different occupancy with the same hash (a collision)
+        is a miss. The memory is bounded by `size` masks of the size of the container (plus an eighth for the occupancy).
+
+        Parameters
+        ----------
+            `size` : int
+                the maximum number of masks in the cache.
+        '''
+        self.size = size
+        self.masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def get(self, key: tuple, occupancy: np.ndarray) -> np.ndarray:
+        '''
+        Get a cached mask.
+
+        Parameters
+        ----------
+            `key` : tuple
+                the key of the mask.
+            `occupancy` : `np.ndarray`
+                the packed occupancy of the container (see `Container.get_packed_occupancy`).
+
+        Returns
+        -------
+            `np.ndarray` : a copy of the mask, or `None` if it is not in the cache (or was cached for another occupancy).
+        '''
+        entry = self.masks.get(key)
+        if entry is None or not np.array_equal(entry[0], occupancy):
+            self.collisions += entry is not None
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.masks.move_to_end(key)
+        return entry[1].copy()
+
+    def put(self, key: tuple, occupancy: np.ndarray, mask: np.ndarray):
+        '''
+        Add a mask to the cache (evicting the least recently used mask when the cache is full).
+
+        Parameters
+        ----------
+            `key` : tuple
+                the key of the mask.
+            `occupancy` : `np.ndarray`
+                the packed occupancy of the container the mask was computed for (not copied, it must not be modified).
+            `mask` : `np.ndarray`
+                the mask (a copy is stored).
+        '''
+        self.masks[key] = (occupancy, mask.copy())
+        self.masks.move_to_end(key)
+        if len(self.masks) > self.size:
+            self.masks.popitem(last=False)
+
+    def clear(self):
+        '''
+        Remove all masks and reset the counters.
+        '''
+        self.masks.clear()
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def get_stats(self) -> dict[str, int]:
+        '''
+        Get the statistics of the cache.
+
+        Returns
+        -------
+            `dict[hits, misses, collisions, size]` : the number of cache hits and misses (of which the number of misses
+            of a key that was cached for another occupancy) and the number of cached masks.
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'collisions': self.collisions, 'size': len(self.masks)}
+
+def get_zobrist_keys(shape: tuple[int, int, int], seed: int=0) -> np.ndarray:
+    '''
+    Get a random 64-bit key for every cell of a container (Zobrist hashing).
+    The hash of an occupancy is the XOR of the keys of the occupied cells, so it can be updated with only the changed cells.
+    The keys only depend on the shape and the seed, so containers of the same size have comparable hashes.
+
+    Parameters
+    ----------
+        `shape` : `tuple[int, int, int]`
+            the dimensions of the container.
+        `seed` : int, optional
+            the seed of the keys.
+
+    Returns
+    -------
+        `np.ndarray` : a `uint64` array with the key of every cell.
+    '''
+    return np.random.default_rng(seed).integers(0, np.iinfo(np.uint64).max, shape, dtype=np.uint64, endpoint=True)
@@ -1,9 +1,12 @@
+import collections
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from overrides import override
 from src.environment import Container
 from src.environment import ShapeGenerator
+from src.environment import ArrivalSource, SequenceArrivals
+from src.environment import Profiler
 from src.environment.shapes import Polycube
 from src.heuristics import Heuristic
 
@@ -14,7 +17,13 @@ class PackingEnv(gym.Env):
             upper_bound: int,
             seq_length: int=100,
             cache_path: str='resources/polycubes',
-            seed: int=None
+            seed: int=None,
+            incremental: bool=False,
+            incremental_size: int=256,
+            height_map: bool=False,
+            generator: ShapeGenerator=None,
+            profile: bool=False,
+            arrivals: ArrivalSource=None
         ):
         '''
         Create a packing environment.
@@ -26,37 +35,65 @@ class PackingEnv(gym.Env):
             `upper_bound` : int
                 an upper bound for the size of the polycubes to pack.
             `seq_length` : int, optional
-                the length of the sequence of polycubes to pack.
+                the length of the sequence of polycubes to pack (ignored if `arrivals` is provided).
             `cache_path` : str, optional
                 the path to the cache of polycubes.
             `seed` : int, optional
                 the seed for the random number generator (used when packing through UI).
+            `incremental` : bool, optional
+                whether to keep the feasible positions of the recently seen rotation shapes between steps and only
+                invalidate the positions blocked by a placement (falls back to a full recompute with constraints).
+                This only pays off when the same rotation shapes arrive again within an episode (e.g. a small upper
+                bound), as every new shape still needs a full mask.
+            `incremental_size` : int, optional
+                the maximum number of rotation shapes that are kept in the incremental state (least recently used first out).
+            `height_map` : bool, optional
+                whether to add the height map of the container to the observation.
+            `generator` : `ShapeGenerator`, optional
+                an existing shape generator to use (e.g. shared between environments), instead of loading the cache again.
+            `profile` : bool, optional
+                whether to record the wall time of the phases of `step`, `reset`, `action_masks` and `get_heuristic_mask`
+                (see `Profiler`). The times of the last step or reset are added to the info dict, and the aggregated
+                statistics are kept in `profiler`.
+            `arrivals` : `ArrivalSource`, optional
+                the source of the polycubes to pack, e.g. a stream of random polycubes (`RandomArrivals`) or a replayed
+                log (`ReplayArrivals`). If not provided, a random sequence of `seq_length` polycubes is drawn at every reset.
         '''
 
         # set the environment variables
         self.container = container
         assert upper_bound <= max(container.get_dimensions()), 'polycubes cannot be larger than the container'
-        self.generator = ShapeGenerator(upper_bound, cache_path)
+        self.generator = ShapeGenerator(upper_bound, cache_path) if generator is None else generator
         self.sequence_length = seq_length
         self.seed = seed
-        self.sequence = None
+        self.arrivals = SequenceArrivals(self.generator, seq_length) if arrivals is None else arrivals
         self.dimensions = container.get_dimensions()
         self.action_space_nvec = np.append([24], self.dimensions)
         self.feasible_positions = None
         self.heuristics = None
         self.heuristics_n = None
         self.obs_cache = None
+        self.incremental = incremental
+        self.incremental_size = incremental_size
+        self.feasible_masks = None
+        self.placements = None
+        self.placement_count = 0
+        self.height_map = height_map
+        self.profiler = Profiler(enabled=profile)
+        self.container.profiler = self.profiler
 
         # the observation space is defined as the combination of the (current) container and the (next) polycube.
         # the container is represented as a binary tensor, where 1 indicates an occupied cell.
         # the polycube is represented as a (padded) binary tensor, where 1 indicates the presence of a cube.
+        # optionally, the height map of the container is added as the height of every (x, z) column.
         # note that this space is only dependent on the size of the container.
-        self.observation_space = spaces.Dict(
-            {
-                'container': spaces.MultiBinary(self.dimensions),
-                'polycube': spaces.MultiBinary(self.dimensions)
-            }
-        )
+        observation_spaces = {
+            'container': spaces.MultiBinary(self.dimensions),
+            'polycube': spaces.MultiBinary(self.dimensions)
+        }
+        if height_map:
+            observation_spaces['height_map'] = spaces.Box(0, self.dimensions[1], (self.dimensions[0], self.dimensions[2]), dtype=np.int64)
+        self.observation_space = spaces.Dict(observation_spaces)
 
         # the action space is defined as the product of the rotation and position of the polycube.
         # e.g. a 5x5x5 container with 24 rotations has an action space of 24 * 5 * 5 * 5 = 3000.
@@ -64,6 +101,11 @@ class PackingEnv(gym.Env):
         # note that this space is only dependent on the size of the container.
         self.action_space = spaces.Discrete(np.prod(self.action_space_nvec))
 
+        # preallocate the observation and action mask buffers (with the dtypes of the spaces), which are filled in place
+        self.obs_buffers = {key: np.zeros(space.shape, dtype=space.dtype) for key, space in self.observation_space.spaces.items()}
+        self.mask_buffer = np.full(np.prod(self.action_space_nvec), False, dtype=bool)
+        self.mask_cached = False
+
     def _get_obs_cache(self) -> dict:
         '''
         Translate the current state of the environment to an observation.
@@ -72,30 +114,47 @@ class PackingEnv(gym.Env):
 
         Returns
         -------
-            `dict[container, polycube]` : the observation of the environment.
+            `dict[container, polycube, (height_map)]` : the observation of the environment.
         '''
         return self.obs_cache
     
     def _get_obs(self) -> dict:
         '''
         Translate the current state of the environment to an observation.
+        The observation is written into preallocated buffers, which are reused in the next step
+        (`reset` and `step` return copies, see `_copy_obs`).
 
         Returns
         -------
-            `dict[container, polycube]` : the observation of the environment.
+            `dict[container, polycube, (height_map)]` : the observation of the environment.
         '''
 
-        # transform the container and polycube to binary tensors
-        binary_container = np.where(self.container.matrix > 0, 1, 0)
-        binary_polycube = np.where(self.get_current_polycube().matrix > 0, 1, 0)
+        # transform the container to a binary tensor
+        np.greater(self.container.matrix, 0, out=self.obs_buffers['container'].view(bool))
+
+        # transform the polycube to a binary tensor, padded to the size of the container (empty when no polycube arrives)
+        self.obs_buffers['polycube'][:] = 0
+        if len(self.arrivals) > 0:
+            cubes = self.get_current_polycube().get_cubes()
+            self.obs_buffers['polycube'][cubes[:, 0], cubes[:, 1], cubes[:, 2]] = 1
 
-        # pad the polycube to the size of the container
-        binary_polycube = np.pad(binary_polycube, [(0, self.dimensions[0] - binary_polycube.shape[0]),
-                                                   (0, self.dimensions[1] - binary_polycube.shape[1]),
-                                                   (0, self.dimensions[2] - binary_polycube.shape[2])])
+        # copy the height map
+        if self.height_map:
+            np.copyto(self.obs_buffers['height_map'], self.container.get_height_map())
 
         # return the observation
-        return {'container': binary_container, 'polycube': binary_polycube}
+        return self.obs_buffers
+
+    def _copy_obs(self) -> dict:
+        '''
+        Copy the cached observation out of the preallocated buffers, so it is not overwritten by the next step or reset
+        (e.g. the terminal observation that a vectorized environment keeps when it resets the environment).
+
+        Returns
+        -------
+            `dict[container, polycube, (height_map)]` : a copy of the observation of the environment.
+        '''
+        return {key: value.copy() for key, value in self._get_obs_cache().items()}
     
     def _get_info(self) -> dict:
         '''
@@ -103,55 +162,125 @@ class PackingEnv(gym.Env):
 
         Returns
         -------
-            `dict` : additional information about the environment.
+            `dict` : additional information about the environment
+            (the wall time of the phases of the last step or reset in ms, when profiling).
         '''
+        if self.profiler.enabled:
+            return {'timing': self.profiler.get_last()}
         return {}
 
     @override
     def reset(self, seed: int=None, options=None):
-        # reset np.random to the correct seed
-        super().reset(seed=seed if seed is not None else self.seed, options=options)
+        self.profiler.clear_last()
+        with self.profiler.section('reset'):
+            # reset np.random to the correct seed
+            super().reset(seed=seed if seed is not None else self.seed, options=options)
+
+            # reset the container
+            self.container.reset()
+
+            # reset the incremental feasibility state
+            self.feasible_masks = collections.OrderedDict()
+            self.placements = collections.deque()
+            self.placement_count = 0
+
+            # start a new stream of polycubes
+            with self.profiler.section('create_sequence'):
+                self.arrivals.reset(self.np_random)
+
+            # set the feasible positions
+            self.feasible_positions = self.find_feasible_positions()
+            self.mask_cached = False
+
+            # update the observation cache
+            with self.profiler.section('get_obs'):
+                self.obs_cache = self._get_obs()
+        
+        # return (a copy of) the current observation
+        return self._copy_obs(), self._get_info()
+
+    @override
+    def step(self, action: int):
+        self.profiler.clear_last()
+        with self.profiler.section('step'):
+            # place the polycube and update the state
+            reward, terminated = self._transition(action)
+
+            # update the observation cache
+            with self.profiler.section('get_obs'):
+                self.obs_cache = self._get_obs()
 
-        # reset the container
-        self.container.reset()
+        # return (a copy of) the next observation, reward, terminated, truncated and info
+        return self._copy_obs(), reward, terminated, False, self._get_info()
+
+    def _transition(self, action: int) -> tuple[int, bool]:
+        '''
+        Perform an action, without computing the next observation.
 
-        # generate a new sequence
-        self.sequence = self.generator.create_sequence(self.sequence_length, rng=self.np_random)
+        Parameters
+        ----------
+            `action` : int
+                the action to perform.
+
+        Returns
+        -------
+            `tuple[int, bool]` : the reward and whether the episode is terminated.
+        '''
+
+        # place the polycube
+        self._place(action)
 
         # set the feasible positions
         self.feasible_positions = self.find_feasible_positions()
+        self.mask_cached = False
+        return self._get_outcome()
 
-        # update the observation cache
-        self.obs_cache = self._get_obs()
-        
-        # return the current observation
-        return self._get_obs_cache(), self._get_info()
+    def _place(self, action: int):
+        '''
+        Place the current polycube in the container, without finding the feasible positions of the next polycube
+        (e.g. when they are found for a batch of environments at once, see `VecPackingEnv`).
+
+        Parameters
+        ----------
+            `action` : int
+                the action to perform.
+        '''
 
-    @override
-    def step(self, action: int):
         # decode the action
         rot, pos = self.decode_action(action)
 
         # get the polycube
-        polycube = self.sequence.pop().get_rotations()[rot]
+        with self.profiler.section('rotations'):
+            polycube = self.arrivals.pop().get_rotations()[rot]
 
         # add the polycube to the container
-        self.container.add(polycube, (pos[0], pos[1], pos[2]))
+        with self.profiler.section('container.add'):
+            added = self.container.add(polycube, (pos[0], pos[1], pos[2]))
+
+        # keep track of the placed cubes for the incremental feasibility state
+        if added and self.incremental:
+            if len(self.container.constraints) > 0:
+                self.feasible_masks.clear() # constraints can move cubes or reject positions anywhere
+            else:
+                self.placements.append(polycube.get_cubes() + np.array(pos))
+                self.placement_count += 1
+
+    def _get_outcome(self) -> tuple[int, bool]:
+        '''
+        Get the reward and whether the episode is terminated, after the feasible positions were set.
 
-        # set the feasible positions
-        self.feasible_positions = self.find_feasible_positions()
+        Returns
+        -------
+            `tuple[int, bool]` : the reward and whether the episode is terminated.
+        '''
 
         # check if the episode is done
         terminated = self.is_terminal()
 
         # get reward
-        reward = 0 if not terminated else len(self.container.get_ids())
-
-        # update the observation cache
-        self.obs_cache = self._get_obs()
-
-        # return the next observation, reward, terminated, truncated and info
-        return self._get_obs_cache(), reward, terminated, False, self._get_info()
+        with self.profiler.section('reward'):
+            reward = 0 if not terminated else self.container.get_shape_count()
+        return reward, terminated
     
     def is_terminal(self) -> bool:
         '''
@@ -162,8 +291,8 @@ class PackingEnv(gym.Env):
             bool : True if the state is terminal, False otherwise.
         '''
 
-        # the state is terminal if the sequence is empty or no feasible positions are available
-        return len(self.sequence) == 0 or len(self.feasible_positions) == 0
+        # the state is terminal if no polycube arrives or no feasible positions are available
+        return len(self.arrivals) == 0 or len(self.feasible_positions) == 0
     
     def get_current_polycube(self) -> Polycube:
         '''
@@ -173,8 +302,23 @@ class PackingEnv(gym.Env):
         -------
             `Polycube` : the current polycube to pack.
         '''
-        return self.sequence[-1]
-    
+        return self.arrivals.get_current()
+
+    def get_upcoming_polycubes(self, n: int) -> list[Polycube]:
+        '''
+        Get the next polycubes to pack (e.g. for a lookahead search).
+
+        Parameters
+        ----------
+            `n` : int
+                the (maximum) number of polycubes to get (at most the lookahead of the arrivals).
+
+        Returns
+        -------
+            `list[Polycube]` : the current polycube followed by the next polycubes, in the order in which they are packed.
+        '''
+        return self.arrivals.peek(n)
+
     def decode_action(self, action: int) -> tuple[int, tuple[int, int, int]]:
         '''
         Decode the action to a rotation and position of the polycube.
@@ -213,6 +357,21 @@ class PackingEnv(gym.Env):
 
         # encode the rotation and position of the polycube
         return np.ravel_multi_index([rot, pos[0], pos[1], pos[2]], self.action_space_nvec)
+
+    def encode_actions(self, positions: np.ndarray) -> np.ndarray:
+        '''
+        Encode many rotations and positions of the polycube to actions at once.
+
+        Parameters
+        ----------
+            `positions` : `np.ndarray`
+                the rotations and positions of the polycube (format: r, x, y, z).
+
+        Returns
+        -------
+            `np.ndarray` : the actions.
+        '''
+        return np.ravel_multi_index(np.asarray(positions, dtype=np.int64).reshape(-1, 4).T, self.action_space_nvec)
     
     def find_feasible_positions(self) -> list[tuple[int, int, int, int]]:
         '''
@@ -223,15 +382,76 @@ class PackingEnv(gym.Env):
             `list[tuple[int, int, int, int]]` : the feasible positions for the current polycube (format: r, x, y, z).
         '''
 
-        # get all rotations of the current polycube
-        rotations = self.get_current_polycube().get_rotations()
+        with self.profiler.section('find_feasible_positions'):
+            # there are no positions when no polycube arrives
+            if len(self.arrivals) == 0:
+                return np.zeros((0, 4), dtype=np.int64)
+
+            # get all rotations of the current polycube
+            with self.profiler.section('rotations'):
+                rotations = self.get_current_polycube().get_rotations()
+
+            # get all feasible positions for the current polycube (format: r, x, y, z)
+            if self.incremental:
+                positions = np.argwhere(np.array([self.get_feasible_mask(r) for r in rotations]))
+                self.trim_placements()
+                return positions
+            return np.argwhere(np.array([self.container.get_feasible_mask(r) for r in rotations]))
+
+    def get_feasible_mask(self, polycube: Polycube) -> np.ndarray:
+        '''
+        Get a mask of the container where the polycube can fit, using the incremental feasibility state.
+        The mask of a rotation shape is computed in full the first time it is seen (or after it was evicted, see
+        `incremental_size`), after which only the positions that are blocked by the cubes placed since the last
+        request are removed from it.
+
+        Parameters
+        ----------
+            `polycube` : `Polycube`
+                the polycube to be checked (locked rotation).
 
-        # get all feasible positions for the current polycube (format: r, x, y, z)
-        return np.argwhere(np.array([self.container.get_feasible_mask(r) for r in rotations]))
+        Returns
+        -------
+            `np.ndarray` : a 3D mask of the container where the shape can fit.
+        '''
+
+        # look up the state of the rotation shape
+        key = (polycube.shape, polycube.get_cubes().tobytes())
+        state = self.feasible_masks.get(key)
+
+        # compute the full mask the first time the shape is seen (evicting the least recently used shape)
+        if state is None:
+            state = [polycube.get_cubes(), self.container.get_feasible_mask(polycube), self.placement_count]
+            self.feasible_masks[key] = state
+            if len(self.feasible_masks) > self.incremental_size:
+                self.feasible_masks.popitem(last=False)
+            return state[1]
+        self.feasible_masks.move_to_end(key)
+
+        # remove the positions where a cube of the shape would overlap with a cube placed since the last request
+        # (the placements are numbered from the start of the episode, the log only keeps the most recent ones)
+        offsets, mask, version = state
+        if version < self.placement_count:
+            start = version - (self.placement_count - len(self.placements))
+            cubes = np.concatenate([self.placements[i] for i in range(start, len(self.placements))])
+            positions = (cubes[:, None, :] - offsets[None, :, :]).reshape(-1, 3)
+            positions = positions[np.all((positions >= 0) & (positions < self.dimensions), axis=1)]
+            mask[positions[:, 0], positions[:, 1], positions[:, 2]] = False
+            state[2] = self.placement_count
+        return mask
+
+    def trim_placements(self):
+        '''
+        Remove the placements from the log that every rotation shape in the incremental feasibility state has consumed.
+        '''
+        oldest = min((state[2] for state in self.feasible_masks.values()), default=self.placement_count)
+        for _ in range(oldest - (self.placement_count - len(self.placements))):
+            self.placements.popleft()
     
     def action_masks(self) -> list[bool]:
         '''
         Get the action masks for the current state of the environment.
+        The mask is computed once per state and cached in a preallocated buffer (which should not be modified).
 
         Returns
         -------
@@ -242,13 +462,18 @@ class PackingEnv(gym.Env):
         if self.heuristics is not None:
             return self.get_heuristic_mask()
 
-        # create the action mask
-        action_mask = np.full(np.prod(self.action_space_nvec), False, dtype=bool)
-        for pos in self.feasible_positions: # encode the positions as a single number
-            action_mask[self.encode_action(pos[0], (pos[1], pos[2], pos[3]))] = True
-        
+        # return the cached mask if the state did not change
+        if self.mask_cached:
+            return self.mask_buffer
+
+        # create the action mask (in the preallocated buffer), encoding all positions at once
+        with self.profiler.section('action_masks'):
+            self.mask_buffer[:] = False
+            self.mask_buffer[self.encode_actions(self.feasible_positions)] = True
+            self.mask_cached = True
+
         # return the action mask
-        return action_mask
+        return self.mask_buffer
     
     def set_heuristics(self, heuristics: list[Heuristic], n: int):
         '''
@@ -264,38 +489,42 @@ class PackingEnv(gym.Env):
         '''
         self.heuristics = heuristics
         self.heuristics_n = n
+        self.mask_cached = False
     
     def get_heuristic_mask(self) -> list[bool]:
         '''
         Get the heuristic mask for the current state of the environment.
+        The mask is computed once per state and cached in a preallocated buffer (which should not be modified).
 
         Returns
         -------
             `list[bool]` : the heuristic mask for the current state of the environment (True if the action is valid).
         '''
 
-        # create the heuristic mask
-        heuristic_mask = np.full(np.prod(self.action_space_nvec), False, dtype=bool)
+        # return the cached mask if the state did not change
+        if self.mask_cached:
+            return self.mask_buffer
 
-        # get all rotations of the current polycube
-        rotations = self.get_current_polycube().get_rotations()
+        with self.profiler.section('get_heuristic_mask'):
+            # get all rotations of the current polycube
+            rotations = self.get_current_polycube().get_rotations()
 
-        # create score table for heuristics
-        scores = np.zeros((len(self.heuristics), len(self.feasible_positions)))
+            # create score table for heuristics
+            scores = np.zeros((len(self.heuristics), len(self.feasible_positions)))
 
-        # get the scores for every feasible position
-        for j, (r, x, y, z) in enumerate(self.feasible_positions):
-            for i, h in enumerate(self.heuristics):
-                scores[i, j] = h.get_score(self.container.get_dummy_container(rotations[r], (x, y, z)))
+            # get the scores for every feasible position
+            with self.profiler.section('heuristics'):
+                for i, h in enumerate(self.heuristics):
+                    scores[i] = h.get_scores(self.container, rotations, self.feasible_positions)
 
-        # average the scores
-        avg_scores = np.average(scores, axis=0)
+            # average the scores
+            avg_scores = np.average(scores, axis=0)
 
-        # get the best positions
-        sorted_feasible_positions = np.argsort(avg_scores)[-self.heuristics_n:]
-        for p in sorted_feasible_positions:
-            pos = self.feasible_positions[p]
-            heuristic_mask[self.encode_action(pos[0], (pos[1], pos[2], pos[3]))] = True
+            # get the best positions and encode them at once (in the preallocated buffer)
+            sorted_feasible_positions = np.argsort(avg_scores)[-self.heuristics_n:]
+            self.mask_buffer[:] = False
+            self.mask_buffer[self.encode_actions(self.feasible_positions[sorted_feasible_positions])] = True
+            self.mask_cached = True
 
         # return the heuristic mask
-        return heuristic_mask
+        return self.mask_buffer
@@ -0,0 +1,146 @@
+import json
+import time
+import contextlib
+
+class Profiler:
+
+    def __init__(self, enabled: bool=True):
+        '''
+        Create a profiler that records the wall time and number of calls of named phases.
+        Phases are timed with `with profiler.section(name): ...`, and can be nested (the times are inclusive).
+        A disabled profiler returns a shared no-op context, so instrumented code has (almost) no overhead.
+
+        Parameters
+        ----------
+            `enabled` : bool, optional
+                whether the phases are recorded.
+        '''
+        self.enabled = enabled
+        self.calls = {}
+        self.times = {}
+        self.last = {}
+
+    def section(self, name: str):
+        '''
+        Get a context manager that times a phase.
+
+        Parameters
+        ----------
+            `name` : str
+                the name of the phase.
+
+        Returns
+        -------
+            a context manager that records the phase when it exits.
+        '''
+        if not self.enabled:
+            return NULL_SECTION
+        return Section(self, name)
+
+    def record(self, name: str, seconds: float):
+        '''
+        Record a single call of a phase.
+
+        Parameters
+        ----------
+            `name` : str
+                the name of the phase.
+            `seconds` : float
+                the wall time of the call in seconds.
+        '''
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.last[name] = self.last.get(name, 0.0) + seconds
+
+    def clear_last(self):
+        '''
+        Clear the times of the last operation (see `get_last`).
+        '''
+        self.last = {}
+
+    def get_last(self) -> dict[str, float]:
+        '''
+        Get the time spent in every phase since the last call to `clear_last` (e.g. during the last step).
+
+        Returns
+        -------
+            `dict[str, float]` : the wall time of every phase in milliseconds.
+        '''
+        return {name: seconds * 1e3 for name, seconds in self.last.items()}
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        '''
+        Get the aggregated statistics of every phase.
+
+        Returns
+        -------
+            `dict[str, dict[str, float]]` : the number of calls, the total wall time (ms)
+            and the mean wall time (ms) of every phase.
+        '''
+        return {name: {'calls': self.calls[name],
+                       'total_ms': self.times[name] * 1e3,
+                       'mean_ms': self.times[name] * 1e3 / self.calls[name]} for name in self.calls}
+
+    def reset(self):
+        '''
+        Reset all recorded statistics.
+        '''
+        self.calls = {}
+        self.times = {}
+        self.last = {}
+
+    def dump(self, path: str=None) -> str:
+        '''
+        Dump the aggregated statistics as JSON.
+
+        Parameters
+        ----------
+            `path` : str, optional
+                a file to write the statistics to.
+
+        Returns
+        -------
+            str : the statistics as a JSON string.
+        '''
+        stats = json.dumps(self.get_stats(), indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(stats)
+        return stats
+
+    def __str__(self) -> str:
+        lines = [f'{"phase":>32} {"calls":>8} {"total (ms)":>12} {"mean (ms)":>10}']
+        for name, stats in sorted(self.get_stats().items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f'{name:>32} {stats["calls"]:>8} {stats["total_ms"]:>12.3f} {stats["mean_ms"]:>10.4f}')
+        return '\n'.join(lines)
+
+class Section:
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: Profiler, name: str):
+        '''
+        Create a context manager that records the wall time of a phase.
+
+        Parameters
+        ----------
+            `profiler` : `Profiler`
+                the profiler to record the phase in.
+            `name` : str
+                the name of the phase.
+        '''
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+# the (reusable) context of a disabled profiler
+NULL_SECTION = contextlib.nullcontext()
+
+# the profiler of objects that are not profiled
+DISABLED = Profiler(enabled=False)
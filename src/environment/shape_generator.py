@@ -1,7 +1,15 @@
 import os
-import json
+import warnings
+import functools
 import numpy as np
-from src.environment.shapes import Polycube
+from src.environment import cache
+from src.environment.shapes import Polycube, get_unique_rotations
+
+# the maximum number of polycubes for which the decoded rotations are kept
+ROTATION_CACHE_SIZE = 4096
+
+# the number of polycubes of which the rotations are computed (and kept in memory) at once (see `build_rotation_table`)
+ROTATION_CHUNK_SIZE = 65536
 
 class ShapeGenerator:
 
@@ -22,22 +30,233 @@ class ShapeGenerator:
         assert upper_bound <= 10, "The maximum size of the polycube is 10."
         self.upper_bound = upper_bound
 
-        # empty list to store the polycubes
-        self.polycubes = np.array([])
+        # empty lists to store the polycube and rotation tables (one per cache file) and the index of their first polycube
+        self.tables = []
+        self.rotation_tables = []
+        self.starts = []
+        self.size = 0
 
-        while upper_bound >= 3:
-            # check if the cache exist
-            path = os.path.join(cache_path, f'cubes_{upper_bound}.npy')
-            assert os.path.exists(path), "cache was not found."
+        # the decoded rotations of the most recently drawn polycubes (shared, the arrays are never modified)
+        self.rotation_cache = {}
 
+        while upper_bound >= 3:
             # load the cache (source: https://github.com/mikepound/cubes)
             print(f"\rLoading polycubes n={upper_bound} from cache: ", end = "")
-            self.polycubes = np.concatenate((self.polycubes, np.load(path, allow_pickle=True)))
-            print(f"{len(self.polycubes)} shapes")
+            table = self.load_table(cache_path, upper_bound)
+            self.tables.append(table)
+            self.starts.append(self.size)
+            self.size += len(table['dims'])
+            print(f"{self.size} shapes")
+
+            # load the rotation table (built once and stored next to the cache, see `build_rotation_table`)
+            self.rotation_tables.append(self.load_rotation_table(cache_path, upper_bound, table))
 
             # decrement the upper bound
             upper_bound -= 1
 
+    def __len__(self) -> int:
+        '''
+        Get the number of polycubes in the cache.
+
+        Returns
+        -------
+            int : the number of polycubes.
+        '''
+        return self.size
+
+    @staticmethod
+    def convert_cache(cache_path: str, n: int) -> dict[str, np.ndarray]:
+        '''
+        Convert the (pickled) cache file `cubes_{n}.npy` to a flat, memory-mappable format.
+        The polycubes are stored as packed bits with a header of dimensions and offsets (as `cubes_{n}.*.npy`).
+        If the cache directory cannot be written (e.g. a read-only or shared cache), the table is only kept in memory.
+
+        Parameters
+        ----------
+            `cache_path` : str
+                the path to the cache of polycubes.
+            `n` : int
+                the size of the polycubes.
+
+        Returns
+        -------
+            `dict[str, np.ndarray]` : the packed polycubes (see `cache.pack`).
+        '''
+
+        # check if the cache exist
+        path = os.path.join(cache_path, f'cubes_{n}')
+        assert os.path.exists(f'{path}.npy'), "cache was not found."
+
+        # pack the polycubes and save them next to the cache (if possible)
+        table = cache.pack(np.load(f'{path}.npy', allow_pickle=True))
+        if os.access(cache_path, os.W_OK):
+            try:
+                cache.save(path, table)
+            except OSError:
+                pass
+        return table
+
+    @staticmethod
+    def load_table(cache_path: str, n: int) -> dict[str, np.ndarray]:
+        '''
+        Load the (memory-mapped) table with all polycubes of size `n`.
+        If the cache was not converted yet, or `cubes_{n}.npy` was modified after it was converted, it is converted
+        first (see `convert_cache`).
+
+        Parameters
+        ----------
+            `cache_path` : str
+                the path to the cache of polycubes.
+            `n` : int
+                the size of the polycubes.
+
+        Returns
+        -------
+            `dict[str, np.ndarray]` : the packed polycubes (see `cache.pack`).
+        '''
+        path = os.path.join(cache_path, f'cubes_{n}')
+        table = cache.load(path, ['dims', 'offsets', 'bits'], source=f'{path}.npy')
+        if table is None:
+            table = ShapeGenerator.convert_cache(cache_path, n)
+        return table
+
+    @staticmethod
+    def load_rotation_table(cache_path: str, n: int, table: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        '''
+        Load the table with the unique rotations of all polycubes of size `n` (see `build_rotation_table`).
+        The table is never computed here: if it was not built (or `cubes_{n}.npy` was modified after it was built),
+        a warning is given and the rotations are computed per polycube when it is drawn instead (see `get_rotations`).
+
+        Parameters
+        ----------
+            `cache_path` : str
+                the path to the cache of polycubes.
+            `n` : int
+                the size of the polycubes.
+            `table` : `dict[str, np.ndarray]`
+                the packed polycubes of size `n` (see `load_table`).
+
+        Returns
+        -------
+            `dict[str, np.ndarray]` : the packed rotations (see `cache.pack`), with an additional
+            `index` array that holds the position of the first rotation of every polycube (plus the end),
+            or `None` if the table was not built.
+        '''
+        path = os.path.join(cache_path, f'rotations_{n}')
+        rotation_table = cache.load(path, ['dims', 'offsets', 'bits', 'index'], source=os.path.join(cache_path, f'cubes_{n}.npy'))
+        if rotation_table is None or len(rotation_table['index']) != len(table['dims']) + 1:
+            warnings.warn(f"The rotation table n={n} in {cache_path} was not built (or is stale), the rotations are "
+                          f"computed per polycube (build the table with `python -m src.environment`).", stacklevel=3)
+            return None
+        return rotation_table
+
+    @staticmethod
+    def build_rotation_table(cache_path: str, n: int) -> dict[str, np.ndarray]:
+        '''
+        Compute the table with the unique rotations of all polycubes of size `n`, and save it next to the cache
+        (as `rotations_{n}.*.npy`). This is done once, offline (e.g. with `python -m src.environment`), after which
+        every `ShapeGenerator` memory-maps the table (see `load_rotation_table`). The rotations are computed and
+        written to disk in chunks of `ROTATION_CHUNK_SIZE` polycubes (see `cache.Writer`), so the table is never
+        kept in memory as a whole.
+
+        Parameters
+        ----------
+            `cache_path` : str
+                the path to the cache of polycubes (which must be writable).
+            `n` : int
+                the size of the polycubes.
+
+        Returns
+        -------
+            `dict[str, np.ndarray]` : the (memory-mapped) packed rotations (see `load_rotation_table`).
+        '''
+        table = ShapeGenerator.load_table(cache_path, n)
+        count = len(table['dims'])
+        path = os.path.join(cache_path, f'rotations_{n}')
+        print(f"Computing rotations n={n}: ", end = "")
+
+        with cache.Writer(path) as writer:
+            # the offsets and the index start at zero, every chunk continues after the previous one
+            writer.append({'dims': np.zeros((0, 3), dtype=np.uint8), 'offsets': np.zeros(1, dtype=np.int64),
+                           'bits': np.zeros(0, dtype=np.uint8), 'index': np.zeros(1, dtype=np.int64)})
+            total_rotations, total_bytes = 0, 0
+            for start in range(0, count, ROTATION_CHUNK_SIZE):
+                # compute and pack the unique rotations of the polycubes in the chunk
+                rotations = [get_unique_rotations(cache.unpack(table, i)) for i in range(start, min(start + ROTATION_CHUNK_SIZE, count))]
+                packed = cache.pack([r for rot in rotations for r in rot])
+                writer.append({'dims': packed['dims'], 'offsets': packed['offsets'][1:] + total_bytes, 'bits': packed['bits'],
+                               'index': total_rotations + np.cumsum([len(rot) for rot in rotations], dtype=np.int64)})
+                total_rotations += len(packed['dims'])
+                total_bytes += len(packed['bits'])
+        print(f"{total_rotations} rotations")
+        return cache.load(path, ['dims', 'offsets', 'bits', 'index'])
+
+    def find_table(self, idx: int) -> tuple[int, int]:
+        '''
+        Find the table that contains a polycube.
+
+        Parameters
+        ----------
+            `idx` : int
+                the index of the polycube.
+
+        Returns
+        -------
+            `tuple[int, int]` : the index of the table and the index of the polycube within that table.
+        '''
+        t = np.searchsorted(self.starts, idx, side='right') - 1
+        return t, idx - self.starts[t]
+
+    def get_matrix(self, idx: int) -> np.ndarray:
+        '''
+        Get the (binary) matrix of a polycube.
+        Only this polycube is decoded from the cache.
+
+        Parameters
+        ----------
+            `idx` : int
+                the index of the polycube.
+
+        Returns
+        -------
+            `np.ndarray` : the binary matrix of the polycube.
+        '''
+        t, i = self.find_table(idx)
+        return cache.unpack(self.tables[t], i)
+
+    def get_rotations(self, idx: int) -> list[np.ndarray]:
+        '''
+        Get the precomputed unique rotations of a polycube (computed here if there is no rotation table, see `load_rotation_table`).
+
+        Parameters
+        ----------
+            `idx` : int
+                the index of the polycube.
+
+        Returns
+        -------
+            `list[np.ndarray]` : the binary unique rotations of the polycube, see `get_unique_rotations`.
+        '''
+
+        # look up the rotations if they were decoded recently
+        rotations = self.rotation_cache.get(idx)
+        if rotations is not None:
+            return rotations
+
+        # find the table that contains the polycube
+        t, i = self.find_table(idx)
+        table = self.rotation_tables[t]
+
+        # unpack the rotations, or compute them if there is no table (and keep them, evicting the oldest entry when the cache is full)
+        if table is None:
+            rotations = get_unique_rotations(cache.unpack(self.tables[t], i))
+        else:
+            rotations = [cache.unpack(table, r) for r in range(table['index'][i], table['index'][i + 1])]
+        if len(self.rotation_cache) >= ROTATION_CACHE_SIZE:
+            del self.rotation_cache[next(iter(self.rotation_cache))]
+        self.rotation_cache[idx] = rotations
+        return rotations
+
     def get_random_polycube(self, idx: int=None, rng: np.random.Generator=None) -> Polycube:
         '''
         Get a random polycube.
@@ -58,12 +277,13 @@ class ShapeGenerator:
         if idx is None:
             # get a random index
             if rng is not None:
-                idx = rng.integers(0, len(self.polycubes))
+                idx = rng.integers(0, len(self))
             else:
-                idx = np.random.randint(0, len(self.polycubes))
+                idx = np.random.randint(0, len(self))
 
-        # get the corresponding polycube
-        return Polycube(self.polycubes[idx] * (idx + 1))
+        # get the corresponding polycube (only the coordinates of its cubes are kept)
+        matrix = self.get_matrix(idx)
+        return Polycube.from_cubes(np.argwhere(matrix), matrix.shape, int(idx) + 1, rotations=functools.partial(self.get_rotations, idx))
     
     def create_sequence(self, length: int, rng: np.random.Generator=None) -> list[Polycube]:
         '''
@@ -1,73 +1,251 @@
 import numpy as np
+from typing import Callable
+
+# source: https://stackoverflow.com/a/33190472
+def rotations24(polycube: np.ndarray):
+    """List all 24 rotations of the given 3d array."""
+    def rotations4(polycube, axes):
+        """List the four rotations of the given 3d array in the plane spanned by the given axes."""
+        for i in range(4):
+            yield np.rot90(polycube, i, axes)
+
+    # imagine shape is pointing in axis 0 (up)
+
+    # 4 rotations about axis 0
+    yield from rotations4(polycube, (1,2))
+
+    # rotate 180 about axis 1, now shape is pointing down in axis 0
+    # 4 rotations about axis 0
+    yield from rotations4(np.rot90(polycube, 2, axes=(0,2)), (1,2))
+
+    # rotate 90 or 270 about axis 1, now shape is pointing in axis 2
+    # 8 rotations about axis 2
+    yield from rotations4(np.rot90(polycube, axes=(0,2)), (0,1))
+    yield from rotations4(np.rot90(polycube, -1, axes=(0,2)), (0,1))
+
+    # rotate about axis 2, now shape is pointing in axis 1
+    # 8 rotations about axis 1
+    yield from rotations4(np.rot90(polycube, axes=(0,1)), (0,2))
+    yield from rotations4(np.rot90(polycube, -1, axes=(0,1)), (0,2))
+
+def get_rotation_matrices() -> np.ndarray:
+    '''
+    Get the 24 rotations of `rotations24` as integer matrices (in the same order).
+    The matrices are derived by rotating a probe array with a distinct value in every cell, and
+    matching the coordinates of every cell before and after the rotation.
+
+    Returns
+    -------
+        `np.ndarray` : a (24, 3, 3) array with the rotation matrices (new coordinates = matrix @ old coordinates + offset).
+    '''
+    probe = np.arange(2 * 3 * 4).reshape(2, 3, 4)
+    matrices = []
+    for rotation in rotations24(probe):
+        new = np.argwhere(np.ones(rotation.shape, dtype=bool))
+        old = np.column_stack(np.unravel_index(rotation.ravel(), probe.shape))
+        matrix = np.linalg.lstsq(old - old[0], new - new[0], rcond=None)[0].T
+        matrices.append(np.rint(matrix).astype(np.int64))
+    return np.array(matrices)
+
+# the 24 rotations (in the order of `rotations24`, which the action space depends on)
+ROTATION_MATRICES = get_rotation_matrices()
+
+def rotate_cubes(cubes: np.ndarray, shape: tuple[int, int, int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Get all 24 rotations of a set of cubes at once, with one batched matrix multiplication.
+    Every rotation is moved back into the positive octant (like `np.rot90` does with the bounding box),
+    and its cubes are sorted in the order of `np.argwhere`.
+
+    Parameters
+    ----------
+        `cubes` : `np.ndarray`
+            an (N, 3) array with the coordinates of the cubes (format: x, y, z).
+        `shape` : `tuple[int, int, int]`
+            the dimensions of the bounding box of the cubes.
+
+    Returns
+    -------
+        `tuple[np.ndarray, np.ndarray, np.ndarray]` : a (24, N, 3) array with the rotated cubes, a (24, 3) array
+        with the rotated bounding boxes, and a (24, N) array with the index of the original cube of every rotated cube.
+    '''
+
+    # rotate the cubes, and shift them by the (rotated) corner of the bounding box that ends up at the origin
+    size = np.array(shape) - 1
+    offsets = -np.sum(np.minimum(ROTATION_MATRICES * size[None, None, :], 0), axis=2)
+    rotated = np.einsum('kij,nj->kni', ROTATION_MATRICES, cubes) + offsets[:, None, :]
+    shapes = np.abs(ROTATION_MATRICES) @ np.array(shape)
+
+    # sort the cubes of every rotation by their (flat) index
+    keys = (rotated[:, :, 0] * shapes[:, 1, None] + rotated[:, :, 1]) * shapes[:, 2, None] + rotated[:, :, 2]
+    order = np.argsort(keys, axis=1)
+    return np.take_along_axis(rotated, order[:, :, None], axis=1), shapes, order
+
+def get_unique_rotation_cubes(cubes: np.ndarray, shape: tuple[int, int, int]) -> list[tuple[np.ndarray, tuple[int, int, int]]]:
+    '''
+    Get all the unique rotations of a set of cubes.
+    Duplicate rotations are removed by their canonical form (the bounding box and the sorted cubes),
+    keeping the first occurrence, so the order is the same as `get_unique_rotations`.
+
+    Parameters
+    ----------
+        `cubes` : `np.ndarray`
+            an (N, 3) array with the coordinates of the cubes (format: x, y, z).
+        `shape` : `tuple[int, int, int]`
+            the dimensions of the bounding box of the cubes.
+
+    Returns
+    -------
+        `list[tuple[np.ndarray, tuple[int, int, int]]]` : the cubes and the bounding box of every unique rotation.
+    '''
+    rotated, shapes, _ = rotate_cubes(cubes, shape)
+    unique, seen = [], set()
+    for cubes, shape in zip(rotated, shapes):
+        key = (tuple(shape.tolist()), cubes.tobytes())
+        if key not in seen:
+            seen.add(key)
+            unique.append((cubes.astype(np.int16), key[0]))
+    return unique
+
+def get_unique_rotations(matrix: np.ndarray) -> list[np.ndarray]:
+    '''
+    Get all the unique rotations of a matrix.
+    The order of the rotations is fixed, as the action space depends on it.
+
+    Parameters
+    ----------
+        `matrix` : `np.ndarray`
+            the matrix to rotate.
+
+    Returns
+    -------
+        `list[np.ndarray]` : all unique rotations of the matrix.
+    '''
+
+    # rotate the cubes of the matrix
+    cubes = np.argwhere(matrix)
+    rotated, shapes, order = rotate_cubes(cubes, matrix.shape)
+    values = matrix[cubes[:, 0], cubes[:, 1], cubes[:, 2]]
+
+    # remove duplicates (by their canonical form) and create the matrices of the unique rotations
+    unique, seen = [], set()
+    for k in range(len(rotated)):
+        key = (tuple(shapes[k].tolist()), rotated[k].tobytes(), values[order[k]].tobytes())
+        if key not in seen:
+            seen.add(key)
+            rotation = np.zeros(key[0], dtype=matrix.dtype)
+            rotation[rotated[k, :, 0], rotated[k, :, 1], rotated[k, :, 2]] = values[order[k]]
+            unique.append(rotation)
+    return unique
 
 class Polycube:
+
+    __slots__ = ('cubes', 'shape', 'id', 'rotations', 'dense')
     
-    def __init__(self, matrix: np.ndarray):
+    def __init__(self, matrix: np.ndarray, rotations: list[np.ndarray] | Callable[[], list[np.ndarray]]=None):
         '''
         Create a [polycube](https://en.wikipedia.org/wiki/Polycube) object.
+        A polycube is stored as the coordinates of its cubes, the dimensions of its bounding box and its id.
+        The (dense) matrix is only created when it is needed, see `matrix` (a polycube created from a matrix keeps it).
         
         Parameters
         ----------
             `matrix` : `np.ndarray`
-                the matrix of the polycube.
+                the matrix of the polycube (the cubes are the non-zero cells, the id is the maximum value).
+            `rotations` : `list[np.ndarray]` or `Callable[[], list[np.ndarray]]`, optional
+                the precomputed (binary) unique rotations of the polycube, see `get_unique_rotations`,
+                or a function that returns them (called the first time the rotations are needed).
         '''
         
         # set the polycube
-        self.matrix = matrix
+        self.cubes = np.argwhere(matrix).astype(np.int16)
+        self.shape = matrix.shape
         self.id = np.amax(matrix).astype(int)
+        self.rotations = rotations
+        self.dense = matrix
+
+    @classmethod
+    def from_cubes(
+            cls,
+            cubes: np.ndarray,
+            shape: tuple[int, int, int],
+            id: int,
+            rotations: list[np.ndarray] | Callable[[], list[np.ndarray]]=None
+        ) -> 'Polycube':
+        '''
+        Create a polycube from the coordinates of its cubes, without a matrix.
+
+        Parameters
+        ----------
+            `cubes` : `np.ndarray`
+                an (N, 3) array with the coordinates of the cubes (format: x, y, z).
+            `shape` : `tuple[int, int, int]`
+                the dimensions of the bounding box of the polycube.
+            `id` : int
+                the id of the polycube.
+            `rotations` : `list[np.ndarray]` or `Callable[[], list[np.ndarray]]`, optional
+                the unique rotations of the polycube, see `__init__`.
+
+        Returns
+        -------
+            `Polycube` : the polycube.
+        '''
+        polycube = cls.__new__(cls)
+        polycube.cubes = np.asarray(cubes, dtype=np.int16)
+        polycube.shape = tuple(shape)
+        polycube.id = id
+        polycube.rotations = rotations
+        polycube.dense = None
+        return polycube
+
+    @property
+    def matrix(self) -> np.ndarray:
+        '''
+        The matrix of the polycube, with the id in the cells of the cubes.
+        The matrix is created the first time it is needed, and kept up to date by `increment_id` afterwards.
+        '''
+        if self.dense is None:
+            self.dense = np.zeros(self.shape, dtype=int)
+            self.dense[self.cubes[:, 0], self.cubes[:, 1], self.cubes[:, 2]] = self.id
+        return self.dense
 
-    def increment_id(self):
+    def increment_id(self, amount: int=1):
         '''
         Increment the id of the polycube.
+
+        Parameters
+        ----------
+            `amount` : int, optional
+                the value to add to the id.
         '''
         
-        # add the value to the matrix and the id
-        self.matrix[self.matrix != 0] += 1
-        self.id += 1
+        # add the value to the id (and to the matrix, if it was created)
+        self.id += amount
+        if self.dense is not None:
+            self.dense[self.cubes[:, 0], self.cubes[:, 1], self.cubes[:, 2]] = self.id
+
+    def get_cubes(self) -> np.ndarray:
+        '''
+        Get the coordinates of the cubes of the polycube.
+
+        Returns
+        -------
+            `np.ndarray` : an (N, 3) array with the coordinates of the cubes (format: x, y, z).
+        '''
+        return self.cubes
 
-    def get_rotations(self) -> list[np.ndarray]:
+    def get_rotations(self) -> list['Polycube']:
         '''
         Get all the unique rotations of the polycube.
 
         Returns
         -------
-            `list[np.ndarray]` : 4-dimensional array
-                all unique rotations of the polycube.
+            `list[Polycube]` : all unique rotations of the polycube (with the same id).
         '''
 
-        # source: https://stackoverflow.com/a/33190472
-        def rotations24(polycube):
-            """List all 24 rotations of the given 3d array."""
-            def rotations4(polycube, axes):
-                """List the four rotations of the given 3d array in the plane spanned by the given axes."""
-                for i in range(4):
-                    yield np.rot90(polycube, i, axes)
-
-            # imagine shape is pointing in axis 0 (up)
-
-            # 4 rotations about axis 0
-            yield from rotations4(polycube, (1,2))
-
-            # rotate 180 about axis 1, now shape is pointing down in axis 0
-            # 4 rotations about axis 0
-            yield from rotations4(np.rot90(polycube, 2, axes=(0,2)), (1,2))
-
-            # rotate 90 or 270 about axis 1, now shape is pointing in axis 2
-            # 8 rotations about axis 2
-            yield from rotations4(np.rot90(polycube, axes=(0,2)), (0,1))
-            yield from rotations4(np.rot90(polycube, -1, axes=(0,2)), (0,1))
-
-            # rotate about axis 2, now shape is pointing in axis 1
-            # 8 rotations about axis 1
-            yield from rotations4(np.rot90(polycube, axes=(0,1)), (0,2))
-            yield from rotations4(np.rot90(polycube, -1, axes=(0,1)), (0,2))
-
-        # get the rotations
-        rot = list(rotations24(self.matrix))
-
-        # remove duplicates
-        unique = []
-        for r in rot:
-            if not any(np.array_equal(r, u.matrix) for u in unique):
-                unique.append(Polycube(r))
-        return unique
+        # get the cubes of the rotations (looked up if they were precomputed), which are kept on the polycube
+        if self.rotations is None:
+            self.rotations = get_unique_rotation_cubes(self.cubes, self.shape)
+        elif callable(self.rotations) or isinstance(self.rotations[0], np.ndarray):
+            rotations = self.rotations() if callable(self.rotations) else self.rotations
+            self.rotations = [(np.argwhere(r).astype(np.int16), r.shape) for r in rotations]
+        return [Polycube.from_cubes(cubes, shape, self.id) for cubes, shape in self.rotations]
@@ -0,0 +1,267 @@
+import copy
+from typing import Any
+import gymnasium as gym
+import numpy as np
+from overrides import override
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices, VecEnvObs, VecEnvStepReturn
+from src.environment import Container
+from src.environment.container import get_stacked_feasible_positions
+from src.environment import ShapeGenerator
+from src.environment import PackingEnv
+
+class VecPackingEnv(VecEnv):
+
+    def __init__(
+            self,
+            container: Container,
+            n_envs: int,
+            upper_bound: int,
+            seq_length: int=100,
+            cache_path: str='resources/polycubes',
+            seed: int=None,
+            incremental: bool=False,
+            height_map: bool=False
+        ):
+        '''
+        Create a batched packing environment that steps `n_envs` containers in lockstep.
+        The containers are stored as one stacked array in a single process, and the observation and action mask
+        buffers are shared by the batch. After every step, the feasible positions of the current polycubes of all
+        environments are found in one correlation over the stacked array (see `find_feasible_positions`), the container
+        observations are computed in one pass over it and the action masks are encoded with a single `np.ravel_multi_index`.
+        Only the placements (and the constraints, if any) are handled per environment, by `PackingEnv`.
+        This class implements the stable-baselines3 `VecEnv` interface (including batched `action_masks`),
+        so it can be passed to `MaskablePPO` directly.
+
+        Parameters
+        ----------
+            `container` : `Container`
+                the container that needs to be packed (copied for every environment).
+            `n_envs` : int
+                the number of environments.
+            `upper_bound` : int
+                an upper bound for the size of the polycubes to pack.
+            `seq_length` : int, optional
+                the length of the sequence of polycubes to pack.
+            `cache_path` : str, optional
+                the path to the cache of polycubes.
+            `seed` : int, optional
+                the seed for the first reset (environment `i` uses `seed + i`).
+            `incremental` : bool, optional
+                whether to use incremental feasible positions, see `PackingEnv`.
+            `height_map` : bool, optional
+                whether to add the height map of the containers to the observation.
+        '''
+
+        # the polycube cache is shared between all environments
+        generator = ShapeGenerator(upper_bound, cache_path)
+
+        # create the environments, every container is a view of the stacked array
+        self.matrices = np.zeros((n_envs,) + container.get_dimensions(), dtype=container.matrix.dtype)
+        self.envs = []
+        for i in range(n_envs):
+            env_container = copy.deepcopy(container)
+            env_container.matrix = self.matrices[i]
+            env_container.reset()
+            self.envs.append(PackingEnv(
+                env_container,
+                upper_bound=upper_bound,
+                seq_length=seq_length,
+                incremental=incremental,
+                height_map=height_map,
+                generator=generator
+            ))
+        env = self.envs[0]
+        super().__init__(n_envs, env.observation_space, env.action_space)
+        self.dimensions = env.dimensions
+        self.action_space_nvec = env.action_space_nvec
+        self.actions = None
+
+        # seed the first reset (the random number generators continue between episodes afterwards)
+        if seed is not None:
+            self.seed(seed)
+
+        # preallocate the batched observation and mask buffers
+        self.obs_buffers = {key: np.zeros((n_envs,) + space.shape, dtype=space.dtype)
+                            for key, space in self.observation_space.spaces.items()}
+        self.mask_buffer = np.full((n_envs, np.prod(self.action_space_nvec)), False, dtype=bool)
+        self.masks_cached = False
+
+    def find_feasible_positions(self, indices: list[int]):
+        '''
+        Find the feasible positions of the current polycubes of many environments at once, and set them in the environments.
+        All rotations of all polycubes are correlated with the stacked occupancy of their containers together
+        (see `get_stacked_feasible_positions`).
+        Environments with incremental feasible positions or a mask cache use their own state (see `PackingEnv`).
+
+        Parameters
+        ----------
+            `indices` : `list[int]`
+                the environments to find the feasible positions of.
+        '''
+        batch = []
+        for i in indices:
+            env = self.envs[i]
+            env.mask_cached = False
+            if env.incremental or env.container.mask_cache is not None or len(env.arrivals) == 0:
+                env.feasible_positions = env.find_feasible_positions()
+            else:
+                batch.append(i)
+        if len(batch) == 0:
+            return
+
+        # find the feasible positions in the stacked containers, and split them by environment (format: c, r, x, y, z)
+        positions = get_stacked_feasible_positions([self.envs[i].container for i in batch],
+                                                   [self.envs[i].get_current_polycube().get_rotations() for i in batch])
+        bounds = np.searchsorted(positions[:, 0], np.arange(len(batch) + 1))
+        for b, i in enumerate(batch):
+            self.envs[i].feasible_positions = positions[bounds[b]:bounds[b + 1], 1:]
+
+    def _update_obs(self, indices: list[int]=None):
+        '''
+        Update the observation buffers with the current state of the environments.
+
+        Parameters
+        ----------
+            `indices` : `list[int]`, optional
+                the environments to update. If `None`, all environments are updated.
+        '''
+
+        # transform the containers to binary tensors (one pass over the stacked array)
+        if indices is None:
+            np.greater(self.matrices, 0, out=self.obs_buffers['container'].view(bool))
+            indices = range(self.num_envs)
+        else:
+            self.obs_buffers['container'][indices] = self.matrices[indices] > 0
+
+        for i in indices:
+            # write the (padded) binary polycube, an exhausted stream has an empty polycube
+            polycube = self.obs_buffers['polycube'][i]
+            polycube[:] = 0
+            if len(self.envs[i].arrivals) > 0:
+                cubes = self.envs[i].get_current_polycube().get_cubes()
+                polycube[cubes[:, 0], cubes[:, 1], cubes[:, 2]] = 1
+
+            # copy the height map
+            if 'height_map' in self.obs_buffers:
+                self.obs_buffers['height_map'][i] = self.envs[i].container.get_height_map()
+
+    def _get_obs(self, i: int=None) -> dict:
+        '''
+        Get a copy of the observation buffers.
+
+        Parameters
+        ----------
+            `i` : int, optional
+                the environment to get the observation of. If `None`, the batched observation is returned.
+
+        Returns
+        -------
+            `dict[container, polycube, (height_map)]` : the (batched) observation.
+        '''
+        if i is None:
+            return {key: buffer.copy() for key, buffer in self.obs_buffers.items()}
+        return {key: buffer[i].copy() for key, buffer in self.obs_buffers.items()}
+
+    @override
+    def reset(self) -> VecEnvObs:
+        # reset every environment (seeds and options are only used once)
+        for i, env in enumerate(self.envs):
+            options = {'options': self._options[i]} if self._options[i] else {}
+            _, self.reset_infos[i] = env.reset(seed=self._seeds[i], **options)
+        self._reset_seeds()
+        self._reset_options()
+        self.masks_cached = False
+
+        # return the batched observation
+        self._update_obs()
+        return self._get_obs()
+
+    @override
+    def step_async(self, actions: np.ndarray) -> None:
+        self.actions = actions
+
+    @override
+    def step_wait(self) -> VecEnvStepReturn:
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.full(self.num_envs, False, dtype=bool)
+        infos = []
+
+        # place the polycubes (one environment at a time), and find the next feasible positions of all environments at once
+        for i, env in enumerate(self.envs):
+            env._place(self.actions[i])
+        self.find_feasible_positions(range(self.num_envs))
+        for i, env in enumerate(self.envs):
+            rewards[i], dones[i] = env._get_outcome()
+            infos.append(env._get_info())
+        self._update_obs()
+
+        # save the final observation and reset the finished environments
+        finished = np.flatnonzero(dones)
+        if len(finished) > 0:
+            for i in finished:
+                infos[i]['terminal_observation'] = self._get_obs(i)
+                infos[i]['TimeLimit.truncated'] = False
+                _, self.reset_infos[i] = self.envs[i].reset()
+            self._update_obs(finished)
+        self.masks_cached = False
+
+        # return the batched observation, rewards, dones and infos
+        return self._get_obs(), rewards, dones, infos
+
+    def action_masks(self) -> np.ndarray:
+        '''
+        Get the action masks for the current state of all environments.
+        The masks are computed once per state and cached until the environments change.
+
+        Returns
+        -------
+            `np.ndarray` : a 2D array with the action mask of every environment (True if the action is valid).
+        '''
+
+        # return the cached masks if the state did not change
+        if self.masks_cached:
+            return self.mask_buffer.copy()
+
+        # environments with heuristics have their own mask
+        self.mask_buffer[:] = False
+        heuristic = [env.heuristics is not None for env in self.envs]
+        for i in np.flatnonzero(heuristic):
+            self.mask_buffer[i] = self.envs[i].get_heuristic_mask()
+
+        # encode the feasible positions of all other environments at once (format: env, r, x, y, z)
+        positions = [np.column_stack((np.full(len(env.feasible_positions), i), env.feasible_positions))
+                     for i, env in enumerate(self.envs) if not heuristic[i] and len(env.feasible_positions) > 0]
+        if len(positions) > 0:
+            positions = np.concatenate(positions)
+            actions = np.ravel_multi_index(positions.T, (self.num_envs,) + tuple(self.action_space_nvec))
+            self.mask_buffer.ravel()[actions] = True
+        self.masks_cached = True
+        return self.mask_buffer.copy()
+
+    @override
+    def close(self) -> None:
+        for env in self.envs:
+            env.close()
+
+    @override
+    def get_attr(self, attr_name: str, indices: VecEnvIndices=None) -> list[Any]:
+        return [getattr(self.envs[i], attr_name) for i in self._get_indices(indices)]
+
+    @override
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices=None) -> None:
+        for i in self._get_indices(indices):
+            setattr(self.envs[i], attr_name, value)
+        self.masks_cached = False
+
+    @override
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices=None, **method_kwargs) -> list[Any]:
+        # the action masks are computed for the whole batch at once
+        if method_name == 'action_masks' and not method_args and not method_kwargs:
+            return list(self.action_masks()[list(self._get_indices(indices))])
+        self.masks_cached = False # the method can change the environments
+        return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs) for i in self._get_indices(indices)]
+
+    @override
+    def env_is_wrapped(self, wrapper_class: type[gym.Wrapper], indices: VecEnvIndices=None) -> list[bool]:
+        return [False for _ in self._get_indices(indices)]
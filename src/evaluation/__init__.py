@@ -0,0 +1 @@
+from src.evaluation.evaluation import evaluate
@@ -0,0 +1,190 @@
+import os
+import io
+import csv
+import time
+import contextlib
+import multiprocessing
+from typing import Callable
+from src.environment import PackingEnv
+from src.agents import Agent
+
+# the columns of the results file, and the type of every column
+COLUMNS = ['seed', 'agent', 'polycubes_packed', 'cubes_packed', 'fill_ratio', 'time_taken']
+TYPES = [int, str, int, int, float, float]
+
+# the state of a worker process (set by `_init_worker`)
+_env = None
+_agents = None
+
+def _init_worker(env_fn: Callable[[], PackingEnv], agent_fns: dict[str, Callable[[], Agent]]):
+    '''
+    Create the environment and the agents of a worker process.
+
+    Parameters
+    ----------
+        `env_fn` : `Callable[[], PackingEnv]`
+            a function that creates the environment.
+        `agent_fns` : `dict[str, Callable[[], Agent]]`
+            a function that creates the agent, for every agent name.
+    '''
+    global _env, _agents
+    _env = env_fn()
+    _agents = {name: agent_fn() for name, agent_fn in agent_fns.items()}
+
+def _run_seed(seed: int) -> list[list]:
+    '''
+    Run every agent of the worker on the episode of a seed.
+
+    Parameters
+    ----------
+        `seed` : int
+            the seed of the episode.
+
+    Returns
+    -------
+        `list[list]` : one row of results (see `COLUMNS`) for every agent.
+    '''
+    rows = []
+    for name, agent in _agents.items():
+        # run the agent until the environment is terminal (the agents log every step, which is discarded)
+        _env.reset(seed=seed)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start_time = time.perf_counter_ns()
+            while not _env.is_terminal():
+                _env.step(agent.get_action(_env))
+            time_taken = (time.perf_counter_ns() - start_time) / 1e6
+
+        # save the results (the time taken is the mean time per polycube in ms)
+        polycubes_packed = _env.container.get_shape_count()
+        cubes_packed = int(_env.container.get_cube_count())
+        fill_ratio = cubes_packed / _env.container.matrix.size
+        rows.append([seed, name, polycubes_packed, cubes_packed, fill_ratio, time_taken / max(polycubes_packed, 1)])
+    return rows
+
+def _is_complete(row: list[str]) -> bool:
+    '''
+    Check if a row of the results file has a valid value in every column (see `COLUMNS`).
+
+    Parameters
+    ----------
+        `row` : `list[str]`
+            the fields of the row.
+
+    Returns
+    -------
+        bool : True if the row is complete, otherwise False.
+    '''
+    if len(row) != len(COLUMNS) or row[1] == '':
+        return False
+    try:
+        for value, parse in zip(row, TYPES):
+            parse(value)
+    except ValueError:
+        return False
+    return True
+
+def _load_results(path: str, agents: list[str]) -> set[int]:
+    '''
+    Load the seeds that were already evaluated by all agents.
+    The rows of the agents on the seeds they still have to evaluate (e.g. from an interrupted run) are removed from
+    the results file, all other rows (including the rows of other agents) are kept.
+
+    Parameters
+    ----------
+        `path` : str
+            the path to the results file.
+        `agents` : `list[str]`
+            the names of the agents of the current run.
+
+    Returns
+    -------
+        `set[int]` : the seeds that were evaluated.
+    '''
+
+    # read the rows of the file: a row is only complete if it ends with a line break (the last row of an interrupted
+    # run can be cut off anywhere, also in its last column), and every column holds a valid value
+    with open(path, newline='') as file:
+        content = file.read()
+    rows = list(csv.reader(io.StringIO(content[:content.rfind('\n') + 1])))
+    if len(rows) == 0 or rows[0] != COLUMNS:
+        raise ValueError(f'{path} is not a results file.')
+    rows = [rows[0]] + [row for row in rows[1:] if _is_complete(row)]
+
+    # find the seeds that were evaluated by all agents
+    evaluated = {}
+    for row in rows[1:]:
+        evaluated.setdefault(int(row[0]), set()).add(row[1])
+    seeds = {seed for seed, names in evaluated.items() if names.issuperset(agents)}
+
+    # rewrite the file without the rows of the agents on the seeds that are evaluated again
+    with open(f'{path}.tmp', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(row for row in rows[1:] if int(row[0]) in seeds or row[1] not in agents)
+    os.replace(f'{path}.tmp', path)
+    return seeds
+
+def evaluate(
+        env_fn: Callable[[], PackingEnv],
+        agent_fns: dict[str, Callable[[], Agent]],
+        seeds: list[int],
+        path: str,
+        workers: int=None,
+        chunk_size: int=16
+    ) -> int:
+    '''
+    Evaluate agents on the episodes of a list of seeds, using a pool of worker processes.
+    Every worker creates one environment and one instance of every agent (e.g. one loaded PPO model).
+    The results are streamed to a CSV file (one row per seed and agent, see `COLUMNS`), and an interrupted
+    evaluation is resumed by running it again with the same file (other agents can be added to the same file).
+    The file is row-oriented, like the results in `experiments/` (read with `pd.read_csv(path, index_col='seed')`),
+    so rows can be appended after every seed. The results only depend on the seed,
+    so they are identical regardless of the number of workers (except for the time taken).
+
+    Parameters
+    ----------
+        `env_fn` : `Callable[[], PackingEnv]`
+            a function that creates the environment (must be picklable, e.g. a module-level function).
+        `agent_fns` : `dict[str, Callable[[], Agent]]`
+            a function that creates the agent, for every agent name (must be picklable).
+        `seeds` : `list[int]`
+            the seeds of the episodes to evaluate.
+        `path` : str
+            the path to the results file.
+        `workers` : int, optional
+            the number of worker processes (if not provided, the number of CPUs).
+            With a single worker the evaluation runs in the current process.
+        `chunk_size` : int, optional
+            the number of seeds that are sent to a worker at once.
+
+    Returns
+    -------
+        int : the number of seeds that were evaluated.
+    '''
+
+    # skip the seeds that were already evaluated
+    if os.path.exists(path):
+        evaluated = _load_results(path, list(agent_fns))
+    else:
+        evaluated = set()
+        with open(path, 'w', newline='') as file:
+            csv.writer(file).writerow(COLUMNS)
+    seeds = [seed for seed in seeds if seed not in evaluated]
+    if len(seeds) == 0:
+        return 0
+
+    # run the seeds and append the results in order of the seeds
+    workers = os.cpu_count() if workers is None else workers
+    with open(path, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if workers == 1:
+            _init_worker(env_fn, agent_fns)
+            for rows in map(_run_seed, seeds):
+                writer.writerows(rows)
+                file.flush()
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(env_fn, agent_fns)) as pool:
+                for rows in pool.imap(_run_seed, seeds, chunksize=chunk_size):
+                    writer.writerows(rows)
+                    file.flush()
+    return len(seeds)
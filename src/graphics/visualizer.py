@@ -152,11 +152,11 @@ class Visualizer:
         # create a voxel grid from the point cloud
         voxel_grid = o3d.geometry.VoxelGrid.create_from_point_cloud(pcd, voxel_size=self.voxel_size)
 
-        # update labels
+        # update labels (at the center of every shape, from the shape registry of the container)
         self.labels = []
         for id in self.environment.container.get_ids():
-            points = np.argwhere(self.environment.container.matrix == id)
-            mean = np.mean(np.asarray(points), axis=0) * self.voxel_size
+            shape = self.environment.container.get_shape(id)
+            mean = shape['coordinate_sum'] / shape['count'] * self.voxel_size
             self.labels.append((mean + [0.5 * self.voxel_size, 0, 0.5 * self.voxel_size], id))
         if self.labels_visible:
             self.w.clear_3d_labels()
@@ -1,4 +1,5 @@
 from src.heuristics import Heuristic
+from src.heuristics.heuristic import get_centers_of_mass
 from overrides import override
 import numpy as np
 
@@ -14,3 +15,25 @@ class BLBF(Heuristic):
 
         # return the normalized distance from the CoM to the bottom-left-back corner (inversed)
         return 1 - np.linalg.norm(center_of_mass) / np.linalg.norm(np.array(matrix.shape) - 1)
+
+    @override
+    def get_scores(self, container, rotations, positions) -> np.ndarray:
+        # constraints can move cubes, so fall back to dummy containers
+        if container.has_mutating_constraints() or len(positions) == 0:
+            return super().get_scores(container, rotations, positions)
+        positions = np.column_stack((np.zeros(len(positions), dtype=int), positions))
+        return self.get_stacked_scores([container], rotations, positions)
+
+    @override
+    def get_stacked_scores(self, containers, rotations, positions) -> np.ndarray:
+        # constraints can move cubes, so fall back to the scores per container
+        if any(container.has_mutating_constraints() for container in containers) or len(positions) == 0:
+            return super().get_stacked_scores(containers, rotations, positions)
+
+        # get the center of mass of every placement
+        centers_of_mass = get_centers_of_mass(containers, rotations, positions)
+
+        # return the normalized distance from the CoM to the bottom-left-back corner (inversed)
+        # note: the norm is computed as a (batched) dot product, exactly like `np.linalg.norm`
+        norms = np.sqrt(np.matmul(centers_of_mass[:, None, :], centers_of_mass[:, :, None])[:, 0, 0])
+        return 1 - norms / np.linalg.norm(np.array(containers[0].matrix.shape) - 1)
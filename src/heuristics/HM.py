@@ -25,3 +25,44 @@ class HeightMapMinimization(Heuristic):
 
         # return the normalized percentage of filled area (inversed)
         return 1 - filled_area / height_map.size
+
+    @override
+    def get_scores(self, container, rotations, positions) -> np.ndarray:
+        # constraints can move cubes, so fall back to dummy containers
+        if container.has_mutating_constraints() or len(positions) == 0:
+            return super().get_scores(container, rotations, positions)
+        positions = np.column_stack((np.zeros(len(positions), dtype=int), positions))
+        return self.get_stacked_scores([container], rotations, positions)
+
+    @override
+    def get_stacked_scores(self, containers, rotations, positions) -> np.ndarray:
+        # constraints can move cubes, so fall back to the scores per container
+        if any(container.has_mutating_constraints() for container in containers) or len(positions) == 0:
+            return super().get_stacked_scores(containers, rotations, positions)
+
+        # get the empty cells of the height maps of the containers (the vertical one is kept up to date by the container)
+        if self.axis == 1:
+            empty = np.array([container.get_column_counts() == 0 for container in containers])
+        else:
+            empty = np.array([~np.any(container.matrix != 0, axis=self.axis) for container in containers])
+        filled_area = empty[0].size - np.count_nonzero(empty, axis=(1, 2))
+
+        # get the positions on the height maps
+        axes = [a for a in range(3) if a != self.axis]
+        positions = np.asarray(positions)
+        c = positions[:, 0]
+        map_positions = positions[:, 2:][:, axes]
+
+        # count the empty cells of the height map that are covered by the footprint of every placement
+        # (all placements of a rotation at once, by gathering the empty cells under every cell of its footprint)
+        covered = np.zeros(len(positions), dtype=int)
+        for r, rotation in enumerate(rotations):
+            idx = np.flatnonzero(positions[:, 1] == r)
+            if len(idx) == 0:
+                continue
+            footprint = np.unique(rotation.get_cubes()[:, axes], axis=0)
+            cells = map_positions[idx, None, :] + footprint[None, :, :]
+            covered[idx] = np.count_nonzero(empty[c[idx, None], cells[:, :, 0], cells[:, :, 1]], axis=1)
+
+        # return the normalized percentage of filled area (inversed)
+        return 1 - (filled_area[c] + covered) / empty[0].size
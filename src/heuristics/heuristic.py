@@ -1,5 +1,17 @@
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 import numpy as np
+import time
+
+if TYPE_CHECKING:
+    from src.environment import Container
+    from src.environment.shapes import Polycube
+
+# the number of placements that are scored first when the scores are computed before a deadline (see `get_weighted_scores`)
+SCORE_PROBE_SIZE = 32
+
+# the maximum number of calls per heuristic when the scores are computed before a deadline (see `get_weighted_scores`)
+SCORE_MAX_CALLS = 8
 
 class Heuristic(ABC):
 
@@ -20,3 +32,149 @@ class Heuristic(ABC):
                 the score of the matrix.
         '''
         pass
+
+    def get_scores(self, container: 'Container', rotations: list['Polycube'], positions: np.ndarray) -> np.ndarray:
+        '''
+        Get the normalized `[0, 1]` scores of many placements in the container at once.
+        Every score equals `get_score` of the container with that polycube added.
+        By default this creates a dummy container per placement, subclasses can override it with a batched implementation.
+
+        Parameters
+        ----------
+            `container` : `Container`
+                the container to place the polycube in.
+            `rotations` : `list[Polycube]`
+                all rotations of the polycube.
+            `positions` : `np.ndarray`
+                the (feasible) placements to score (format: r, x, y, z).
+
+        Returns
+        -------
+            `np.ndarray` : the score of every placement.
+        '''
+        return np.array([self.get_score(container.get_dummy_container(rotations[r], (x, y, z)))
+                         for r, x, y, z in positions], dtype=float)
+
+    def get_stacked_scores(self, containers: list['Container'], rotations: list['Polycube'], positions: np.ndarray) -> np.ndarray:
+        '''
+        Get the normalized `[0, 1]` scores of many placements of the same polycube in many containers at once
+        (e.g. the packings of a beam search). By default this calls `get_scores` per container,
+        subclasses can override it with an implementation that is batched over the containers.
+
+        Parameters
+        ----------
+            `containers` : `list[Container]`
+                the containers to place the polycube in (of the same dimensions).
+            `rotations` : `list[Polycube]`
+                all rotations of the polycube.
+            `positions` : `np.ndarray`
+                the (feasible) placements to score (format: c, r, x, y, z, with c the index of the container).
+
+        Returns
+        -------
+            `np.ndarray` : the score of every placement.
+        '''
+        scores = np.zeros(len(positions))
+        for c in np.unique(positions[:, 0]):
+            selected = np.flatnonzero(positions[:, 0] == c)
+            scores[selected] = self.get_scores(containers[c], rotations, positions[selected, 1:])
+        return scores
+
+def get_centers_of_mass(containers: list['Container'], rotations: list['Polycube'], positions: np.ndarray) -> np.ndarray:
+    '''
+    Get the center of mass of the containers for many placements at once, without creating dummy containers.
+    This assumes that the placements do not overlap and that no constraint moves cubes.
+
+    Parameters
+    ----------
+        `containers` : `list[Container]`
+            the containers to place the polycube in.
+        `rotations` : `list[Polycube]`
+            all rotations of the polycube.
+        `positions` : `np.ndarray`
+            the (feasible) placements (format: c, r, x, y, z, with c the index of the container).
+
+    Returns
+    -------
+        `np.ndarray` : the center of mass of every placement (format: x, y, z).
+    '''
+
+    # get the number and the coordinate sum of the cubes in the containers (kept up to date by the containers)
+    count = np.array([container.get_cube_count() for container in containers])
+    total = np.array([container.get_coordinate_sum() for container in containers]).reshape(-1, 3)
+
+    # get the number and the coordinate sum of the cubes in every rotation
+    counts = np.array([len(r.get_cubes()) for r in rotations])
+    totals = np.array([np.sum(r.get_cubes(), axis=0) for r in rotations])
+
+    # the cubes of a placement are the cubes of the rotation shifted by the position
+    c, r, pos = positions[:, 0], positions[:, 1], positions[:, 2:]
+    return (total[c] + totals[r] + counts[r, None] * pos) / (count[c, None] + counts[r, None])
+
+def get_weighted_scores(
+        heuristics: list[Heuristic],
+        weights: list[float],
+        container: 'Container | list[Container]',
+        rotations: list['Polycube'],
+        positions: np.ndarray,
+        deadline: float=None
+    ) -> np.ndarray:
+    '''
+    Get the (weighted) average heuristic score of many placements at once.
+    Without a deadline, all placements are scored in a single call of every heuristic. With a deadline, the placements
+    are scored in an interleaved order (every n-th placement first, so a partial scoring covers all rotations): first a
+    probe of `SCORE_PROBE_SIZE` placements, after which every call scores as many placements as fit before the deadline
+    at the rate of the previous call (usually all remaining ones, so the overhead of a call is only paid a few times).
+    The probe is always scored, the placements that were not scored get NaN.
+    Placements in many containers are scored with `Heuristic.get_stacked_scores`.
+
+    Parameters
+    ----------
+        `heuristics` : `list[Heuristic]`
+            the heuristics to score the placements with.
+        `weights` : `list[float]`
+            the weights of the heuristics (if `None`, the weights are equal).
+        `container` : `Container | list[Container]`
+            the container to place the polycube in, or a list of containers.
+        `rotations` : `list[Polycube]`
+            all rotations of the polycube.
+        `positions` : `np.ndarray`
+            the (feasible) placements to score (format: r, x, y, z, or c, r, x, y, z for a list of containers).
+        `deadline` : float, optional
+            the time (see `time.perf_counter`) at which the scoring stops.
+
+    Returns
+    -------
+        `np.ndarray` : the score of every placement.
+    '''
+    scores = np.full(len(positions), np.nan)
+    if len(positions) == 0:
+        return scores
+
+    # the order in which the placements are scored, and the size of the first call
+    if deadline is None:
+        order, size = np.arange(len(positions)), len(positions)
+    else:
+        stride = -(-len(positions) // SCORE_PROBE_SIZE)
+        order = np.argsort(np.arange(len(positions)) % stride, kind='stable')
+        size = SCORE_PROBE_SIZE
+
+    done = 0
+    for _ in range(SCORE_MAX_CALLS):
+        start = time.perf_counter()
+        chunk = order[done:done + size]
+        if isinstance(container, list):
+            chunk_scores = [h.get_stacked_scores(container, rotations, positions[chunk]) for h in heuristics]
+        else:
+            chunk_scores = [h.get_scores(container, rotations, positions[chunk]) for h in heuristics]
+        scores[chunk] = np.average(chunk_scores, axis=0, weights=weights)
+        done += len(chunk)
+        if done == len(positions) or deadline is None:
+            break
+
+        # the number of placements that can be scored before the deadline (at the rate of this call)
+        now = time.perf_counter()
+        size = int((deadline - now) / max(now - start, 1e-9) * len(chunk))
+        if size < 1:
+            break
+    return scores
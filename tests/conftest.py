@@ -0,0 +1,14 @@
+from src.environment import ShapeGenerator
+import numpy as np
+import pytest
+
+@pytest.fixture
+def generator(tmp_path) -> ShapeGenerator:
+    '''
+    Create a shape generator from a cache with the two polycubes of size 3 (and their rotation table).
+    '''
+    polycubes = np.empty(2, dtype=object)
+    polycubes[:] = [np.ones((1, 1, 3), dtype=bool), np.array([[[1, 1], [1, 0]]], dtype=bool)]
+    np.save(tmp_path / 'cubes_3.npy', polycubes, allow_pickle=True)
+    ShapeGenerator.build_rotation_table(str(tmp_path), 3)
+    return ShapeGenerator(3, str(tmp_path))
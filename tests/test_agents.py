@@ -0,0 +1,123 @@
+from src.environment import Container, ShapeGenerator, PackingEnv
+from src.heuristics import BLBF, HeightMapMinimization
+from src.constraints import Gravity
+from src.agents import MCTSAgent, BeamSearchAgent
+from src.heuristics.heuristic import SCORE_PROBE_SIZE
+from sb3_contrib import MaskablePPO
+import numpy as np
+import pytest
+import time
+import re
+
+class Clock:
+    '''
+    A fake `time.perf_counter` that starts at 0 and is at `later` after it was read `reads` times.
+    '''
+    def __init__(self, reads: int=0, later: float=0):
+        self.count = 0
+        self.reads = reads
+        self.later = later
+
+    def __call__(self) -> float:
+        self.count += 1
+        return 0.0 if self.count <= self.reads else self.later
+
+class TickingClock:
+    '''
+    A fake `time.perf_counter` that advances by `tick` seconds every time it is read.
+    '''
+    def __init__(self, tick: float):
+        self.now = 0.0
+        self.tick = tick
+
+    def __call__(self) -> float:
+        self.now += self.tick
+        return self.now
+
+def get_simulations(capsys) -> int:
+    return int(re.search(r'after (\d+) simulations', capsys.readouterr().out).group(1))
+
+def test_mcts_searches_until_the_deadline(generator: ShapeGenerator, monkeypatch, capsys):
+    env = PackingEnv(Container(8, 8, 8), 3, seq_length=8, generator=generator, seed=0)
+    env.reset()
+    agent = MCTSAgent(heuristics=[BLBF(), HeightMapMinimization()], workers=1, seed=0)
+
+    # with a clock that advances on every read, the search runs simulations until the deadline
+    monkeypatch.setattr(time, 'perf_counter', TickingClock(1e-4))
+    for _ in range(3):
+        env.step(agent.get_action(env))
+        assert get_simulations(capsys) > 1
+
+@pytest.mark.parametrize('workers,processes', [(1, True), (2, False), (2, True)], ids=['current', 'threads', 'processes'])
+def test_mcts_simulates_after_the_deadline(generator: ShapeGenerator, capsys, workers: int, processes: bool):
+    env = PackingEnv(Container(8, 8, 8, constraints=[Gravity()]), 3, seq_length=8, generator=generator, seed=0)
+    env.reset()
+
+    # the search stops before it starts (the time limit is within the margins), but every search finishes one
+    # simulation (which only scores the first placements with gravity), and the results of at least one worker are used
+    agent = MCTSAgent(heuristics=[BLBF(), HeightMapMinimization()], time_limit=0, workers=workers, processes=processes, seed=0)
+    try:
+        for _ in range(2):
+            mask = env.action_masks()
+            action = agent.get_action(env)
+            assert 1 <= get_simulations(capsys) <= workers
+            assert mask[action]
+            env.step(action)
+    finally:
+        agent.close()
+
+def test_mcts_priors_from_the_policy(generator: ShapeGenerator, capsys):
+    env = PackingEnv(Container(4, 4, 4), 3, seq_length=8, generator=generator, seed=0)
+    env.reset()
+    model = MaskablePPO('MultiInputPolicy', env, n_steps=8, batch_size=8, seed=0, device='cpu')
+    agent = MCTSAgent(model=model, workers=1, seed=0)
+
+    # the priors are the probabilities of the masked policy, restricted to the feasible placements
+    mask = env.action_masks()
+    positions = np.column_stack(np.unravel_index(np.flatnonzero(mask), env.action_space_nvec))
+    rotations = env.get_current_polycube().get_rotations()
+    priors = agent.get_root_priors(env, positions, rotations, time.perf_counter() + 1)
+    obs, _ = model.policy.obs_to_tensor(env._get_obs_cache())
+    probs = model.policy.get_distribution(obs, action_masks=mask).distribution.probs.detach().cpu().numpy()[0]
+    assert np.allclose(priors, probs[np.flatnonzero(mask)] / probs[np.flatnonzero(mask)].sum())
+
+    # and the search chooses a feasible placement
+    action = agent.get_action(env)
+    assert get_simulations(capsys) >= 1
+    assert mask[action]
+
+@pytest.mark.parametrize('lookahead', [1, 3])
+def test_beam_search_reaches_the_lookahead_before_the_deadline(generator: ShapeGenerator, monkeypatch, capsys, lookahead: int):
+    env = PackingEnv(Container(8, 8, 8), 3, seq_length=8, generator=generator, seed=0)
+    env.reset()
+    agent = BeamSearchAgent([BLBF(), HeightMapMinimization()], lookahead=lookahead, time_limit=100)
+
+    # with a clock that never reaches the deadline, all polycubes of the lookahead are searched
+    monkeypatch.setattr(time, 'perf_counter', Clock())
+    for _ in range(3):
+        env.step(agent.get_action(env))
+        searched = int(re.search(r'after (\d+) polycubes', capsys.readouterr().out).group(1))
+        assert searched == lookahead
+
+def test_beam_search_stops_at_the_deadline(generator: ShapeGenerator, monkeypatch, capsys):
+    env = PackingEnv(Container(8, 8, 8, constraints=[Gravity()]), 3, seq_length=8, generator=generator, seed=0)
+    env.reset()
+    agent = BeamSearchAgent([BLBF(), HeightMapMinimization()], lookahead=3, time_limit=100)
+
+    # count the placements that are scored (with gravity, every placement is scored on a dummy container)
+    scored = []
+    get_score = BLBF.get_score
+    monkeypatch.setattr(BLBF, 'get_score', lambda self, matrix: scored.append(1) or get_score(self, matrix))
+
+    # the deadline passes once the search started: only the probe of the current polycube is scored,
+    # and the best scored placement is chosen (the upcoming polycubes are not searched)
+    for _ in range(3):
+        mask = env.action_masks()
+        monkeypatch.setattr(time, 'perf_counter', Clock(reads=1, later=1.0))
+        scored.clear()
+        action = agent.get_action(env)
+        searched = int(re.search(r'after (\d+) polycubes', capsys.readouterr().out).group(1))
+        assert searched == 1
+        assert len(scored) == min(SCORE_PROBE_SIZE, mask.sum())
+        assert mask[action]
+        env.step(action)
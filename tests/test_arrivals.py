@@ -0,0 +1,57 @@
+from src.environment import ShapeGenerator, RandomArrivals, ReplayArrivals
+import numpy as np
+import pytest
+
+def draw(source, seed: int, n: int) -> list:
+    '''
+    Start a stream with the seed, and get the (index, cubes) of its first `n` polycubes (or all, if it ends earlier).
+    '''
+    source.reset(np.random.default_rng(seed))
+    stream = []
+    while len(source) > 0 and len(stream) < n:
+        polycube = source.pop()
+        stream.append((polycube.id - 1, polycube.get_cubes().tobytes()))
+    return stream
+
+@pytest.mark.parametrize('length', [None, 40])
+def test_random_stream_only_depends_on_the_seed(generator: ShapeGenerator, length: int):
+    source = RandomArrivals(generator, length=length, lookahead=3)
+    streams = {seed: draw(source, seed, 100) for seed in range(3)}
+    assert all(len(stream) == (100 if length is None else length) for stream in streams.values())
+
+    # the same seed gives the same stream, also from a new source and after other streams
+    for seed in [2, 0, 1]:
+        assert draw(source, seed, 100) == streams[seed]
+        assert draw(RandomArrivals(generator, length=length, lookahead=1), seed, 100) == streams[seed]
+    assert streams[0] != streams[1]
+
+@pytest.mark.parametrize('from_file', [False, True])
+def test_replay_reproduces_a_recorded_stream(generator: ShapeGenerator, tmp_path, from_file: bool):
+    recorded = draw(RandomArrivals(generator, length=30), 0, 30)
+    log = [idx for idx, _ in recorded]
+    if from_file:
+        (tmp_path / 'log.txt').write_text(''.join(f'{idx}\n' for idx in log))
+        log = str(tmp_path / 'log.txt')
+
+    # the replay has the same polycubes in the same order, and ends with the log (with any seed)
+    source = ReplayArrivals(generator, log, lookahead=2)
+    assert draw(source, 1, 100) == recorded
+    assert draw(source, 2, 100) == recorded
+
+def test_peek_does_not_consume(generator: ShapeGenerator):
+    source = RandomArrivals(generator, length=10, lookahead=3)
+    source.reset(np.random.default_rng(0))
+
+    # the peeked polycubes arrive next, in the same order
+    popped = []
+    while len(source) > 0:
+        peeked = source.peek(5)
+        assert len(peeked) == min(3, 10 - len(popped)) # at most the lookahead
+        assert source.peek(5) == peeked
+        assert source.get_current() is peeked[0]
+        polycube = source.pop()
+        assert polycube is peeked[0]
+        popped.append(polycube)
+        assert source.peek(2) == peeked[1:3]
+    assert len(popped) == 10
+    assert source.peek(3) == []
@@ -0,0 +1,64 @@
+from src.environment import Container
+from src.constraints import Constraint, Gravity, LoadBalancing
+from test_container import random_polycube
+import numpy as np
+import pytest
+
+class MaxShapes(Constraint):
+    '''
+    A constraint without a delta implementation (it uses `Constraint.is_satisfied_by`), which depends on the ids.
+    '''
+    never_mutates = True
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def apply(self, matrix):
+        pass
+
+    def is_satisfied(self, matrix) -> bool:
+        return np.count_nonzero(np.unique(matrix)) <= self.count
+
+def fill(container: Container, rng: np.random.Generator, count: int, first: int=1):
+    '''
+    Add random polycubes at random positions where they fit (with ids from `first`).
+    '''
+    for id in range(first, first + count):
+        polycube = random_polycube(rng, int(rng.integers(1, 6)), id)
+        positions = np.argwhere(container.get_feasible_mask(polycube))
+        if len(positions) > 0:
+            container.add(polycube, tuple(positions[rng.integers(len(positions))]))
+
+CONSTRAINTS = [Gravity(), Gravity(connected=False), LoadBalancing(), LoadBalancing(margin=2.5), MaxShapes(8)]
+
+@pytest.mark.parametrize('constraint', CONSTRAINTS, ids=lambda c: f'{type(c).__name__}-{list(vars(c).values())}')
+@pytest.mark.parametrize('seed', range(5))
+def test_satisfied_by_matches_satisfied(constraint: Constraint, seed: int):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 5, 7)
+    fill(container, rng, int(rng.integers(0, 12)))
+
+    # check every position where a new polycube fits (the delta against the full matrix with the polycube added)
+    polycube = random_polycube(rng, 4, 100)
+    positions = np.argwhere(container.get_feasible_mask(polycube))
+    expected = []
+    for position in positions:
+        matrix = container.matrix.copy()
+        cells = polycube.get_cubes() + position
+        matrix[cells[:, 0], cells[:, 1], cells[:, 2]] = polycube.id
+        expected.append(constraint.is_satisfied(matrix))
+    assert np.array_equal(constraint.is_satisfied_by(container, polycube.get_cubes(), positions), expected)
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int8, np.int16])
+def test_satisfied_by_with_the_largest_id(dtype: np.dtype):
+    rng = np.random.default_rng(0)
+    container = Container(6, 5, 7, dtype=dtype)
+    largest = np.iinfo(dtype).max
+    fill(container, rng, 3, first=largest - 2)
+    assert container.get_shape_count() == 3
+
+    # the placed polycube counts as a new shape, even though its id cannot be one larger than the largest id
+    polycube = random_polycube(rng, 3, 1)
+    positions = np.argwhere(container.get_feasible_mask(polycube))
+    assert not np.any(MaxShapes(3).is_satisfied_by(container, polycube.get_cubes(), positions))
+    assert np.all(MaxShapes(4).is_satisfied_by(container, polycube.get_cubes(), positions))
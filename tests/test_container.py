@@ -0,0 +1,247 @@
+from src.environment import Container
+from src.environment.container import get_stacked_feasible_positions
+from src.environment.shapes import Polycube
+from src.constraints import Gravity, LoadBalancing
+import numpy as np
+import pytest
+
+def random_polycube(rng: np.random.Generator, size: int, id: int) -> Polycube:
+    '''
+    Create a random polycube by growing it one cube at a time from a single cube.
+    '''
+    cubes = [np.zeros(3, dtype=int)]
+    while len(cubes) < size:
+        step = np.zeros(3, dtype=int)
+        step[rng.integers(3)] = rng.choice([-1, 1])
+        cube = cubes[rng.integers(len(cubes))] + step
+        if not any(np.array_equal(cube, c) for c in cubes):
+            cubes.append(cube)
+    cubes = np.array(cubes)
+    cubes -= cubes.min(axis=0)
+    matrix = np.zeros(cubes.max(axis=0) + 1, dtype=int)
+    matrix[cubes[:, 0], cubes[:, 1], cubes[:, 2]] = id
+    return Polycube(matrix)
+
+def get_state(container: Container) -> dict:
+    '''
+    Get a copy of the state of a container (the matrix, the statistics and the shape registry).
+    '''
+    return {
+        'matrix': container.matrix.copy(),
+        'cube_count': container.get_cube_count(),
+        'coordinate_sum': container.get_coordinate_sum().copy(),
+        'height_map': container.get_height_map().copy(),
+        'column_counts': container.get_column_counts().copy(),
+        'block_counts': container.get_block_counts().copy(),
+        'occupancy_hash': int(container.occupancy_hash),
+        'shapes': {id: (entry['count'], tuple(entry['coordinate_sum']),
+                        tuple(entry['bounding_box'][0]), tuple(entry['bounding_box'][1]))
+                   for id, entry in container.shapes.items()}
+    }
+
+def assert_state_equal(state: dict, expected: dict):
+    assert state.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, np.ndarray):
+            assert np.array_equal(state[key], value), key
+        else:
+            assert state[key] == value, key
+
+def push_random(container: Container, rng: np.random.Generator, id: int) -> bool:
+    '''
+    Push a random polycube at a random feasible position (returns False if it does not fit anywhere).
+    '''
+    polycube = random_polycube(rng, int(rng.integers(1, 6)), id)
+    positions = np.argwhere(container.get_feasible_mask(polycube))
+    if len(positions) == 0:
+        return False
+    x, y, z = positions[rng.integers(len(positions))]
+    assert container.push(polycube, (x, y, z))
+    return True
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('constraints', [[], [Gravity()], [Gravity(connected=False)]], ids=['none', 'gravity', 'disconnected-gravity'])
+def test_pop_restores_every_state(seed: int, constraints: list):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 5, 7, constraints=constraints, cache_size=8)
+
+    # push polycubes and keep the state before every placement
+    states = []
+    for id in range(1, 30):
+        state = get_state(container)
+        if not push_random(container, rng, id):
+            break
+        states.append(state)
+    assert len(states) > 5
+
+    # undo the placements one at a time
+    for state in reversed(states):
+        container.pop()
+        assert_state_equal(get_state(container), state)
+    assert len(container.undo_log) == 0
+    assert container.get_cube_count() == 0
+
+def test_failed_push_does_not_change_the_container():
+    container = Container(4, 4, 4)
+    polycube = random_polycube(np.random.default_rng(0), 4, 1)
+    assert container.push(polycube, (0, 0, 0))
+    state = get_state(container)
+
+    # the same cells are taken, and a position outside the container does not fit
+    assert not container.push(random_polycube(np.random.default_rng(0), 4, 2), (0, 0, 0))
+    assert not container.push(polycube, (4, 0, 0))
+    assert_state_equal(get_state(container), state)
+    assert len(container.undo_log) == 1
+
+@pytest.mark.parametrize('seed', range(5))
+def test_snapshot_is_independent(seed: int):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 6, 6, constraints=[Gravity()])
+    for id in range(1, 6):
+        push_random(container, rng, id)
+    state = get_state(container)
+
+    # changes to the snapshot do not change the container
+    snapshot = container.snapshot()
+    assert_state_equal(get_state(snapshot), state)
+    for id in range(10, 15):
+        push_random(snapshot, rng, id)
+    assert_state_equal(get_state(container), state)
+
+    # and changes to the container do not change the snapshot
+    snapshot_state = get_state(snapshot)
+    container.reset()
+    assert_state_equal(get_state(snapshot), snapshot_state)
+
+    # the placements in the snapshot can be undone back to the state of the container
+    while len(snapshot.undo_log) > 0:
+        snapshot.pop()
+    assert_state_equal(get_state(snapshot), state)
+
+def test_id_must_fit_in_the_dtype():
+    container = Container(4, 4, 4, dtype=np.int8)
+    assert container.push(random_polycube(np.random.default_rng(0), 3, 127), (0, 0, 0))
+    state = get_state(container)
+
+    # an id that does not fit is rejected without changing the container
+    with pytest.raises(ValueError):
+        container.push(random_polycube(np.random.default_rng(1), 3, 128), (2, 2, 2))
+    assert_state_equal(get_state(container), state)
+
+@pytest.mark.parametrize('constraints', [[], [Gravity()]])
+@pytest.mark.parametrize('seed', range(3))
+def test_stacked_feasible_positions_match_the_masks(seed: int, constraints: list):
+    rng = np.random.default_rng(seed)
+
+    # containers filled up to a different level, each with its own polycube
+    containers = []
+    for count in range(0, 40, 8):
+        container = Container(6, 5, 7, constraints=list(constraints))
+        for id in range(1, count + 1):
+            push_random(container, rng, id)
+        containers.append(container)
+    rotations = [random_polycube(rng, int(rng.integers(1, 6)), 100).get_rotations() for _ in containers]
+
+    # the positions in the stacked containers are the positions of the feasible masks of every container
+    positions = get_stacked_feasible_positions(containers, rotations)
+    expected = []
+    for c, container in enumerate(containers):
+        feasible = np.argwhere(np.array([container.compute_feasible_mask(r) for r in rotations[c]]))
+        expected.append(np.column_stack((np.full(len(feasible), c), feasible)))
+    assert np.array_equal(positions, np.concatenate(expected))
+
+def brute_force_feasible_mask(container: Container, polycube: Polycube) -> np.ndarray:
+    '''
+    Check every cell of the container for the polycube separately (without the coarse occupancy index).
+    '''
+    mask = np.full(container.get_dimensions(), False, dtype=bool)
+    cubes = polycube.get_cubes()
+    for x, y, z in np.ndindex(*(np.array(container.get_dimensions()) - np.array(polycube.shape) + 1)):
+        cells = cubes + (x, y, z)
+        mask[x, y, z] = not np.any(container.matrix[cells[:, 0], cells[:, 1], cells[:, 2]])
+    return mask
+
+@pytest.mark.parametrize('region_cost', [0, None])
+@pytest.mark.parametrize('dimensions', [(20, 20, 20), (21, 20, 23)])
+@pytest.mark.parametrize('seed', range(3))
+def test_pruned_feasible_mask_matches_brute_force(seed: int, dimensions: tuple, region_cost: int, monkeypatch):
+    # without a region cost, every group of occupied blocks is checked as a separate region
+    if region_cost is not None:
+        monkeypatch.setattr('src.environment.container.REGION_COST', region_cost)
+    rng = np.random.default_rng(seed)
+    container = Container(*dimensions)
+
+    # a polycube that straddles the boundaries of the blocks along every axis
+    bar = np.zeros((3, 3, 3), dtype=int)
+    bar[:, 1, 1] = bar[1, :, 1] = bar[1, 1, :] = 1
+    container.add(Polycube(bar), (3, 7, 11))
+
+    # clusters of random polycubes near some corners (so there are separate groups of blocks), and a few loose ones
+    id = 2
+    for corner in rng.permutation(list(np.ndindex(2, 2, 2)))[:3]:
+        low = np.array(corner) * (np.array(dimensions) - 6)
+        for _ in range(6):
+            polycube = random_polycube(rng, int(rng.integers(1, 6)), id)
+            position = low + rng.integers(0, 6 - np.array(polycube.shape) + 1)
+            if container.fits(polycube, tuple(position)):
+                container.add(polycube, tuple(position))
+                id += 1
+    for _ in range(4):
+        polycube = random_polycube(rng, int(rng.integers(1, 6)), id)
+        position = rng.integers(0, np.array(dimensions) - np.array(polycube.shape) + 1)
+        if container.fits(polycube, tuple(position)):
+            container.add(polycube, tuple(position))
+            id += 1
+
+    # the pruned masks equal a check of every cell, for polycubes that are larger than a block
+    for size in [1, 5, 8]:
+        for rotation in random_polycube(rng, size, 100).get_rotations()[:4]:
+            assert np.array_equal(container.compute_feasible_mask(rotation), brute_force_feasible_mask(container, rotation))
+
+def reference_fits(container: Container, polycube: Polycube, position: tuple[int, int, int]) -> bool:
+    '''
+    The original implementation of `Container.fits` (a masked overlap check, then the constraints are checked by
+    adding the polycube to the matrix and subtracting it again).
+    '''
+
+    # check if the polycube fits in the container
+    shape_width, shape_height, shape_depth = polycube.matrix.shape
+    if position[0] + shape_width > container.width:
+        return False
+    if position[1] + shape_height > container.height:
+        return False
+    if position[2] + shape_depth > container.depth:
+        return False
+    region = (slice(position[0], position[0] + shape_width),
+              slice(position[1], position[1] + shape_height),
+              slice(position[2], position[2] + shape_depth))
+
+    # check for overlap
+    mx = np.ma.masked_array(container.matrix[region], mask=(polycube.matrix == 0))
+    if np.any(mx):
+        return False
+
+    # check the constraints with the polycube added to the container
+    container.matrix[region] += polycube.matrix
+    satisfied = all(constraint.is_satisfied(container.matrix) for constraint in container.constraints)
+    container.matrix[region] -= polycube.matrix
+    return satisfied
+
+@pytest.mark.parametrize('constraints', [[], [Gravity()], [LoadBalancing(margin=2.0)]], ids=['none', 'gravity', 'loadbalancing'])
+@pytest.mark.parametrize('seed', range(3))
+def test_feasible_mask_matches_the_reference_fits(seed: int, constraints: list):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 5, 7, constraints=constraints)
+    for id in range(1, 12):
+        polycube = random_polycube(rng, int(rng.integers(1, 6)), id)
+        position = tuple(rng.integers(0, np.array(container.get_dimensions()) - np.array(polycube.shape) + 1))
+        if reference_fits(container, polycube, position):
+            container.add(polycube, position)
+
+    # the feasible positions are exactly the positions where the reference `fits` (r, x, y, z)
+    for rotation in random_polycube(rng, 4, 100).get_rotations():
+        expected = np.full(container.get_dimensions(), False, dtype=bool)
+        for position in np.ndindex(*expected.shape):
+            expected[position] = reference_fits(container, rotation, position)
+        assert np.array_equal(container.get_feasible_mask(rotation), expected)
+        assert all(container.fits(rotation, position) == expected[position] for position in np.ndindex(*expected.shape))
@@ -0,0 +1,61 @@
+from src.environment import Container, ShapeGenerator, PackingEnv
+from src.agents import GreedyAgent, RandomAgent
+from src.heuristics import BLBF
+from src.evaluation.evaluation import evaluate, COLUMNS
+import functools
+import csv
+import os
+
+SEEDS = list(range(8))
+
+def create_env(cache_path: str) -> PackingEnv:
+    return PackingEnv(Container(3, 3, 3), 3, seq_length=6, generator=ShapeGenerator(3, cache_path))
+
+def run(path: str, seeds: list[int], workers: int) -> int:
+    '''
+    Evaluate a random and a greedy agent on the cache next to the results file (see the `generator` fixture).
+    '''
+    cache_path = os.path.dirname(path)
+    agents = {'random': RandomAgent, 'greedy': functools.partial(GreedyAgent, heuristics=[BLBF()])}
+    return evaluate(functools.partial(create_env, cache_path), agents, seeds, path, workers=workers, chunk_size=2)
+
+def read_results(path: str) -> dict[tuple[int, str], list[str]]:
+    '''
+    Read the results file, without the time taken (the only column that depends on the run).
+    '''
+    with open(path, newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == COLUMNS
+    results = {(int(row[0]), row[1]): row[2:-1] for row in rows[1:]}
+    assert len(results) == len(rows) - 1 # every seed is evaluated once by every agent
+    return results
+
+def test_results_do_not_depend_on_the_workers(generator: ShapeGenerator, tmp_path):
+    assert run(str(tmp_path / 'one.csv'), SEEDS, 1) == len(SEEDS)
+    assert run(str(tmp_path / 'two.csv'), SEEDS, 2) == len(SEEDS)
+    results = read_results(str(tmp_path / 'one.csv'))
+    assert len(results) == 2 * len(SEEDS)
+    assert results == read_results(str(tmp_path / 'two.csv'))
+
+def test_interrupted_evaluation_is_resumed(generator: ShapeGenerator, tmp_path):
+    run(str(tmp_path / 'expected.csv'), SEEDS, 1)
+    expected = read_results(str(tmp_path / 'expected.csv'))
+
+    # interrupt the evaluation in the last column of its last row (the row still has all columns)
+    path = str(tmp_path / 'results.csv')
+    run(path, SEEDS[:5], 1)
+    with open(path, newline='') as file:
+        content = file.read()
+    last = content.rstrip('\r\n').rsplit('\r\n', 1)[-1]
+    cut = content.rstrip('\r\n')[:-1]
+    assert len(last.split(',')) == len(COLUMNS) and len(cut.rsplit('\r\n', 1)[-1].split(',')) == len(COLUMNS)
+    with open(path, 'w', newline='') as file:
+        file.write(cut)
+
+    # only the seed of the cut-off row is evaluated again (by all agents), and the results are the same
+    assert run(path, SEEDS, 1) == len(SEEDS) - 4
+    assert read_results(path) == expected
+
+    # an evaluation that was finished is not run again
+    assert run(path, SEEDS, 2) == 0
+    assert read_results(path) == expected
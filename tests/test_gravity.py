@@ -0,0 +1,85 @@
+from src.constraints import Gravity
+import numpy as np
+import pytest
+
+def reference_connected_gravity(matrix: np.ndarray):
+    '''
+    The original implementation of `Gravity.apply_connected_gravity` (every id is a piece that drops as a whole).
+    '''
+    width, height, depth = matrix.shape
+    moved_ids = []
+    for h in range(height):
+        for x in range(width):
+            for y in range(depth):
+                id = matrix[x, h, y]
+                if id != 0 and id not in moved_ids:
+                    piece = (matrix == id) * 1
+                    h1 = h
+                    while h1 > 0 and \
+                        all([(matrix[p[0], p[1] - 1, p[2]] == 0 or piece[p[0], p[1] - 1, p[2]]) for p in np.argwhere(piece)]):
+                        piece = np.roll(piece, -1, axis=1)
+                        h1 -= 1
+                    matrix[matrix == id] = 0
+                    matrix[piece == 1] = id
+                    moved_ids.append(id)
+
+def reference_disconnected_gravity(matrix: np.ndarray):
+    '''
+    The original implementation of `Gravity.apply_disconnected_gravity` (every cube drops on its own).
+    '''
+    width, height, depth = matrix.shape
+    for h in range(1, height):
+        for x in range(width):
+            for y in range(depth):
+                if matrix[x, h, y] != 0:
+                    h1 = h
+                    while h1 > 0 and matrix[x, h1 - 1, y] == 0:
+                        matrix[x, h1 - 1, y] = matrix[x, h1, y]
+                        matrix[x, h1, y] = 0
+                        h1 -= 1
+
+def random_matrix(rng: np.random.Generator, shape: tuple[int, int, int], pieces: int) -> np.ndarray:
+    '''
+    Create a matrix with random non-overlapping boxes (with a random hole) floating in it, one id per box.
+    '''
+    matrix = np.zeros(shape, dtype=np.float64)
+    for id in range(1, pieces + 1):
+        size = rng.integers(1, 3, 3)
+        position = rng.integers(0, np.array(shape) - size + 1)
+        region = tuple(slice(p, p + s) for p, s in zip(position, size))
+        if np.any(matrix[region]):
+            continue
+        box = np.full(size, id, dtype=np.float64)
+        if box.size > 2:
+            box[tuple(rng.integers(0, size))] = 0
+        matrix[region] = box
+    return matrix
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('connected', [True, False])
+def test_apply_matches_reference(seed: int, connected: bool):
+    rng = np.random.default_rng(seed)
+    matrix = random_matrix(rng, tuple(rng.integers(3, 7, 3)), pieces=12)
+    expected = matrix.copy()
+    if connected:
+        reference_connected_gravity(expected)
+    else:
+        reference_disconnected_gravity(expected)
+
+    Gravity(connected=connected).apply(matrix)
+    assert np.array_equal(matrix, expected)
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('connected', [True, False])
+def test_apply_tracked_returns_the_changed_cells(seed: int, connected: bool):
+    rng = np.random.default_rng(seed)
+    matrix = random_matrix(rng, tuple(rng.integers(3, 7, 3)), pieces=12)
+    before = matrix.copy()
+
+    cells, values = Gravity(connected=connected).apply_tracked(matrix)
+
+    # every changed cell is returned once, with its value before gravity was applied
+    changed = np.argwhere(matrix != before)
+    assert len(np.unique(np.ravel_multi_index(cells.T, matrix.shape))) == len(cells)
+    assert set(map(tuple, changed)) <= set(map(tuple, cells))
+    assert np.array_equal(values, before[cells[:, 0], cells[:, 1], cells[:, 2]])
@@ -0,0 +1,52 @@
+from src.environment import Container
+from src.environment.shapes import Polycube
+from src.constraints import Gravity
+from src.heuristics import BLBF, HAPE, HeightMapMinimization
+from test_container import random_polycube
+import numpy as np
+import pytest
+
+HEURISTICS = [BLBF(), HAPE(), HeightMapMinimization(), HeightMapMinimization(axis=0), HeightMapMinimization(axis=2)]
+
+def fill(container: Container, rng: np.random.Generator, count: int):
+    '''
+    Add random polycubes at random (fitting) positions.
+    '''
+    for id in range(1, count + 1):
+        polycube = random_polycube(rng, rng.integers(1, 6), id)
+        positions = np.argwhere(container.get_feasible_mask(polycube))
+        if len(positions) > 0:
+            container.add(polycube, tuple(positions[rng.integers(len(positions))]))
+
+@pytest.mark.parametrize('heuristic', HEURISTICS, ids=lambda h: f'{type(h).__name__}-{getattr(h, "axis", "")}')
+@pytest.mark.parametrize('constraints', [[], [Gravity()]])
+@pytest.mark.parametrize('seed', range(5))
+def test_batched_scores_match_single_scores(heuristic, constraints: list, seed: int):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 5, 7, constraints=constraints)
+    fill(container, rng, 12)
+
+    # score every feasible placement of all rotations of a new polycube
+    polycube = random_polycube(rng, 5, 100)
+    rotations = polycube.get_rotations()
+    positions = np.argwhere(np.array([container.get_feasible_mask(r) for r in rotations]))
+    assert len(positions) > 0
+    expected = [heuristic.get_score(container.get_dummy_container(rotations[r], (x, y, z))) for r, x, y, z in positions]
+    assert np.allclose(heuristic.get_scores(container, rotations, positions), expected, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize('heuristic', HEURISTICS, ids=lambda h: f'{type(h).__name__}-{getattr(h, "axis", "")}')
+@pytest.mark.parametrize('constraints', [[], [Gravity()]])
+def test_stacked_scores_match_scores_per_container(heuristic, constraints: list):
+    rng = np.random.default_rng(0)
+    containers = []
+    for count in range(0, 20, 5):
+        container = Container(6, 5, 7, constraints=list(constraints))
+        fill(container, rng, count)
+        containers.append(container)
+
+    # score every feasible placement of a new polycube in all containers at once
+    rotations = random_polycube(rng, 4, 100).get_rotations()
+    positions = [np.argwhere(np.array([c.get_feasible_mask(r) for r in rotations])) for c in containers]
+    expected = np.concatenate([heuristic.get_scores(c, rotations, p) for c, p in zip(containers, positions)])
+    positions = np.concatenate([np.column_stack((np.full(len(p), c), p)) for c, p in enumerate(positions)])
+    assert np.allclose(heuristic.get_stacked_scores(containers, rotations, positions), expected, rtol=0, atol=1e-12)
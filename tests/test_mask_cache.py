@@ -0,0 +1,99 @@
+from src.environment import Container
+from src.environment.mask_cache import MaskCache
+from src.constraints import Gravity
+from test_container import random_polycube, push_random
+import numpy as np
+import pytest
+
+def test_cache_counts_and_evicts():
+    cache = MaskCache(2)
+    occupancy = np.packbits(np.zeros(8, dtype=bool))
+    masks = [np.full((2, 2, 2), i % 2 == 0) for i in range(3)]
+
+    # a miss, then a hit (of a copy)
+    assert cache.get('a', occupancy) is None
+    cache.put('a', occupancy, masks[0])
+    mask = cache.get('a', occupancy)
+    assert np.array_equal(mask, masks[0])
+    mask[:] = False
+    assert np.array_equal(cache.get('a', occupancy), masks[0])
+    assert cache.get_stats() == {'hits': 2, 'misses': 1, 'collisions': 0, 'size': 1}
+
+    # the least recently used mask is evicted
+    cache.put('b', occupancy, masks[1])
+    cache.get('a', occupancy)
+    cache.put('c', occupancy, masks[2])
+    assert cache.get('b', occupancy) is None
+    assert cache.get('a', occupancy) is not None and cache.get('c', occupancy) is not None
+    assert cache.get_stats()['size'] == 2
+
+    # a key that was cached for another occupancy is a miss
+    other = np.packbits(np.ones(8, dtype=bool))
+    assert cache.get('a', other) is None
+    assert cache.get_stats()['collisions'] == 1
+
+    cache.clear()
+    assert cache.get_stats() == {'hits': 0, 'misses': 0, 'collisions': 0, 'size': 0}
+
+def get_masks(container: Container, rotations: list) -> list[np.ndarray]:
+    return [container.get_feasible_mask(rotation) for rotation in rotations]
+
+def assert_masks_fresh(container: Container, rotations: list):
+    '''
+    Check that the (possibly cached) masks equal the masks that are computed without the cache.
+    '''
+    for rotation, mask in zip(rotations, get_masks(container, rotations)):
+        assert np.array_equal(mask, container.compute_feasible_mask(rotation))
+
+def test_masks_are_cached_per_occupancy():
+    rng = np.random.default_rng(0)
+    container = Container(6, 5, 7, cache_size=256)
+    rotations = random_polycube(rng, 4, 100).get_rotations()
+    stats = container.mask_cache.get_stats
+
+    # the masks of a state are computed once
+    empty = get_masks(container, rotations)
+    assert stats()['misses'] == len(rotations) and stats()['hits'] == 0
+    assert_masks_fresh(container, rotations)
+    assert stats()['misses'] == len(rotations) and stats()['hits'] == len(rotations)
+
+    # a placement changes the occupancy, so the masks are computed again
+    assert container.push(random_polycube(rng, 3, 1), (0, 0, 0))
+    assert_masks_fresh(container, rotations)
+    assert stats()['misses'] == 2 * len(rotations)
+
+    # undoing the placement and resetting the container return to the cached masks of the empty container
+    container.pop()
+    assert all(np.array_equal(m, e) for m, e in zip(get_masks(container, rotations), empty))
+    container.add(random_polycube(rng, 3, 1), (1, 1, 1))
+    container.reset()
+    assert all(np.array_equal(m, e) for m, e in zip(get_masks(container, rotations), empty))
+    assert stats()['misses'] == 2 * len(rotations) and stats()['hits'] == 3 * len(rotations)
+    assert stats()['collisions'] == 0
+
+@pytest.mark.parametrize('collide', [False, True])
+@pytest.mark.parametrize('constraints', [[], [Gravity()]])
+@pytest.mark.parametrize('seed', range(3))
+def test_cached_masks_match_fresh_masks(seed: int, constraints: list, collide: bool):
+    rng = np.random.default_rng(seed)
+    container = Container(6, 5, 7, constraints=constraints, cache_size=64)
+    rotations = random_polycube(rng, 4, 100).get_rotations()
+
+    # with all keys zero, every occupancy has the same hash (a collision)
+    if collide:
+        container.zobrist_keys = np.zeros_like(container.zobrist_keys)
+
+    # push and pop random placements (returning to earlier states) and check the masks in every state
+    id = 1
+    for _ in range(60):
+        if len(container.undo_log) > 0 and rng.random() < 0.4:
+            container.pop()
+        elif push_random(container, rng, id):
+            id += 1
+        assert_masks_fresh(container, rotations)
+
+    # the earlier states were found in the cache, or (with collisions) the masks of another occupancy were not used
+    if collide:
+        assert container.mask_cache.collisions > 0
+    else:
+        assert container.mask_cache.hits > 0 and container.mask_cache.collisions == 0
@@ -0,0 +1,115 @@
+from src.environment import Container, ShapeGenerator, PackingEnv
+from src.constraints import Gravity, LoadBalancing
+from src.heuristics import BLBF
+from stable_baselines3.common.vec_env import DummyVecEnv
+import numpy as np
+import pytest
+
+def test_observations_are_not_overwritten(generator: ShapeGenerator):
+    env = PackingEnv(Container(3, 3, 3), 3, seq_length=4, generator=generator, height_map=True)
+    obs, _ = env.reset(seed=0)
+    expected = {key: value.copy() for key, value in obs.items()}
+
+    # the next step does not change the previous observation
+    env.step(int(np.argmax(env.action_masks())))
+    for key, value in expected.items():
+        assert np.array_equal(obs[key], value), key
+
+def test_terminal_observation_survives_auto_reset(generator: ShapeGenerator):
+    vec_env = DummyVecEnv([lambda: PackingEnv(Container(3, 3, 3), 3, seq_length=4, generator=generator, seed=0)])
+    vec_env.reset()
+
+    # step until the episode ends (the vectorized environment resets it automatically)
+    for _ in range(10):
+        actions = [int(np.argmax(mask)) for mask in vec_env.env_method('action_masks')]
+        obs, _, dones, infos = vec_env.step(np.array(actions))
+        if dones[0]:
+            break
+    assert dones[0]
+
+    # the terminal observation holds the packed container, the new observation the empty one
+    terminal = infos[0]['terminal_observation']
+    expected = {key: value.copy() for key, value in terminal.items()}
+    assert np.any(terminal['container'])
+    assert not np.any(obs['container'])
+
+    # and it is not changed by the next steps
+    for _ in range(2):
+        actions = [int(np.argmax(mask)) for mask in vec_env.env_method('action_masks')]
+        vec_env.step(np.array(actions))
+    for key, value in expected.items():
+        assert np.array_equal(terminal[key], value), key
+
+@pytest.mark.parametrize('incremental_size', [1, 2, 3])
+@pytest.mark.parametrize('constraints', [[], [Gravity()], [LoadBalancing()], [Gravity(), LoadBalancing()]])
+def test_incremental_positions_match_full_recompute(generator: ShapeGenerator, incremental_size: int, constraints: list):
+    # a small incremental state evicts rotation shapes all the time (the two polycubes have 15 rotation shapes)
+    env = PackingEnv(Container(5, 4, 5, constraints=constraints), 3, seq_length=50, generator=generator, seed=0,
+                     incremental=True, incremental_size=incremental_size)
+    expected_env = PackingEnv(Container(5, 4, 5, constraints=constraints), 3, seq_length=50, generator=generator, seed=0)
+    env.reset()
+    expected_env.reset()
+
+    # take the same random actions in both over several (long) episodes
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        assert np.array_equal(env.feasible_positions, expected_env.feasible_positions)
+        assert np.array_equal(env.container.matrix, expected_env.container.matrix)
+
+        # the state is bounded, and the log only keeps the placements that a rotation shape has not consumed yet
+        assert len(env.feasible_masks) <= incremental_size
+        oldest = min((state[2] for state in env.feasible_masks.values()), default=env.placement_count)
+        assert len(env.placements) == env.placement_count - oldest
+
+        if env.is_terminal():
+            env.reset()
+            expected_env.reset()
+            continue
+        action = rng.choice(np.flatnonzero(env.action_masks()))
+        env.step(action)
+        expected_env.step(action)
+
+def get_fresh_mask(env: PackingEnv) -> np.ndarray:
+    '''
+    Compute the action mask of the current state without any cache.
+    '''
+    mask = np.full(np.prod(env.action_space_nvec), False, dtype=bool)
+    if len(env.arrivals) > 0:
+        rotations = env.get_current_polycube().get_rotations()
+        positions = np.argwhere(np.array([env.container.compute_feasible_mask(r) for r in rotations]))
+        mask[np.ravel_multi_index(positions.T, env.action_space_nvec)] = True
+    return mask
+
+@pytest.mark.parametrize('constraints', [[], [Gravity()]])
+def test_cached_action_masks_match_fresh_masks(generator: ShapeGenerator, constraints: list, monkeypatch):
+    env = PackingEnv(Container(5, 4, 5, constraints=constraints, cache_size=256), 3, seq_length=10, generator=generator)
+
+    # count the masks that are encoded
+    encoded = []
+    encode_actions = env.encode_actions
+    monkeypatch.setattr(env, 'encode_actions', lambda positions: encoded.append(1) or encode_actions(positions))
+
+    # play an episode with random actions, and replay it (so the container finds its masks in the cache)
+    rng = np.random.default_rng(0)
+    actions = []
+    for episode in range(2):
+        env.reset(seed=0)
+        for step in range(100):
+            # the mask is encoded once per state, and equals a mask that is computed without any cache
+            encoded.clear()
+            for _ in range(2):
+                assert np.array_equal(env.action_masks(), get_fresh_mask(env))
+            assert len(encoded) == 1
+            if env.is_terminal():
+                break
+
+            # heuristics change the mask (and it is computed again without them)
+            env.set_heuristics([BLBF()], 3)
+            assert np.count_nonzero(env.action_masks()) == min(3, len(env.feasible_positions))
+            env.set_heuristics(None, None)
+            assert np.array_equal(env.action_masks(), get_fresh_mask(env))
+
+            if episode == 0:
+                actions.append(rng.choice(np.flatnonzero(env.action_masks())))
+            env.step(actions[step])
+    assert env.container.mask_cache.hits > 0
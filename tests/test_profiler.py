@@ -0,0 +1,67 @@
+from src.environment import Container, ShapeGenerator, PackingEnv
+from src.environment.profiler import Profiler, NULL_SECTION, DISABLED
+import numpy as np
+import json
+import time
+
+def test_disabled_profiler_records_nothing(generator: ShapeGenerator, monkeypatch):
+    # a disabled profiler returns the shared no-op context (and never creates a timed section)
+    created = []
+    monkeypatch.setattr('src.environment.profiler.Section', lambda *args: created.append(args))
+    profiler = Profiler(enabled=False)
+    assert profiler.section('phase') is NULL_SECTION
+    with profiler.section('phase'):
+        pass
+    assert profiler.calls == profiler.times == profiler.last == {}
+
+    # the environment and its container are not profiled by default
+    env = PackingEnv(Container(3, 3, 3), 3, seq_length=4, generator=generator)
+    _, info = env.reset(seed=0)
+    _, _, _, _, info = env.step(int(np.argmax(env.action_masks())))
+    assert 'timing' not in info
+    assert not env.profiler.enabled and env.profiler.calls == {}
+    assert DISABLED.calls == DISABLED.times == DISABLED.last == {}
+    assert created == []
+
+def test_sections_are_timed(monkeypatch):
+    # a clock that advances by 1 ms on every read
+    now = iter(np.arange(1, 1000) * 1e-3)
+    monkeypatch.setattr(time, 'perf_counter', lambda: float(next(now)))
+    profiler = Profiler()
+
+    # the sections are nested, the times are inclusive
+    for _ in range(2):
+        with profiler.section('outer'):
+            with profiler.section('inner'):
+                pass
+    stats = profiler.get_stats()
+    assert stats['outer']['calls'] == stats['inner']['calls'] == 2
+    assert np.isclose(stats['inner']['total_ms'], 2) and np.isclose(stats['outer']['total_ms'], 6)
+    assert np.isclose(stats['outer']['mean_ms'], 3)
+    assert json.loads(profiler.dump()) == json.loads(json.dumps(stats))
+
+    # the last operation only holds the phases since it was cleared
+    profiler.clear_last()
+    with profiler.section('inner'):
+        pass
+    assert profiler.get_last().keys() == {'inner'}
+    profiler.reset()
+    assert profiler.get_stats() == {}
+
+def test_environment_records_the_reset_and_step_phases(generator: ShapeGenerator):
+    env = PackingEnv(Container(3, 3, 3), 3, seq_length=4, generator=generator, profile=True)
+    assert env.container.profiler is env.profiler
+
+    # the phases of the reset
+    _, info = env.reset(seed=0)
+    assert {'reset', 'create_sequence', 'find_feasible_positions', 'get_obs'} <= info['timing'].keys()
+    assert 'step' not in info['timing']
+
+    # the phases of every step (including the placement in the container), and only those of the last step
+    for steps in range(1, 3):
+        _, _, _, _, info = env.step(int(np.argmax(env.action_masks())))
+        assert {'step', 'container.add', 'container.fits', 'find_feasible_positions', 'get_obs'} <= info['timing'].keys()
+        assert 'reset' not in info['timing']
+        assert info['timing']['step'] >= info['timing']['container.add']
+    stats = env.profiler.get_stats()
+    assert stats['reset']['calls'] == 1 and stats['step']['calls'] == 2
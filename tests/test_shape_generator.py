@@ -0,0 +1,141 @@
+from src.environment import ShapeGenerator
+from src.environment.shapes import get_unique_rotations
+from src.environment import cache
+import numpy as np
+import pytest
+import os
+
+def save_cache(path, matrices: list[np.ndarray], n: int=3):
+    '''
+    Save a (pickled) cache file with the given polycubes, like the cache files of the original source.
+    '''
+    polycubes = np.empty(len(matrices), dtype=object)
+    polycubes[:] = matrices
+    np.save(path / f'cubes_{n}.npy', polycubes, allow_pickle=True)
+
+def assert_generator_matches(generator: ShapeGenerator, matrices: list[np.ndarray]):
+    '''
+    Check that the generator holds the given polycubes, with their unique rotations.
+    '''
+    assert len(generator) == len(matrices)
+    for i, matrix in enumerate(matrices):
+        assert np.array_equal(generator.get_matrix(i), matrix)
+        expected = get_unique_rotations(matrix)
+        rotations = generator.get_rotations(i)
+        assert len(rotations) == len(expected)
+        for rotation, e in zip(rotations, expected):
+            assert np.array_equal(rotation, e)
+
+MATRICES = [np.ones((1, 1, 3), dtype=bool), np.array([[[1, 1], [1, 0]]], dtype=bool)]
+
+def test_cache_is_converted_once(tmp_path):
+    save_cache(tmp_path, MATRICES)
+    with pytest.warns(UserWarning, match='rotation table n=3'):
+        assert_generator_matches(ShapeGenerator(3, str(tmp_path)), MATRICES)
+    for name in ['dims', 'offsets', 'bits']:
+        assert os.path.exists(tmp_path / f'cubes_3.{name}.npy')
+
+    # the converted cache is loaded again (and not converted from the pickled file)
+    os.remove(tmp_path / 'cubes_3.npy')
+    with pytest.warns(UserWarning, match='rotation table n=3'):
+        assert_generator_matches(ShapeGenerator(3, str(tmp_path)), MATRICES)
+
+def test_rotation_table_is_only_built_offline(tmp_path):
+    save_cache(tmp_path, MATRICES)
+
+    # without a table, the rotations are computed per polycube (and no table is written)
+    with pytest.warns(UserWarning, match='rotation table n=3'):
+        generator = ShapeGenerator(3, str(tmp_path))
+    assert generator.rotation_tables == [None]
+    assert_generator_matches(generator, MATRICES)
+    assert not any(file.startswith('rotations_3') for file in os.listdir(tmp_path))
+
+    # the built table is loaded
+    ShapeGenerator.build_rotation_table(str(tmp_path), 3)
+    generator = ShapeGenerator(3, str(tmp_path))
+    assert generator.rotation_tables[0] is not None
+    assert_generator_matches(generator, MATRICES)
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5])
+def test_rotation_table_is_written_in_chunks(tmp_path, monkeypatch, chunk_size):
+    matrices = MATRICES + [np.ones((3, 1, 1), dtype=bool), np.array([[[1, 0], [1, 1]]], dtype=bool), np.ones((1, 3, 1), dtype=bool)]
+    save_cache(tmp_path, matrices)
+    monkeypatch.setattr('src.environment.shape_generator.ROTATION_CHUNK_SIZE', chunk_size)
+    monkeypatch.setattr(cache.Writer.__init__, '__defaults__', (3,)) # copy the files in chunks of 3 bytes
+    table = ShapeGenerator.build_rotation_table(str(tmp_path), 3)
+
+    # the table matches the table packed in memory at once, and no temporary file is left
+    rotations = [get_unique_rotations(matrix) for matrix in matrices]
+    expected = cache.pack([r for rot in rotations for r in rot])
+    expected['index'] = np.concatenate([[0], np.cumsum([len(rot) for rot in rotations])])
+    for name, array in expected.items():
+        assert np.array_equal(table[name], array)
+        assert table[name].dtype == array.dtype
+    assert not any('.tmp' in file for file in os.listdir(tmp_path))
+    assert_generator_matches(ShapeGenerator(3, str(tmp_path)), matrices)
+
+def test_failed_writer_leaves_no_files(tmp_path):
+    with pytest.raises(ZeroDivisionError):
+        with cache.Writer(str(tmp_path / 'rotations_3')) as writer:
+            writer.append({'index': np.zeros(1, dtype=np.int64)})
+            writer.append({'index': np.ones(2, dtype=np.int64)})
+            1 / 0
+    assert os.listdir(tmp_path) == []
+
+    # a successful writer concatenates the chunks
+    with cache.Writer(str(tmp_path / 'rotations_3'), chunk_size=3) as writer:
+        writer.append({'index': np.zeros(1, dtype=np.int64), 'dims': np.zeros((1, 3), dtype=np.uint8)})
+        writer.append({'index': np.arange(1, 5, dtype=np.int64), 'dims': np.ones((2, 3), dtype=np.uint8)})
+    arrays = cache.load(str(tmp_path / 'rotations_3'), ['index', 'dims'])
+    assert np.array_equal(arrays['index'], np.arange(5))
+    assert np.array_equal(arrays['dims'], [[0, 0, 0], [1, 1, 1], [1, 1, 1]])
+    assert sorted(os.listdir(tmp_path)) == ['rotations_3.dims.npy', 'rotations_3.index.npy']
+
+def test_stale_cache_is_converted_again(tmp_path):
+    save_cache(tmp_path, MATRICES)
+    ShapeGenerator.build_rotation_table(str(tmp_path), 3)
+
+    # a newer cache file replaces the converted tables
+    matrices = [np.array([[[1, 1], [1, 0]]], dtype=bool), np.ones((3, 1, 1), dtype=bool), np.ones((1, 3, 1), dtype=bool)]
+    save_cache(tmp_path, matrices)
+    modified = os.path.getmtime(tmp_path / 'cubes_3.dims.npy') + 10
+    os.utime(tmp_path / 'cubes_3.npy', (modified, modified))
+    with pytest.warns(UserWarning, match='rotation table n=3'):
+        generator = ShapeGenerator(3, str(tmp_path))
+    assert generator.rotation_tables == [None] # the stale rotation table is not used
+    assert_generator_matches(generator, matrices)
+
+def test_read_only_cache_computes_rotations_per_polycube(tmp_path, monkeypatch):
+    save_cache(tmp_path, MATRICES)
+    monkeypatch.setattr(os, 'access', lambda path, mode: False)
+    with pytest.warns(UserWarning, match='rotation table n=3'):
+        generator = ShapeGenerator(3, str(tmp_path))
+
+    # nothing is written, and the rotations are only computed for the polycubes that are drawn
+    assert os.listdir(tmp_path) == ['cubes_3.npy']
+    assert generator.rotation_tables == [None]
+    assert len(generator.rotation_cache) == 0
+    assert_generator_matches(generator, MATRICES)
+    assert len(generator.get_random_polycube(1).get_rotations()) == len(get_unique_rotations(MATRICES[1]))
+
+def test_cache_files_are_written_to_unique_temporary_files(tmp_path, monkeypatch):
+    # record the temporary files that are renamed to the cache files
+    renamed = []
+    replace = os.replace
+    monkeypatch.setattr(os, 'replace', lambda source, target: renamed.append((source, target)) or replace(source, target))
+
+    arrays = cache.pack([np.ones((1, 1, 3), dtype=bool)])
+    cache.save(str(tmp_path / 'cubes_3'), arrays)
+    cache.save(str(tmp_path / 'cubes_3'), arrays)
+
+    # every save uses its own temporary file in the directory of the cache, and no temporary file is left
+    sources = [source for source, _ in renamed]
+    assert len(set(sources)) == len(sources) == 2 * len(arrays)
+    assert all(os.path.dirname(source) == str(tmp_path) for source in sources)
+    assert sorted(os.listdir(tmp_path)) == sorted(f'cubes_3.{name}.npy' for name in arrays)
+
+    # a failed write removes its temporary file
+    monkeypatch.setattr(np, 'save', lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        cache.save(str(tmp_path / 'cubes_4'), arrays)
+    assert sorted(os.listdir(tmp_path)) == sorted(f'cubes_3.{name}.npy' for name in arrays)
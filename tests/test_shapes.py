@@ -0,0 +1,60 @@
+from src.environment.shapes import Polycube, ROTATION_MATRICES, rotations24, rotate_cubes, get_unique_rotations
+import numpy as np
+import pytest
+
+def reference_unique_rotations(matrix: np.ndarray) -> list[np.ndarray]:
+    '''
+    The original implementation of the unique rotations (the first occurrence in the order of `rotations24`).
+    '''
+    unique = []
+    for rotation in rotations24(matrix):
+        if not any(np.array_equal(rotation, u) for u in unique):
+            unique.append(rotation)
+    return unique
+
+def random_matrix(rng: np.random.Generator, id: int) -> np.ndarray:
+    '''
+    Create a random matrix with some occupied cells (at least one in every layer along each axis).
+    '''
+    while True:
+        matrix = (rng.random(rng.integers(1, 5, 3)) < 0.5) * id
+        if all(np.all(np.any(matrix, axis=tuple(a for a in range(3) if a != axis))) for axis in range(3)):
+            return matrix
+
+def test_rotation_matrices_are_distinct_rotations():
+    assert ROTATION_MATRICES.shape == (24, 3, 3)
+    assert np.all(np.rint(np.linalg.det(ROTATION_MATRICES)) == 1)
+    assert len({m.tobytes() for m in ROTATION_MATRICES}) == 24
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rotate_cubes_matches_rotations24(seed: int):
+    matrix = random_matrix(np.random.default_rng(seed), 1)
+    rotated, shapes, _ = rotate_cubes(np.argwhere(matrix), matrix.shape)
+    for k, rotation in enumerate(rotations24(matrix)):
+        assert tuple(shapes[k]) == rotation.shape
+        assert np.array_equal(rotated[k], np.argwhere(rotation))
+
+@pytest.mark.parametrize('seed', range(20))
+def test_unique_rotations_match_reference_order(seed: int):
+    matrix = random_matrix(np.random.default_rng(seed), seed + 1)
+    expected = reference_unique_rotations(matrix)
+
+    # the matrices of the unique rotations
+    rotations = get_unique_rotations(matrix)
+    assert len(rotations) == len(expected)
+    for rotation, reference in zip(rotations, expected):
+        assert rotation.shape == reference.shape
+        assert np.array_equal(rotation, reference)
+
+    # the rotations of a polycube (computed from its cubes)
+    polycube = Polycube(matrix)
+    rotations = polycube.get_rotations()
+    assert len(rotations) == len(expected)
+    for rotation, reference in zip(rotations, expected):
+        assert rotation.shape == reference.shape
+        assert rotation.id == polycube.id
+        assert np.array_equal(rotation.get_cubes(), np.argwhere(reference))
+
+def test_symmetric_polycube_has_one_rotation():
+    assert len(Polycube(np.ones((2, 2, 2), dtype=int)).get_rotations()) == 1
+    assert len(Polycube(np.ones((1, 1, 3), dtype=int)).get_rotations()) == 3
@@ -0,0 +1,36 @@
+from src.environment import Container, ShapeGenerator, PackingEnv
+from src.environment.vec_packing_environment import VecPackingEnv
+from src.constraints import Gravity, LoadBalancing
+from stable_baselines3.common.vec_env import DummyVecEnv
+import numpy as np
+import pytest
+
+@pytest.mark.parametrize('constraints', [[], [Gravity()], [Gravity(), LoadBalancing()]])
+@pytest.mark.parametrize('incremental', [False, True])
+def test_matches_dummy_vec_env(generator: ShapeGenerator, monkeypatch, constraints: list, incremental: bool):
+    # the batch loads its own generator, which is the one of the fixture
+    monkeypatch.setattr('src.environment.vec_packing_environment.ShapeGenerator', lambda *args: generator)
+    n = 4
+    vec_env = VecPackingEnv(Container(4, 3, 4, constraints=constraints), n, 3, seq_length=6, seed=0,
+                            incremental=incremental, height_map=True)
+    dummy_env = DummyVecEnv([lambda: PackingEnv(Container(4, 3, 4, constraints=constraints), 3, seq_length=6,
+                                                generator=generator, incremental=incremental, height_map=True)] * n)
+    dummy_env.seed(0) # environment `i` uses seed `i` for the first reset, like the batch
+    obs, expected_obs = vec_env.reset(), dummy_env.reset()
+
+    # take the same random (feasible) actions in both, over several episodes
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        for key in expected_obs:
+            assert np.array_equal(obs[key], expected_obs[key]), key
+        masks = vec_env.action_masks()
+        assert np.array_equal(masks, np.array(dummy_env.env_method('action_masks')))
+        actions = np.array([rng.choice(np.flatnonzero(mask)) for mask in masks])
+        obs, rewards, dones, infos = vec_env.step(actions)
+        expected_obs, expected_rewards, expected_dones, expected_infos = dummy_env.step(actions)
+        assert np.array_equal(rewards, expected_rewards)
+        assert np.array_equal(dones, expected_dones)
+        for info, expected_info in zip(infos, expected_infos):
+            if 'terminal_observation' in expected_info:
+                for key, value in expected_info['terminal_observation'].items():
+                    assert np.array_equal(info['terminal_observation'][key], value), key